@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 import os
 from dataclasses import dataclass
 from pathlib import Path
@@ -10,6 +11,11 @@ from dotenv import load_dotenv
 # Загружаем переменные окружения из .env 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+# Грубый перевод старого CHUNK_SIZE_CHARS в токены (русский текст — около 4 символов на токен)
+_CHARS_PER_TOKEN = 4
+
 
 @dataclass(frozen=True)
 class AppConfig:
@@ -22,12 +28,114 @@ class AppConfig:
     openrouter_api_key: str
     openrouter_model: str
     openrouter_base_url: str
+    # Пул моделей для роутера ("model@контекст*вес"); пусто — только openrouter_model
+    openrouter_model_pool: tuple[str, ...]
+    llm_router_small_tokens: int
+    llm_router_cooldown_sec: float
 
     # Параметры саммари / чанкинга
-    chunk_size_chars: int
-    chunk_overlap_chars: int
+    chunk_size_tokens: int
+    chunk_overlap_sentences: int
+    tokenizer: str
+    token_count_scale: float
     max_files: int | None
 
+    # Обход папки: glob-шаблоны include/exclude, глубина (None — без ограничения),
+    # потоки сканирования (0 — последовательно), детерминированный порядок
+    docs_include: tuple[str, ...]
+    docs_exclude: tuple[str, ...]
+    docs_max_depth: int | None
+    docs_walk_workers: int
+    docs_sort: bool
+
+    # Режим наблюдения (main.py --watch): период опроса, сколько файл должен не меняться,
+    # пауза перед пересборкой итога по папке, опрос вместо watchdog
+    watch_poll_sec: float
+    watch_settle_sec: float
+    watch_folder_debounce_sec: float
+    watch_polling: bool
+
+    # Режим сервиса (main.py --serve): адрес, число одновременных заданий, длина очереди,
+    # лимит загрузки, сколько хранить готовые задания, корень для заданий-папок
+    service_host: str
+    service_port: int
+    service_workers: int
+    service_queue_size: int
+    service_max_upload_mb: int
+    service_job_ttl_sec: float
+    service_root: Path
+
+    # Многоуровневая свёртка саммари папки
+    folder_reduce_token_budget: int
+    folder_reduce_fan_in: int
+    folder_reduce_max_depth: int
+
+    # Параллельность: сколько запросов к LLM одновременно и сколько процессов на загрузку/OCR
+    llm_concurrency: int
+    loader_workers: int
+
+    # Потоковая обработка больших PDF (0 — выключено)
+    pdf_stream_min_pages: int
+    pdf_pages_per_task: int
+
+    # OCR (Tesseract): язык, DPI и бинаризация перед распознаванием, процессов на страницы скана,
+    # распознавать ли страницы PDF без текстового слоя
+    ocr_lang: str
+    ocr_target_dpi: int
+    ocr_binarize: bool
+    ocr_workers: int
+    pdf_ocr_fallback: bool
+
+    # Клиентский лимит запросов/токенов в минуту (0 — без лимита) и число повторов на 429
+    llm_rpm: int
+    llm_tpm: int
+    llm_rate_limit_retries: int
+    # Потоковые ответы (SSE) по умолчанию
+    llm_stream: bool
+    # Трасса вызовов LLM (output/llm_trace.jsonl) и её предел в МБ: больше — файл уходит
+    # в llm_trace.jsonl.1 и начинается заново (0 — без предела)
+    llm_trace: bool
+    llm_trace_max_mb: int
+    # Хеджирование: дубль запроса после перцентиля задержек, дублей не больше доли budget
+    llm_hedge: bool
+    llm_hedge_percentile: float
+    llm_hedge_budget: float
+    llm_hedge_min_samples: int
+    llm_hedge_min_delay_sec: float
+    # Кассета ответов LLM: запись (record) или воспроизведение без сети (replay)
+    llm_cassette: Path | None
+    llm_cassette_mode: str
+    llm_cassette_strict: bool
+
+    # Кэш ответов LLM (None — кэш выключен)
+    llm_cache_dir: Path | None
+    llm_cache_max_mb: int
+    llm_cache_ttl_days: float
+
+    # Кэш извлечённого текста (None — кэш выключен)
+    extract_cache_dir: Path | None
+    extract_cache_max_mb: int
+
+    # Порог сходства (Жаккар по MinHash) для почти-дубликатов; 0 — не искать
+    near_dup_threshold: float
+
+    # Типовой текст: строки, которые есть в стольких документах папки, вырезаются
+    # перед отправкой в LLM (0 — выключено)
+    boilerplate_min_docs: int
+    boilerplate_min_chars: int
+
+    # Пакетная сводка коротких документов: бюджет токенов текста на запрос (0 — выключено),
+    # порог «короткого» документа, максимум документов и ожидание добора пакета
+    batch_token_budget: int
+    batch_doc_max_tokens: int
+    batch_max_docs: int
+    batch_linger_ms: int
+
+    # Автопродолжение оборванных ответов: multiturn | prefill, раунды, бюджет токенов (0 — без лимита)
+    continuation_mode: str
+    continuation_max_rounds: int
+    continuation_token_budget: int
+
     # Прочее
     request_timeout_sec: int
     debug: bool
@@ -61,12 +169,141 @@ def load_config() -> AppConfig:
     model = os.getenv("OPENROUTER_MODEL", "google/gemma-2-9b-it:free").strip()
     base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").strip()
 
-    chunk_size_chars = int(os.getenv("CHUNK_SIZE_CHARS", "12000"))
-    chunk_overlap_chars = int(os.getenv("CHUNK_OVERLAP_CHARS", "800"))
+    model_pool = tuple(m.strip() for m in os.getenv("OPENROUTER_MODEL_POOL", "").split(",") if m.strip())
+    if model_pool:
+        # Разбор тот же, что у роутера (импорт здесь: router.py сам импортирует config);
+        # ошибка в записи пула видна сразу, а не на первом запросе
+        from src.llm.router import parse_model_spec
+
+        specs = [parse_model_spec(m) for m in model_pool]
+        # Основная модель (ключ кэша, отпечаток манифеста, модель при кассете) — первая в пуле
+        model = specs[0].name
+    router_small_tokens = int(os.getenv("LLM_ROUTER_SMALL_TOKENS", "6000"))
+    router_cooldown_sec = float(os.getenv("LLM_ROUTER_COOLDOWN_SEC", "30"))
+
+    chunk_size_tokens = int(os.getenv("CHUNK_SIZE_TOKENS", "4000"))
+    chunk_overlap_sentences = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "2"))
+    # Старые настройки в символах: размер переводим в токены (если токены не заданы), перекрытие — нет
+    legacy_size = os.getenv("CHUNK_SIZE_CHARS", "").strip()
+    if legacy_size:
+        if os.getenv("CHUNK_SIZE_TOKENS", "").strip():
+            log.warning("CHUNK_SIZE_CHARS устарел и игнорируется: задан CHUNK_SIZE_TOKENS")
+        else:
+            chunk_size_tokens = max(1, int(legacy_size) // _CHARS_PER_TOKEN)
+            log.warning(
+                "CHUNK_SIZE_CHARS устарел: %s символов ≈ CHUNK_SIZE_TOKENS=%d, задайте его вместо",
+                legacy_size,
+                chunk_size_tokens,
+            )
+    if os.getenv("CHUNK_OVERLAP_CHARS", "").strip():
+        log.warning(
+            "CHUNK_OVERLAP_CHARS устарел и игнорируется: перекрытие задаёт CHUNK_OVERLAP_SENTENCES=%d",
+            chunk_overlap_sentences,
+        )
+    tokenizer = os.getenv("TOKENIZER", "auto").strip().lower()
+    token_count_scale = float(os.getenv("TOKEN_COUNT_SCALE", "1.0"))
 
     max_files_raw = os.getenv("MAX_FILES", "").strip()
     max_files = int(max_files_raw) if max_files_raw else None
 
+    docs_include = tuple(p.strip() for p in os.getenv("DOCS_INCLUDE", "").split(",") if p.strip())
+    docs_exclude = tuple(p.strip() for p in os.getenv("DOCS_EXCLUDE", "").split(",") if p.strip())
+    docs_max_depth_raw = os.getenv("DOCS_MAX_DEPTH", "").strip()
+    docs_max_depth = int(docs_max_depth_raw) if docs_max_depth_raw else None
+    docs_walk_workers = max(0, int(os.getenv("DOCS_WALK_WORKERS", "0")))
+    docs_sort = _env_bool("DOCS_SORT", True)
+
+    watch_poll_sec = float(os.getenv("WATCH_POLL_SEC", "2"))
+    watch_settle_sec = float(os.getenv("WATCH_SETTLE_SEC", "3"))
+    watch_folder_debounce_sec = float(os.getenv("WATCH_FOLDER_DEBOUNCE_SEC", "60"))
+    watch_polling = _env_bool("WATCH_POLLING", False)
+
+    service_host = os.getenv("SERVICE_HOST", "127.0.0.1").strip()
+    service_port = int(os.getenv("SERVICE_PORT", "8088"))
+    service_workers = max(1, int(os.getenv("SERVICE_WORKERS", "2")))
+    service_queue_size = max(1, int(os.getenv("SERVICE_QUEUE_SIZE", "16")))
+    service_max_upload_mb = max(1, int(os.getenv("SERVICE_MAX_UPLOAD_MB", "50")))
+    service_job_ttl_sec = float(os.getenv("SERVICE_JOB_TTL_SEC", "3600"))
+    # Задания-папки принимаются только внутри этого корня (по умолчанию DOCS_DIR)
+    service_root_raw = os.getenv("SERVICE_ROOT", "").strip()
+    service_root = Path(service_root_raw) if service_root_raw else docs_dir
+    if not service_root.is_absolute():
+        service_root = project_root / service_root
+    service_root = service_root.resolve()
+
+    folder_reduce_token_budget = int(os.getenv("FOLDER_REDUCE_TOKEN_BUDGET", "12000"))
+    folder_reduce_fan_in = int(os.getenv("FOLDER_REDUCE_FAN_IN", "10"))
+    folder_reduce_max_depth = int(os.getenv("FOLDER_REDUCE_MAX_DEPTH", "3"))
+
+    llm_concurrency = max(1, int(os.getenv("LLM_CONCURRENCY", "4")))
+    loader_workers = max(0, int(os.getenv("LOADER_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+    pdf_stream_min_pages = int(os.getenv("PDF_STREAM_MIN_PAGES", "40"))
+    pdf_pages_per_task = max(1, int(os.getenv("PDF_PAGES_PER_TASK", "8")))
+
+    ocr_lang = os.getenv("OCR_LANG", "rus+eng").strip() or "rus+eng"
+    ocr_target_dpi = int(os.getenv("OCR_TARGET_DPI", "300"))
+    ocr_binarize = _env_bool("OCR_BINARIZE", True)
+    ocr_workers = max(1, int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1))))
+    pdf_ocr_fallback = _env_bool("PDF_OCR_FALLBACK", True)
+
+    # У бесплатных моделей OpenRouter лимит ~20 запросов в минуту
+    default_rpm = "20" if model.endswith(":free") else "0"
+    llm_rpm = int(os.getenv("LLM_RPM", default_rpm))
+    llm_tpm = int(os.getenv("LLM_TPM", "0"))
+    llm_rate_limit_retries = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "6"))
+    llm_stream = _env_bool("LLM_STREAM", False)
+    llm_trace = _env_bool("LLM_TRACE", True)
+    llm_trace_max_mb = max(0, int(os.getenv("LLM_TRACE_MAX_MB", "100")))
+
+    llm_hedge = _env_bool("LLM_HEDGE", False)
+    llm_hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    llm_hedge_budget = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+    llm_hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    llm_hedge_min_delay_sec = float(os.getenv("LLM_HEDGE_MIN_DELAY_SEC", "1.0"))
+
+    llm_cassette: Path | None = None
+    cassette_raw = os.getenv("LLM_CASSETTE", "").strip()
+    if cassette_raw:
+        llm_cassette = Path(cassette_raw)
+        if not llm_cassette.is_absolute():
+            llm_cassette = (project_root / llm_cassette).resolve()
+    llm_cassette_mode = os.getenv("LLM_CASSETTE_MODE", "replay").strip().lower()
+    if llm_cassette_mode not in {"record", "replay"}:
+        raise RuntimeError("LLM_CASSETTE_MODE должен быть record или replay.")
+    llm_cassette_strict = _env_bool("LLM_CASSETTE_STRICT", True)
+
+    llm_cache_dir: Path | None = None
+    if _env_bool("LLM_CACHE", True):
+        llm_cache_dir = Path(os.getenv("LLM_CACHE_DIR", ".cache/llm"))
+        if not llm_cache_dir.is_absolute():
+            llm_cache_dir = (project_root / llm_cache_dir).resolve()
+    llm_cache_max_mb = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+    llm_cache_ttl_days = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+
+    extract_cache_dir: Path | None = None
+    if _env_bool("EXTRACT_CACHE", True):
+        extract_cache_dir = Path(os.getenv("EXTRACT_CACHE_DIR", ".cache/extract"))
+        if not extract_cache_dir.is_absolute():
+            extract_cache_dir = (project_root / extract_cache_dir).resolve()
+    extract_cache_max_mb = int(os.getenv("EXTRACT_CACHE_MAX_MB", "2048"))
+
+    near_dup_threshold = float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+
+    boilerplate_min_docs = max(0, int(os.getenv("BOILERPLATE_MIN_DOCS", "0")))
+    boilerplate_min_chars = int(os.getenv("BOILERPLATE_MIN_CHARS", "40"))
+
+    batch_token_budget = max(0, int(os.getenv("BATCH_TOKEN_BUDGET", "0")))
+    batch_doc_max_tokens = int(os.getenv("BATCH_DOC_MAX_TOKENS", "800"))
+    batch_max_docs = int(os.getenv("BATCH_MAX_DOCS", "8"))
+    batch_linger_ms = max(0, int(os.getenv("BATCH_LINGER_MS", "300")))
+
+    continuation_mode = os.getenv("CONTINUATION_MODE", "multiturn").strip().lower()
+    if continuation_mode not in {"multiturn", "prefill"}:
+        raise RuntimeError("CONTINUATION_MODE должен быть multiturn или prefill.")
+    continuation_max_rounds = max(0, int(os.getenv("CONTINUATION_MAX_ROUNDS", "2")))
+    continuation_token_budget = max(0, int(os.getenv("CONTINUATION_TOKEN_BUDGET", "20000")))
+
     timeout_sec = int(os.getenv("REQUEST_TIMEOUT_SEC", "60"))
     debug = _env_bool("DEBUG", False)
 
@@ -77,9 +314,71 @@ def load_config() -> AppConfig:
         openrouter_api_key=api_key,
         openrouter_model=model,
         openrouter_base_url=base_url,
-        chunk_size_chars=chunk_size_chars,
-        chunk_overlap_chars=chunk_overlap_chars,
+        openrouter_model_pool=model_pool,
+        llm_router_small_tokens=router_small_tokens,
+        llm_router_cooldown_sec=router_cooldown_sec,
+        chunk_size_tokens=chunk_size_tokens,
+        chunk_overlap_sentences=chunk_overlap_sentences,
+        tokenizer=tokenizer,
+        token_count_scale=token_count_scale,
         max_files=max_files,
+        docs_include=docs_include,
+        docs_exclude=docs_exclude,
+        docs_max_depth=docs_max_depth,
+        docs_walk_workers=docs_walk_workers,
+        docs_sort=docs_sort,
+        watch_poll_sec=watch_poll_sec,
+        watch_settle_sec=watch_settle_sec,
+        watch_folder_debounce_sec=watch_folder_debounce_sec,
+        watch_polling=watch_polling,
+        service_host=service_host,
+        service_port=service_port,
+        service_workers=service_workers,
+        service_queue_size=service_queue_size,
+        service_max_upload_mb=service_max_upload_mb,
+        service_job_ttl_sec=service_job_ttl_sec,
+        service_root=service_root,
+        folder_reduce_token_budget=folder_reduce_token_budget,
+        folder_reduce_fan_in=folder_reduce_fan_in,
+        folder_reduce_max_depth=folder_reduce_max_depth,
+        llm_concurrency=llm_concurrency,
+        loader_workers=loader_workers,
+        pdf_stream_min_pages=pdf_stream_min_pages,
+        pdf_pages_per_task=pdf_pages_per_task,
+        ocr_lang=ocr_lang,
+        ocr_target_dpi=ocr_target_dpi,
+        ocr_binarize=ocr_binarize,
+        ocr_workers=ocr_workers,
+        pdf_ocr_fallback=pdf_ocr_fallback,
+        llm_rpm=llm_rpm,
+        llm_tpm=llm_tpm,
+        llm_rate_limit_retries=llm_rate_limit_retries,
+        llm_stream=llm_stream,
+        llm_trace=llm_trace,
+        llm_trace_max_mb=llm_trace_max_mb,
+        llm_hedge=llm_hedge,
+        llm_hedge_percentile=llm_hedge_percentile,
+        llm_hedge_budget=llm_hedge_budget,
+        llm_hedge_min_samples=llm_hedge_min_samples,
+        llm_hedge_min_delay_sec=llm_hedge_min_delay_sec,
+        llm_cassette=llm_cassette,
+        llm_cassette_mode=llm_cassette_mode,
+        llm_cassette_strict=llm_cassette_strict,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_mb=llm_cache_max_mb,
+        llm_cache_ttl_days=llm_cache_ttl_days,
+        extract_cache_dir=extract_cache_dir,
+        extract_cache_max_mb=extract_cache_max_mb,
+        near_dup_threshold=near_dup_threshold,
+        boilerplate_min_docs=boilerplate_min_docs,
+        boilerplate_min_chars=boilerplate_min_chars,
+        batch_token_budget=batch_token_budget,
+        batch_doc_max_tokens=batch_doc_max_tokens,
+        batch_max_docs=batch_max_docs,
+        batch_linger_ms=batch_linger_ms,
+        continuation_mode=continuation_mode,
+        continuation_max_rounds=continuation_max_rounds,
+        continuation_token_budget=continuation_token_budget,
         request_timeout_sec=timeout_sec,
         debug=debug,
     )
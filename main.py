@@ -1,86 +1,270 @@
 from __future__ import annotations
 
+import argparse
 import json
-from pathlib import Path
+from dataclasses import asdict
+from itertools import islice
+from typing import Iterable
 
 from config import load_config
 from src.llm.openrouter_client import OpenRouterClient
-from src.loaders import load_document
-from src.summarize.summarize_doc import summarize_document_text
+from src.loaders import LOADER_VERSION
+from src.loaders.cache import make_extraction_cache
+from src.llm.tokens import get_token_counter
+from src.pipeline import run_pipeline
+from src.summarize.batch import make_doc_batcher
+from src.summarize.boilerplate import BoilerplateIndex
+from src.service import serve
 from src.summarize.summarize_folder import summarize_folder
-from src.utils.files import iter_files
+from src.utils.files import FileItem, walk_files
 from src.utils.logging import setup_logging
+from src.utils.journal import JournalRecord, ResultJournal
+from src.utils.manifest import FileCheck, Manifest, run_fingerprint
+from src.watch import WatchSession
 
 
 def main() -> None:
+    ap = argparse.ArgumentParser(description="Саммари документов папки через OpenRouter")
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить прерванный запуск: файлы из output/journal.jsonl не обрабатывать заново",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="не завершаться: следить за DOCS_DIR и суммаризировать новые и изменённые файлы",
+    )
+    ap.add_argument(
+        "--serve",
+        action="store_true",
+        help="HTTP-сервис: саммари загруженных документов и папок по запросу (SERVICE_*)",
+    )
+    args = ap.parse_args()
+
     cfg = load_config()
     setup_logging(cfg.debug)
 
     print("DOCS:", cfg.docs_dir)
     print("MODEL:", cfg.openrouter_model)
+    print(f"LLM_CONCURRENCY: {cfg.llm_concurrency} | LOADER_WORKERS: {cfg.loader_workers}")
 
     cfg.output_dir.mkdir(parents=True, exist_ok=True)
 
     llm = OpenRouterClient(cfg)
+    extraction_cache = make_extraction_cache(cfg, LOADER_VERSION)
+
+    boilerplate = None
+    if cfg.boilerplate_min_docs > 0 and (args.watch or args.serve):
+        # Индексу типового текста нужна вся папка заранее — в режимах наблюдения и сервиса его нет
+        print("BOILERPLATE_MIN_DOCS is ignored in --watch / --serve mode")
+    elif cfg.boilerplate_min_docs > 0:
+        boilerplate = BoilerplateIndex(
+            cfg.boilerplate_min_docs,
+            min_chars=cfg.boilerplate_min_chars,
+            counter=get_token_counter(cfg.tokenizer, cfg.token_count_scale),
+        )
+
+    batcher = make_doc_batcher(cfg, llm)
 
-    items = iter_files(cfg.docs_dir, recursive=True)
+    if args.serve:
+        # Клиент, кэши и пул загрузки живут, пока работает сервис
+        try:
+            serve(cfg, llm, extraction_cache, batcher)
+        finally:
+            llm.telemetry.close()
+            if llm.cassette is not None:
+                llm.cassette.close()
+            if extraction_cache is not None:
+                extraction_cache.close()
+        return
+
+    # Обход ленивый: первые файлы уходят в обработку, пока остальная папка ещё сканируется
+    items: Iterable[FileItem] = walk_files(
+        cfg.docs_dir,
+        include=cfg.docs_include,
+        exclude=cfg.docs_exclude,
+        max_depth=cfg.docs_max_depth,
+        workers=cfg.docs_walk_workers,
+        sort=cfg.docs_sort,
+    )
     if cfg.max_files is not None:
-        items = items[: cfg.max_files]
+        items = islice(items, cfg.max_files)
 
-    print(f"FILES FOUND: {len(items)}")
+    # Манифест: какие файлы уже обработаны и с какими настройками
+    manifest = Manifest.load(cfg.output_dir / "manifest.json")
+    fingerprint = run_fingerprint(cfg)
 
-    summaries_by_file: dict[str, str] = {}
-    meta: list[dict] = []
+    # Журнал: каждый готовый файл сразу пишется на диск; с --resume уже записанные пропускаются
+    journal = ResultJournal.start(cfg.output_dir / "journal.jsonl", fingerprint, resume=args.resume)
+    seen: list[str] = []
+    changed = 0
+    if journal.done:
+        print(f"RESUME: {len(journal.done)} files already in journal, skipped")
+        # Манифест сохраняется только в конце — восстанавливаем его из журнала прерванного запуска
+        for rec in journal.records():
+            path = cfg.docs_dir / rec.key
+            if rec.key in journal.done and not rec.reused and rec.fingerprint == fingerprint and path.exists():
+                check = FileCheck(size=rec.size, mtime_ns=rec.mtime_ns, sha256=rec.sha256, entry=None)
+                manifest.put(rec.key, path, check, fingerprint, rec.summary, rec.meta)
+                changed += 1
+        seen.extend(journal.done)
+    resumed = len(journal.done)
 
-    for i, item in enumerate(items, start=1):
-        loaded = load_document(item.path)
-        text = loaded.text or ""
+    if args.watch:
+        # Долгоживущий режим: тот же клиент, кэши и пулы на все изменения папки
+        try:
+            WatchSession(cfg, llm, manifest, fingerprint, journal, extraction_cache, batcher).run()
+        finally:
+            journal.close()
+            llm.telemetry.close()
+            if llm.cassette is not None:
+                llm.cassette.close()
+            if extraction_cache is not None:
+                extraction_cache.close()
+        return
 
-        print(f"\n[{i}/{len(items)}] {loaded.path.name} | loader={loaded.loader} | text_len={len(text)}")
+    todo = (it for it in items if it.path.relative_to(cfg.docs_dir).as_posix() not in journal.done)
 
-        if not text.strip():
-            summaries_by_file[loaded.path.name] = "Текст не извлечён или файл пустой."
-            meta.append(
-                {
-                    "file": loaded.path.name,
-                    "loader": loaded.loader,
-                    "text_len": len(text),
-                    "status": "empty",
-                }
+    # Загрузка и саммари идут параллельно, результаты приходят в исходном порядке
+    results = run_pipeline(cfg, llm, todo, manifest, fingerprint, extraction_cache, boilerplate, batcher)
+    for i, res in enumerate(results, start=resumed + 1):
+        seen.append(res.key)
+        journal.append(
+            JournalRecord(
+                key=res.key,
+                file=res.path.name,
+                summary=res.summary,
+                meta=res.meta,
+                reused=res.reused,
+                fingerprint=fingerprint,
+                size=res.check.size,
+                mtime_ns=res.check.mtime_ns,
+                sha256=res.check.sha256,
             )
-            continue
+        )
 
-        summary = summarize_document_text(cfg, llm, text)
-        summaries_by_file[loaded.path.name] = summary
+        if res.reused:
+            print(f"[{i}] {res.path.name} | unchanged, summary reused")
+            continue
 
-        meta.append(
-            {
-                "file": loaded.path.name,
-                "loader": loaded.loader,
-                "text_len": len(text),
-                "status": "ok",
-            }
+        status = res.meta["status"]
+        if res.meta.get("duplicate_of"):
+            status = f"duplicate of {res.meta['duplicate_of']} ({res.meta['similarity']:.0%})"
+        print(
+            f"[{i}] {res.path.name} | loader={res.meta['loader']} "
+            f"| text_len={res.meta['text_len']} | {status}"
         )
+        manifest.put(res.key, res.path, res.check, fingerprint, res.summary, res.meta)
+        changed += 1
+    journal.close()
 
-    # Общее саммари по папке
-    folder_summary = summarize_folder(cfg, llm, summaries_by_file)
+    # Удалённые файлы выкидываем из манифеста (только при полном проходе по папке)
+    removed = manifest.prune(seen) if cfg.max_files is None else []
+    if removed:
+        print(f"\nREMOVED FROM MANIFEST: {len(removed)}")
+    manifest.save()
 
-    # Сохранение результатов
+    # Сохранение результатов: собираются из журнала, не из памяти
     by_file_path = cfg.output_dir / "by_file.json"
     folder_path = cfg.output_dir / "folder_summary.md"
     meta_path = cfg.output_dir / "meta.json"
+    files_written, duplicates = journal.write_artifacts(by_file_path, meta_path)
 
-    by_file_path.write_text(
-        json.dumps(summaries_by_file, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
-    folder_path.write_text(folder_summary, encoding="utf-8")
-    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Общее саммари по папке — только если какие-то саммари поменялись
+    if changed or removed or not folder_path.exists():
+        folder_summary = summarize_folder(cfg, llm, journal.summaries(), duplicates)
+        folder_path.write_text(folder_summary, encoding="utf-8")
+    else:
+        print("\nFolder summary is up to date, skipped")
+
+    # Итог запуска: токены, задержки и повторы LLM (по этапам), файлы, кэши
+    run_summary = {
+        **llm.telemetry.summary(),
+        "model": cfg.openrouter_model,
+        "files": {"total": files_written, "processed": changed, "near_duplicates": len(duplicates)},
+    }
+    if llm.cache is not None:
+        run_summary["llm_cache"] = asdict(llm.cache.stats)
+    if extraction_cache is not None:
+        run_summary["extract_cache"] = {
+            **asdict(extraction_cache.stats),
+            "time_saved_sec": round(extraction_cache.time_saved_sec, 3),
+        }
+    if llm.router is not None:
+        run_summary["models"] = llm.router.snapshot()
+    if batcher is not None:
+        run_summary["batch"] = {
+            "requests": batcher.batches,
+            "docs": batcher.batched_docs,
+            "fallback_docs": batcher.fallback_docs,
+        }
+    if llm.cassette is not None:
+        cassette = llm.cassette
+        run_summary["cassette"] = {
+            "mode": cassette.mode,
+            "hits": cassette.hits,
+            "misses": cassette.misses,
+            "recorded": cassette.recorded,
+        }
+    run_summary_path = cfg.output_dir / "run_summary.json"
+    run_summary_path.write_text(json.dumps(run_summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    llm.telemetry.close()
 
     print("\nDONE ✅")
+    print(f"Processed: {changed}, reused: {files_written - changed}, near-duplicates: {len(duplicates)}")
+    print("Saved:", journal.path)
     print("Saved:", by_file_path)
     print("Saved:", folder_path)
     print("Saved:", meta_path)
+    print("Saved:", run_summary_path)
+
+    total = run_summary["total"]
+    print(
+        f"LLM: calls={total['calls']} (cached {total['cached_calls']}, failed {total['failed_calls']}) "
+        f"| tokens in/out={total['prompt_tokens']}/{total['completion_tokens']} "
+        f"| retries={total['retries']} 429={total['throttled']} length={total['length_retries']}"
+        + (f" | hedges={total['hedges']} (won {total['hedge_wins']})" if total["hedges"] else "")
+        + (f" | cost=${total['cost']:.4f}" if total["cost"] else "")
+    )
+
+    if boilerplate is not None:
+        before, after, pct = boilerplate.totals()
+        print(
+            f"BOILERPLATE: {before - after} of {before} tokens removed ({pct:.1f}%) "
+            f"| indexed docs: {boilerplate.docs}"
+        )
+
+    if llm.router is not None:
+        for name, st in llm.router.snapshot().items():
+            latency = f"{st['latency_sec']:.2f}s" if st["latency_sec"] is not None else "-"
+            print(f"MODEL {name}: calls={st['calls']} errors={st['errors']} latency={latency}")
+
+    if batcher is not None:
+        print(
+            f"BATCH: {batcher.batched_docs} docs in {batcher.batches} requests "
+            f"| sent individually: {batcher.fallback_docs}"
+        )
+
+    if llm.cache is not None:
+        st = llm.cache.stats
+        print(f"LLM CACHE: hits={st.hits} misses={st.misses} evictions={st.evictions}")
+
+    if llm.cassette is not None:
+        cassette = llm.cassette
+        print(
+            f"CASSETTE ({cassette.mode}): hits={cassette.hits} misses={cassette.misses} "
+            f"recorded={cassette.recorded} | {cassette.path}"
+        )
+        cassette.close()
+
+    if extraction_cache is not None:
+        st = extraction_cache.stats
+        print(
+            f"EXTRACT CACHE: hits={st.hits} misses={st.misses} evictions={st.evictions} "
+            f"| extraction time saved: {extraction_cache.time_saved_sec:.1f}s"
+        )
+        extraction_cache.close()
 
 
 if __name__ == "__main__":
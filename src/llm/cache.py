@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import AppConfig
+from src.utils.disk_cache import CacheStats, DiskCache
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM на диске.
+
+    Ключ — хэш от (model, system, user, temperature, max_tokens, extra)
+    или, для многоходовых диалогов, от полного списка сообщений вместо system/user;
+    значение — текст ответа и сырой JSON OpenRouter. Одинаковые запросы при повторных
+    прогонах по той же папке не уходят в сеть.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_bytes: Optional[int] = None,
+        max_age_sec: Optional[float] = None,
+    ) -> None:
+        self._store = DiskCache(path, max_bytes=max_bytes, max_age_sec=max_age_sec)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._store.stats
+
+    @staticmethod
+    def make_key(
+        *,
+        model: str,
+        system: str,
+        user: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        extra: Optional[Dict[str, Any]] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
+        data: Dict[str, Any] = {
+            "model": model,
+            "system": system,
+            "user": user,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "extra": extra or {},
+        }
+        # Для обычного запроса (system + user) ключ прежний — старые записи кэша остаются в силе
+        if messages is not None:
+            data["messages"] = messages
+        material = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self._store.get(key)
+        if blob is None:
+            return None
+        try:
+            return json.loads(blob.decode("utf-8"))
+        except ValueError:
+            return None
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._store.set(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def close(self) -> None:
+        self._store.close()
+
+
+def make_response_cache(cfg: AppConfig) -> Optional[ResponseCache]:
+    """Кэш по настройкам из конфига (None, если кэш выключен)."""
+    if cfg.llm_cache_dir is None:
+        return None
+    return ResponseCache(
+        cfg.llm_cache_dir / "responses.sqlite3",
+        max_bytes=cfg.llm_cache_max_mb * 1024 * 1024,
+        max_age_sec=cfg.llm_cache_ttl_days * 86400,
+    )
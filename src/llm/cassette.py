@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+from config import AppConfig
+
+
+# Поля запроса, не влияющие на ответ: поток/не поток — один и тот же ответ
+_IGNORED_FIELDS = {"stream"}
+# В нестрогом режиме сравниваются только сообщения
+_LENIENT_FIELDS = {"messages"}
+
+MISSING_TEXT = "[нет записи в кассете для этого запроса]"
+
+
+class CassetteMissError(RuntimeError):
+    """В режиме replay (strict) запрос не найден в кассете."""
+
+
+def request_fingerprint(payload: Dict[str, Any], *, strict: bool = True) -> str:
+    """
+    Отпечаток запроса: strict — все поля payload (модель, сообщения, temperature,
+    max_tokens, extra), lenient — только сообщения (можно сменить модель/параметры).
+    """
+    if strict:
+        material = {k: v for k, v in payload.items() if k not in _IGNORED_FIELDS}
+    else:
+        material = {k: v for k, v in payload.items() if k in _LENIENT_FIELDS}
+    blob = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Запись/воспроизведение ответов OpenRouter (JSONL, строка на обмен).
+
+    record — каждый успешный ответ сервера (HTTP 200 без "error") дописывается
+             в файл вместе с отпечатками запроса
+    replay — ответ ищется по отпечатку, в сеть запрос не уходит, пауз нет;
+             одинаковые запросы получают записанные ответы по очереди
+             (последний повторяется). strict: промах — CassetteMissError;
+             lenient: сверка только по сообщениям, промах — заглушка MISSING_TEXT.
+    """
+
+    def __init__(self, path: str | Path, mode: str = "replay", *, strict: bool = True) -> None:
+        if mode not in {"record", "replay"}:
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._out: Optional[TextIO] = None
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"Кассета не найдена: {self.path}")
+        field = "key" if self.strict else "lenient_key"
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописанная последняя строка (запись прервали) — пропускаем
+                    continue
+                self._entries.setdefault(entry[field], []).append(entry["response"])
+
+    def record(self, payload: Dict[str, Any], response: Dict[str, Any]) -> None:
+        entry = {
+            "key": request_fingerprint(payload, strict=True),
+            "lenient_key": request_fingerprint(payload, strict=False),
+            "model": payload.get("model"),
+            "max_tokens": payload.get("max_tokens"),
+            "response": response,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._out is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._out = self.path.open("a", encoding="utf-8", buffering=1)
+            self._out.write(line)
+            self.recorded += 1
+
+    def replay(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        key = request_fingerprint(payload, strict=self.strict)
+        with self._lock:
+            responses = self._entries.get(key)
+            if not responses:
+                self.misses += 1
+                if self.strict:
+                    raise CassetteMissError(
+                        f"Запрос не найден в кассете {self.path.name} (model={payload.get('model')}, "
+                        f"max_tokens={payload.get('max_tokens')}); перезапишите её или включите LLM_CASSETTE_STRICT=0"
+                    )
+                return {
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": MISSING_TEXT}, "finish_reason": "stop"}],
+                }
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            self.hits += 1
+            return responses[min(i, len(responses) - 1)]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+def make_cassette(cfg: AppConfig) -> Optional[Cassette]:
+    """Кассета по настройкам из конфига (None — обычная работа с сетью)."""
+    if cfg.llm_cassette is None:
+        return None
+    return Cassette(cfg.llm_cassette, cfg.llm_cassette_mode, strict=cfg.llm_cassette_strict)
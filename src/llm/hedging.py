@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+from config import AppConfig
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек последних вызовов и перцентиль по нему.
+    threshold() — после скольких секунд вызов считается «отстающим» и пора
+    отправлять дубль: перцентиль окна, но не меньше min_delay_sec. Пока замеров
+    меньше min_samples, порога нет (хеджирования нет).
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        *,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay_sec: float = 1.0,
+    ) -> None:
+        self.percentile = min(100.0, max(0.0, percentile))
+        self.min_samples = max(1, min_samples)
+        self.min_delay_sec = min_delay_sec
+        self._samples: Deque[float] = deque(maxlen=max(window, self.min_samples))
+        self._lock = threading.Lock()
+
+    def observe(self, latency_sec: float) -> None:
+        with self._lock:
+            self._samples.append(latency_sec)
+
+    def threshold(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(self.percentile / 100.0 * (len(ordered) - 1))))
+        return max(self.min_delay_sec, ordered[idx])
+
+
+class HedgeBudget:
+    """Дублей — не больше max_ratio от числа вызовов (лишние запросы стоят лимитов)."""
+
+    def __init__(self, max_ratio: float) -> None:
+        self.max_ratio = max(0.0, max_ratio)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def on_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def on_win(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+
+class Hedging:
+    """Настройки и состояние хеджирования одного клиента."""
+
+    def __init__(self, tracker: LatencyTracker, budget: HedgeBudget) -> None:
+        self.tracker = tracker
+        self.budget = budget
+
+
+def make_hedging(cfg: AppConfig) -> Optional[Hedging]:
+    """Хеджирование по настройкам из конфига (None — выключено)."""
+    if not cfg.llm_hedge:
+        return None
+    return Hedging(
+        LatencyTracker(
+            cfg.llm_hedge_percentile,
+            min_samples=cfg.llm_hedge_min_samples,
+            min_delay_sec=cfg.llm_hedge_min_delay_sec,
+        ),
+        HedgeBudget(cfg.llm_hedge_budget),
+    )
@@ -1,23 +1,274 @@
 from __future__ import annotations
 
 import json
+import logging
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from config import AppConfig
+from src.llm.cache import ResponseCache, make_response_cache
+from src.llm.cassette import Cassette, make_cassette
+from src.llm.hedging import Hedging, make_hedging
+from src.llm.rate_limit import RateLimiter, backoff_delay, estimate_messages_tokens, parse_retry_after
+from src.llm.router import ModelRouter, make_model_router
+from src.llm.telemetry import CallRecord, Telemetry, current_scope, make_telemetry, usage_counts
+
+
+log = logging.getLogger(__name__)
 
 
 class OpenRouterError(RuntimeError):
     """Ошибки вызова OpenRouter (сеть, авторизация, лимиты, формат ответа)."""
 
 
+class OpenRouterRateLimitError(OpenRouterError):
+    """429: сервер просит сбавить темп. retry_after — подсказка сервера в секундах (если есть)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 @dataclass
 class LLMResponse:
     text: str
     raw: Dict[str, Any]
+    # Время до первого токена (только для потоковых ответов, stream=True)
+    ttft_sec: Optional[float] = None
+
+
+# on_delta(кусок, весь текст на данный момент). Если запрос повторяется
+# (сеть, 5xx, 429), поток начинается заново — текст снова идёт с пустой строки.
+DeltaCallback = Callable[[str, str], None]
+
+
+# Общая логика запроса/разбора ответа.
+
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "HTTP-Referer": "http://localhost",
+    "X-Title": "folder-summarizer",
+}
+
+
+def build_messages(system: str, user: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def build_chat_payload(
+    model: str,
+    messages: List[Dict[str, str]],
+    *,
+    temperature: float,
+    max_tokens: Optional[int],
+    extra: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+    }
+
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+
+    if extra:
+        payload.update(extra)
+
+    return payload
+
+
+def check_status(status_code: int, headers: Optional[Mapping[str, str]] = None) -> None:
+    """Частые случаи ошибок — сразу нормальными сообщениями."""
+    if status_code in (401, 403):
+        raise OpenRouterError(
+            "Ошибка авторизации (401/403). Проверь OPENROUTER_API_KEY."
+        )
+    if status_code == 429:
+        raise OpenRouterRateLimitError(
+            "Лимит запросов (429). Попробуй позже или уменьшай частоту/объём.",
+            retry_after=parse_retry_after(headers),
+        )
+    if status_code >= 500:
+        raise OpenRouterError(
+            f"Ошибка сервера OpenRouter ({status_code})."
+        )
+
+
+def parse_completion(data: Any, status_code: int) -> Tuple[str, Optional[str], Dict[str, Any]]:
+    """
+    Достаёт из ответа (text, finish_reason, message).
+    Бросает OpenRouterError, если вместо ответа пришла ошибка.
+    """
+    # OpenRouter иногда возвращает { "error": {...} } даже при 200/4xx
+    if isinstance(data, dict) and "error" in data:
+        err = data["error"] or {}
+        msg = err.get("message", "Unknown error")
+        code = err.get("code", status_code)
+        if code == 429:
+            raise OpenRouterRateLimitError(f"OpenRouter error {code}: {msg}")
+        raise OpenRouterError(f"OpenRouter error {code}: {msg}")
+
+    # Основной путь: chat.completion -> choices[0].message.content
+    choice = (data.get("choices") or [{}])[0]
+    msg = (choice.get("message") or {})
+
+    text = (msg.get("content") or "").strip()
+    return text, choice.get("finish_reason"), msg
+
+
+class StreamAssembler:
+    """
+    Собирает ответ в режиме stream=True (server-sent events, chat.completion.chunk)
+    в такой же JSON, как у обычного ответа, — дальше он разбирается parse_completion.
+
+    - content отдаётся в on_delta по мере прихода
+    - reasoning копится отдельно (для случая «content пустой, всё ушло в reasoning»)
+    - ttft_sec — время от отправки запроса до первого токена (content или reasoning)
+    """
+
+    def __init__(self, started: float, on_delta: Optional[DeltaCallback] = None) -> None:
+        self.started = started
+        self.on_delta = on_delta
+        self.ttft_sec: Optional[float] = None
+        self.text = ""
+        self._reasoning: List[str] = []
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.done = False
+        self._meta: Dict[str, Any] = {}
+
+    def feed_line(self, line: str) -> None:
+        line = line.strip()
+        # Пустые строки разделяют события; ": ..." — комментарии keep-alive (OPENROUTER PROCESSING)
+        if not line or line.startswith(":") or not line.startswith("data:"):
+            return
+        body = line[len("data:"):].strip()
+        if body == "[DONE]":
+            self.done = True
+            return
+
+        chunk = json.loads(body)
+        if isinstance(chunk, dict) and "error" in chunk:
+            # Ошибка посреди потока — тем же путём, что у обычного ответа
+            parse_completion(chunk, 200)
+
+        for k in ("id", "model", "created"):
+            if k in chunk:
+                self._meta.setdefault(k, chunk[k])
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            content = delta.get("content") or ""
+            reasoning = delta.get("reasoning") or ""
+
+            if (content or reasoning) and self.ttft_sec is None:
+                self.ttft_sec = time.perf_counter() - self.started
+            if reasoning:
+                self._reasoning.append(reasoning)
+            if content:
+                self.text += content
+                if self.on_delta is not None:
+                    self.on_delta(content, self.text)
+            if choice.get("finish_reason"):
+                self.finish_reason = choice["finish_reason"]
+
+    def feed(self, lines: Iterable[str]) -> Dict[str, Any]:
+        for line in lines:
+            self.feed_line(line)
+            if self.done:
+                break
+        return self.result()
+
+    def result(self) -> Dict[str, Any]:
+        if not self.done and self.finish_reason is None:
+            raise OpenRouterError(f"Поток ответа оборвался (получено {len(self.text)} символов)")
+
+        data: Dict[str, Any] = {
+            **self._meta,
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": self.text,
+                        "reasoning": "".join(self._reasoning) or None,
+                    },
+                    "finish_reason": self.finish_reason,
+                }
+            ],
+        }
+        if self.usage is not None:
+            data["usage"] = self.usage
+        return data
+
+
+def usage_total_tokens(data: Any) -> Optional[int]:
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    total = usage.get("total_tokens")
+    return int(total) if isinstance(total, (int, float)) else None
+
+
+def make_rate_limiter(cfg: AppConfig, max_concurrency: Optional[int] = None) -> RateLimiter:
+    return RateLimiter(
+        rpm=cfg.llm_rpm,
+        tpm=cfg.llm_tpm,
+        max_concurrency=max_concurrency or cfg.llm_concurrency,
+    )
+
+
+def needs_length_retry(text: str, finish_reason: Optional[str], max_tokens: Optional[int]) -> bool:
+    """Модель упёрлась в лимит и не успела вывести content (всё ушло в reasoning)."""
+    return (not text) and (finish_reason == "length") and (max_tokens is not None)
+
+
+def length_retry_max_tokens(max_tokens: int) -> int:
+    return max(256, int(max_tokens * 3))
+
+
+def empty_content_error(data: Any, msg: Dict[str, Any], finish_reason: Optional[str]) -> OpenRouterError:
+    reasoning = (msg.get("reasoning") or "")
+    hint = ""
+    if reasoning:
+        hint = " (есть reasoning, но content пустой — увеличь max_tokens или измени промпт)"
+    return OpenRouterError(
+        f"Пустой content от модели. finish_reason={finish_reason}.{hint} "
+        f"Raw: {str(data)[:700]}"
+    )
+
+
+@dataclass
+class _Sent:
+    """Ответ на один HTTP-запрос (и каким запросом он получен)."""
+
+    data: Any
+    status_code: int
+    ttft_sec: Optional[float]
+    model: str
+    payload: Dict[str, Any]
+
+
+def _until_cancelled(lines: Iterable[str], cancel: Optional[threading.Event]) -> Iterator[str]:
+    """Строки потока, пока запрос не отменён (проигравший дубль при хеджировании)."""
+    for line in lines:
+        if cancel is not None and cancel.is_set():
+            return
+        yield line
 
 
 class OpenRouterClient:
@@ -29,6 +280,20 @@ class OpenRouterClient:
     - стабильность (retry, понятные ошибки)
     - поддержка случаев, когда content пустой из-за лимита токенов,
       а модель успела "подумать" (reasoning), но не успела вывести ответ.
+    - кэш ответов на диске: одинаковые запросы не отправляются повторно.
+    - потокобезопасность: одновременно в сети не больше cfg.llm_concurrency запросов,
+      поэтому клиент можно делить между потоками пайплайна.
+    - общий лимитер (RPM/TPM + AIMD-окно параллельности), повторы на 429
+      по Retry-After и backoff с джиттером.
+    - хеджирование (cfg.llm_hedge): отстающий запрос дублируется, берётся первый ответ.
+    - пул моделей (cfg.openrouter_model_pool): модель выбирается на каждый запрос
+      по задержке, доле ошибок и длине контекста; при сбое повтор уходит другой модели.
+    - запись/воспроизведение ответов (кассета, src/llm/cassette.py) для прогонов без сети.
+    - телеметрия: каждый вызов (токены, задержка, повторы, файл/чанк из llm_scope)
+      попадает в self.telemetry.
+    - потоковый режим (stream=True, по умолчанию cfg.llm_stream): текст приходит
+      по кускам в on_delta, известно время до первого токена, а обрыв по длине
+      виден сразу по finish_reason последнего события.
     """
 
     def __init__(self, cfg: AppConfig) -> None:
@@ -36,14 +301,34 @@ class OpenRouterClient:
         self.base_url = cfg.openrouter_base_url.rstrip("/")
         self.session = requests.Session()
 
+        # Пул keep-alive соединений под нужное число параллельных запросов
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cfg.llm_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = make_rate_limiter(cfg)
+
         # Эти заголовки рекомендованы OpenRouter (идентификация приложения)
         self.headers = {
             "Authorization": f"Bearer {cfg.openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost",
-            "X-Title": "folder-summarizer",
+            **DEFAULT_HEADERS,
         }
 
+        self.cache: Optional[ResponseCache] = make_response_cache(cfg)
+        # Запись/воспроизведение ответов (LLM_CASSETTE) — прогон без сети
+        self.cassette: Optional[Cassette] = make_cassette(cfg)
+        # Хеджирование отстающих запросов (LLM_HEDGE): дубль после перцентиля задержек
+        self.hedging: Optional[Hedging] = make_hedging(cfg)
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        if self.hedging is not None:
+            # Основной запрос и дубль на каждый из параллельных вызовов
+            self._hedge_pool = ThreadPoolExecutor(max_workers=cfg.llm_concurrency * 2, thread_name_prefix="hedge")
+        # Пул моделей с переключением (OPENROUTER_MODEL_POOL); None — только cfg.openrouter_model.
+        # С кассетой пул не используется: выбор модели зависит от задержек, и строгое
+        # воспроизведение промахивалось бы — все запросы идут первой модели пула.
+        self.router: Optional[ModelRouter] = None if self.cassette is not None else make_model_router(cfg)
+        # Токены/задержки/повторы по каждому вызову (итоги — в meta.json и run_summary.json)
+        self.telemetry: Telemetry = make_telemetry(cfg.output_dir, cfg.llm_trace, cfg.llm_trace_max_mb)
+
     def chat(
         self,
         system: str,
@@ -54,106 +339,414 @@ class OpenRouterClient:
         extra: Optional[Dict[str, Any]] = None,
         retries: int = 2,
         retry_sleep_sec: float = 1.2,
-        # внутренний флаг, чтобы авто-ретрай "по длине" не ушёл в бесконечность
-        _length_retry_done: bool = False,
+        use_cache: bool = True,
+        stream: Optional[bool] = None,
+        on_delta: Optional[DeltaCallback] = None,
     ) -> LLMResponse:
         """
         Делает запрос к LLM и возвращает текст + сырой JSON.
+        Сначала смотрит в кэш ответов (если он включён).
+
+        stream=True — ответ читается потоком (SSE), куски текста сразу уходят в on_delta
+        (при попадании в кэш on_delta вызывается один раз со всем текстом).
         """
+        key: Optional[str] = None
+        if self.cache is not None and use_cache:
+            key = ResponseCache.make_key(
+                model=self._cache_model,
+                system=system,
+                user=user,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra=extra,
+            )
+        return self._cached_request(
+            key,
+            build_messages(system, user),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra=extra,
+            retries=retries,
+            retry_sleep_sec=retry_sleep_sec,
+            stream=stream,
+            on_delta=on_delta,
+        )
 
-        url = f"{self.base_url}/chat/completions"
+    def chat_messages(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float = 0.2,
+        max_tokens: Optional[int] = 800,
+        extra: Optional[Dict[str, Any]] = None,
+        retries: int = 2,
+        retry_sleep_sec: float = 1.2,
+        use_cache: bool = True,
+        stream: Optional[bool] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> LLMResponse:
+        """
+        Как chat, но с произвольным списком сообщений (многоходовый диалог,
+        продолжение ответа через assistant-сообщение в конце — prefill).
+        """
+        key: Optional[str] = None
+        if self.cache is not None and use_cache:
+            key = ResponseCache.make_key(
+                model=self._cache_model,
+                system="",
+                user="",
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra=extra,
+                messages=messages,
+            )
+        return self._cached_request(
+            key,
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra=extra,
+            retries=retries,
+            retry_sleep_sec=retry_sleep_sec,
+            stream=stream,
+            on_delta=on_delta,
+        )
 
-        payload: Dict[str, Any] = {
-            "model": self.cfg.openrouter_model,
-            "messages": [
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            "temperature": temperature,
-        }
+    @property
+    def _cache_model(self) -> str:
+        """
+        Модель в ключе кэша ответов. С пулом ответ может написать любая модель пула,
+        поэтому ключ — весь пул (его модели по порядку), а не первая из них.
+        """
+        if self.router is None:
+            return self.cfg.openrouter_model
+        return ",".join(m.name for m in self.router.models)
 
-        if max_tokens is not None:
-            payload["max_tokens"] = max_tokens
+    def _cached_request(
+        self,
+        key: Optional[str],
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float,
+        max_tokens: Optional[int],
+        extra: Optional[Dict[str, Any]],
+        retries: int,
+        retry_sleep_sec: float,
+        stream: Optional[bool],
+        on_delta: Optional[DeltaCallback],
+    ) -> LLMResponse:
+        stream = self.cfg.llm_stream if stream is None else stream
 
-        if extra:
-            payload.update(extra)
+        scope = current_scope()
+        rec = CallRecord(
+            ts=time.time(),
+            model=self.cfg.openrouter_model,
+            file=scope.get("file"),
+            files=scope.get("files"),
+            chunk=scope.get("chunk"),
+            stage=scope.get("stage"),
+            stream=stream,
+        )
+        started = time.perf_counter()
 
-        last_err: Optional[Exception] = None
+        # С кассетой кэш ответов не читаем: при записи каждый запрос должен дойти до сервера
+        # (и попасть в кассету), при воспроизведении ответы берутся только из кассеты
+        if key is not None and self.cache is not None and self.cassette is None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached["text"], cached["text"])
+                rec.cached = True
+                # Ответ в кэше могла написать не основная, а запасная модель из пула
+                rec.model = cached["raw"].get("model") or rec.model
+                rec.latency_sec = time.perf_counter() - started
+                self.telemetry.record(rec)
+                return LLMResponse(text=cached["text"], raw=cached["raw"])
 
-        for attempt in range(retries + 1):
-            try:
-                resp = self.session.post(
-                    url,
-                    headers=self.headers,
-                    data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-                    timeout=self.cfg.request_timeout_sec,
-                )
-
-                # Частые случаи ошибок — сразу нормальными сообщениями
-                if resp.status_code in (401, 403):
-                    raise OpenRouterError(
-                        "Ошибка авторизации (401/403). Проверь OPENROUTER_API_KEY."
-                    )
-                if resp.status_code == 429:
-                    raise OpenRouterError(
-                        "Лимит запросов (429). Попробуй позже или уменьшай частоту/объём."
-                    )
-                if resp.status_code >= 500:
-                    raise OpenRouterError(
-                        f"Ошибка сервера OpenRouter ({resp.status_code})."
-                    )
+        try:
+            resp = self._request(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra=extra,
+                retries=retries,
+                retry_sleep_sec=retry_sleep_sec,
+                stream=stream,
+                on_delta=on_delta,
+                _rec=rec,
+            )
+        except Exception as e:
+            rec.status = "error"
+            rec.error = str(e)[:500]
+            raise
+        else:
+            for name, value in usage_counts(resp.raw).items():
+                setattr(rec, name, value)
+            rec.model = resp.raw.get("model") or rec.model
+            rec.ttft_sec = resp.ttft_sec
+        finally:
+            rec.latency_sec = time.perf_counter() - started
+            self.telemetry.record(rec)
 
-                data = resp.json()
+        if key is not None and self.cache is not None and self.cassette is None:
+            self.cache.set(key, {"text": resp.text, "raw": resp.raw})
+        return resp
 
-                # OpenRouter иногда возвращает { "error": {...} } даже при 200/4xx
-                if isinstance(data, dict) and "error" in data:
-                    err = data["error"] or {}
-                    msg = err.get("message", "Unknown error")
-                    code = err.get("code", resp.status_code)
-                    raise OpenRouterError(f"OpenRouter error {code}: {msg}")
+    def _request(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float = 0.2,
+        max_tokens: Optional[int] = 800,
+        extra: Optional[Dict[str, Any]] = None,
+        retries: int = 2,
+        retry_sleep_sec: float = 1.2,
+        stream: bool = False,
+        on_delta: Optional[DeltaCallback] = None,
+        # внутренний флаг, чтобы авто-ретрай "по длине" не ушёл в бесконечность
+        _length_retry_done: bool = False,
+        # запись телеметрии: сюда считаются повторы
+        _rec: Optional[CallRecord] = None,
+    ) -> LLMResponse:
+        est_tokens = estimate_messages_tokens(messages, max_tokens)
+        replaying = self.cassette is not None and self.cassette.replaying
+        last_err: Optional[Exception] = None
+        attempt = 0
+        throttled = 0
+        # Модели, уже не ответившие на этот запрос: повтор уходит следующей по роутеру
+        failed_models: set[str] = set()
+
+        while True:
+            model = self.cfg.openrouter_model
+            if self.router is not None:
+                model = self.router.choose(est_tokens, exclude=failed_models)
+            if _rec is not None:
+                _rec.model = model
 
-                # Основной путь: chat.completion -> choices[0].message.content
-                choice = (data.get("choices") or [{}])[0]
-                msg = (choice.get("message") or {})
+            payload = build_chat_payload(
+                model,
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra=extra,
+            )
+            if stream:
+                payload["stream"] = True
+
+            started = time.perf_counter()
+            try:
+                if replaying:
+                    # Ответ из кассеты: без сети, лимитера и пауз
+                    sent = _Sent(self.cassette.replay(payload), 200, None, model, payload)
+                else:
+                    sent = self._send_hedged(
+                        model, payload, est_tokens, stream=stream, on_delta=on_delta, _rec=_rec
+                    )
+                    if (
+                        self.cassette is not None
+                        and sent.status_code == 200
+                        and not (isinstance(sent.data, dict) and "error" in sent.data)
+                    ):
+                        self.cassette.record(sent.payload, sent.data)
+                data, status_code, ttft_sec = sent.data, sent.status_code, sent.ttft_sec
+                if sent.model != model:
+                    # Ответ пришёл от дубля, отправленного другой модели
+                    model = sent.model
+                    if _rec is not None:
+                        _rec.model = model
 
-                text = (msg.get("content") or "").strip()
-                finish_reason = choice.get("finish_reason")
+                text, finish_reason, msg = parse_completion(data, status_code)
+                self.limiter.on_success()
+                if replaying and stream and on_delta is not None and text:
+                    on_delta(text, text)
 
                 # 1) Если модель упёрлась в лимит и не успела вывести content — повторяем с большим max_tokens
-                if (not text) and (finish_reason == "length") and (max_tokens is not None):
-                    if not _length_retry_done:
-                        bigger = max(256, int(max_tokens * 3))
-                        # короткая задержка, чтобы не долбить одинаково
+                if needs_length_retry(text, finish_reason, max_tokens) and not _length_retry_done:
+                    self._observe_model(model, ok=True, latency_sec=time.perf_counter() - started)
+                    # короткая задержка, чтобы не долбить одинаково
+                    if not replaying:
                         time.sleep(0.2)
-                        return self.chat(
-                            system=system,
-                            user=user,
-                            temperature=temperature,
-                            max_tokens=bigger,
-                            extra=extra,
-                            retries=retries,
-                            retry_sleep_sec=retry_sleep_sec,
-                            _length_retry_done=True,
-                        )
+                    if _rec is not None:
+                        _rec.length_retries += 1
+                    return self._request(
+                        messages,
+                        temperature=temperature,
+                        max_tokens=length_retry_max_tokens(max_tokens),
+                        extra=extra,
+                        retries=retries,
+                        retry_sleep_sec=retry_sleep_sec,
+                        stream=stream,
+                        on_delta=on_delta,
+                        _length_retry_done=True,
+                        _rec=_rec,
+                    )
 
                 # 2) Если content пустой — покажем понятную ошибку
                 if not text:
-                    reasoning = (msg.get("reasoning") or "")
-                    hint = ""
-                    if reasoning:
-                        hint = " (есть reasoning, но content пустой — увеличь max_tokens или измени промпт)"
-                    raise OpenRouterError(
-                        f"Пустой content от модели. finish_reason={finish_reason}.{hint} "
-                        f"Raw: {str(data)[:700]}"
-                    )
+                    raise empty_content_error(data, msg, finish_reason)
+
+                self._observe_model(model, ok=True, latency_sec=time.perf_counter() - started)
+                return LLMResponse(text=text, raw=data, ttft_sec=ttft_sec)
 
-                return LLMResponse(text=text, raw=data)
+            except OpenRouterRateLimitError as e:
+                # 429 — не ошибка запроса, а сигнал сбавить темп: сужаем окно
+                # и ждём столько, сколько просит сервер. Обычные retries не тратим.
+                last_err = e
+                self._observe_model(model, ok=False)
+                failed_models.add(model)
+                switch = self._has_other_model(failed_models)
+                if switch:
+                    # Есть другая модель в пуле: Retry-After относится к этой модели —
+                    # на паузу ставим её в роутере, а не весь лимитер (он бы держал и запросы к другим)
+                    self.limiter.on_throttle(None)
+                    self.router.block(model, e.retry_after)
+                else:
+                    self.limiter.on_throttle(e.retry_after)
+                if throttled < self.cfg.llm_rate_limit_retries:
+                    hint = None if switch else e.retry_after
+                    time.sleep(backoff_delay(throttled, retry_sleep_sec, hint=hint))
+                    throttled += 1
+                    if _rec is not None:
+                        _rec.throttled += 1
+                    continue
+                break
 
             except (requests.RequestException, ValueError, OpenRouterError) as e:
                 last_err = e
+                self._observe_model(model, ok=False)
+                failed_models.add(model)
                 if attempt < retries:
-                    time.sleep(retry_sleep_sec * (attempt + 1))
+                    time.sleep(backoff_delay(attempt, retry_sleep_sec))
+                    attempt += 1
+                    if _rec is not None:
+                        _rec.retries += 1
                     continue
                 break
 
         raise OpenRouterError(f"Не удалось получить ответ от OpenRouter: {last_err}")
+
+    def _observe_model(self, model: str, *, ok: bool, latency_sec: Optional[float] = None) -> None:
+        if self.router is not None:
+            self.router.observe(model, ok=ok, latency_sec=latency_sec)
+
+    def _has_other_model(self, failed_models: set[str]) -> bool:
+        return self.router is not None and any(m.name not in failed_models for m in self.router.models)
+
+    def _send(
+        self,
+        model: str,
+        payload: Dict[str, Any],
+        est_tokens: int,
+        *,
+        stream: bool,
+        on_delta: Optional[DeltaCallback],
+        cancel: Optional[threading.Event] = None,
+    ) -> _Sent:
+        """Один HTTP-запрос (слот лимитера, POST, разбор обычного или потокового ответа)."""
+        url = f"{self.base_url}/chat/completions"
+        ttft_sec: Optional[float] = None
+        with self.limiter.slot(est_tokens) as slot:
+            started = time.perf_counter()
+            resp = self.session.post(
+                url,
+                headers=self.headers,
+                data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                timeout=self.cfg.request_timeout_sec,
+                stream=stream,
+            )
+            try:
+                self.limiter.observe_headers(resp.headers)
+                check_status(resp.status_code, resp.headers)
+
+                if stream and resp.status_code == 200:
+                    assembler = StreamAssembler(started, on_delta)
+                    data = assembler.feed(_until_cancelled(resp.iter_lines(decode_unicode=True), cancel))
+                    ttft_sec = assembler.ttft_sec
+                else:
+                    data = resp.json()
+            finally:
+                if stream:
+                    resp.close()
+            slot["used_tokens"] = usage_total_tokens(data)
+        return _Sent(data, resp.status_code, ttft_sec, model, payload)
+
+    def _send_hedged(
+        self,
+        model: str,
+        payload: Dict[str, Any],
+        est_tokens: int,
+        *,
+        stream: bool,
+        on_delta: Optional[DeltaCallback],
+        _rec: Optional[CallRecord] = None,
+    ) -> _Sent:
+        """
+        Запрос с хеджированием (cfg.llm_hedge): если ответа нет дольше перцентиля
+        задержек последних вызовов, отправляется дубль (другой модели из пула, если
+        она есть) и берётся тот ответ, что придёт первым. Проигравший брошен:
+        потоковый ответ закрывается на следующем событии, обычный дочитывается
+        в фоне и выбрасывается (отменить начатый HTTP-запрос requests не умеет).
+        Дублей не больше cfg.llm_hedge_budget от числа вызовов. Запросы с on_delta
+        не хеджируются — куски двух ответов перемешались бы.
+        """
+        hedging = self.hedging
+        threshold = hedging.tracker.threshold() if hedging is not None and on_delta is None else None
+        if hedging is None:
+            return self._send(model, payload, est_tokens, stream=stream, on_delta=on_delta)
+
+        hedging.budget.on_call()
+        started = time.perf_counter()
+        if threshold is None:
+            sent = self._send(model, payload, est_tokens, stream=stream, on_delta=on_delta)
+            hedging.tracker.observe(time.perf_counter() - started)
+            return sent
+
+        primary_cancel = threading.Event()
+        primary = self._hedge_pool.submit(
+            self._send, model, payload, est_tokens, stream=stream, on_delta=None, cancel=primary_cancel
+        )
+        try:
+            sent = primary.result(timeout=threshold)
+        except FuturesTimeout:
+            pass
+        else:
+            hedging.tracker.observe(time.perf_counter() - started)
+            return sent
+
+        if not hedging.budget.try_acquire():
+            sent = primary.result()
+            hedging.tracker.observe(time.perf_counter() - started)
+            return sent
+
+        hedge_model = model
+        if self.router is not None and self._has_other_model({model}):
+            hedge_model = self.router.choose(est_tokens, exclude={model})
+        hedge_payload = {**payload, "model": hedge_model}
+        hedge_cancel = threading.Event()
+        hedge = self._hedge_pool.submit(
+            self._send, hedge_model, hedge_payload, est_tokens, stream=stream, on_delta=None, cancel=hedge_cancel
+        )
+        if _rec is not None:
+            _rec.hedged = True
+        log.debug("Hedging %s after %.2fs with %s", model, threshold, hedge_model)
+
+        racers = {primary: primary_cancel, hedge: hedge_cancel}
+        pending = set(racers)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is not None:
+                    continue
+                for loser in pending:
+                    racers[loser].set()
+                if f is hedge:
+                    hedging.budget.on_win()
+                    if _rec is not None:
+                        _rec.hedge_won = True
+                    # Основной запрос так и не ответил: для роутера это медленная модель
+                    self._observe_model(model, ok=True, latency_sec=time.perf_counter() - started)
+                hedging.tracker.observe(time.perf_counter() - started)
+                return f.result()
+
+        # Не ответил ни один — ошибка основного запроса уходит в обычные повторы
+        raise primary.exception()
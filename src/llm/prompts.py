@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+# Увеличивать при любом изменении промптов/шаблона, влияющем на результат:
+# манифест (output/manifest.json) по нему понимает, что старые саммари устарели.
+PROMPT_VERSION = "1"
 
 SUMMARY_SCHEMA_MD = """\
 # Сводка документа
@@ -52,3 +55,29 @@ def make_doc_summary_user_prompt(text: str) -> str:
 {text}
 ---
 """
+
+
+# Пакетная сводка: несколько коротких документов в одном запросе.
+# Маркер раздела в запросе и в ответе — строка вида "=== ДОКУМЕНТ 3 ===".
+BATCH_DOC_MARKER = "=== ДОКУМЕНТ {n} ==="
+
+
+def make_batch_summary_user_prompt(texts: list[str]) -> str:
+    sections = "\n\n".join(
+        f"{BATCH_DOC_MARKER.format(n=n)}\n---\n{text}\n---" for n, text in enumerate(texts, start=1)
+    )
+    return f"""\
+Ниже {len(texts)} независимых коротких документов. Составь по КАЖДОМУ отдельное
+структурированное саммари строго по шаблону ниже. Документы между собой не смешивай:
+в сводке документа — только сведения из его собственного текста.
+
+Формат ответа: для каждого документа по порядку — строка-маркер ровно как во входе
+({BATCH_DOC_MARKER.format(n=1)}, {BATCH_DOC_MARKER.format(n=2)}, ...), затем его сводка.
+Ничего не пиши до первого маркера и после последней сводки.
+
+{SUMMARY_SCHEMA_MD}
+
+Документы (единственный источник правды):
+
+{sections}
+"""
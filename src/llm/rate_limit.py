@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Mapping, Optional, Sequence
+
+from src.llm.tokens import estimate_tokens
+
+
+def estimate_messages_tokens(messages: Sequence[Dict[str, str]], max_tokens: Optional[int]) -> int:
+    """Оценка запроса до отправки (для бюджета TPM); точное число потом придёт в usage."""
+    return sum(estimate_tokens(m.get("content") or "") for m in messages) + (max_tokens or 0)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Сколько секунд сервер просит подождать.
+    Понимает Retry-After (секунды или HTTP-дата) и X-RateLimit-Reset
+    (у OpenRouter это unix-время в миллисекундах).
+    """
+    if not headers:
+        return None
+
+    now = time.time()
+
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+
+    reset = headers.get("X-RateLimit-Reset") or headers.get("x-ratelimit-reset")
+    if reset:
+        try:
+            r = float(reset)
+        except ValueError:
+            return None
+        if r > 1e12:  # unix-время в мс
+            return max(0.0, r / 1000.0 - now)
+        if r > 1e9:  # unix-время в секундах
+            return max(0.0, r - now)
+        return max(0.0, r)  # уже интервал в секундах
+
+    return None
+
+
+def backoff_delay(attempt: int, base: float, *, cap: float = 60.0, hint: Optional[float] = None) -> float:
+    """
+    Пауза перед повтором.
+    - есть подсказка сервера (Retry-After) — ждём её + небольшой джиттер,
+      чтобы параллельные потоки не проснулись одновременно
+    - нет подсказки — экспоненциальный backoff с "full jitter"
+    """
+    if hint is not None:
+        return min(cap, hint) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Ведро с равномерным пополнением: capacity единиц в минуту."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        # delta > 0 — потратили больше, чем оценили; < 0 — возвращаем излишек
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    """
+    Общий (на процесс) клиентский ограничитель запросов к LLM.
+
+    - ведро запросов в минуту (rpm) и ведро токенов в минуту (tpm); 0 — без лимита
+    - окно одновременных запросов по схеме AIMD: на каждый 429 окно делится пополам,
+      на успешные ответы медленно растёт обратно до max_concurrency
+    - Retry-After / X-RateLimit-Reset от сервера блокируют новые запросы до указанного времени
+
+    Так под троттлингом поток запросов держится около лимита провайдера,
+    а не превращается в шторм повторов.
+    """
+
+    def __init__(
+        self,
+        *,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_concurrency: int = 4,
+        min_concurrency: int = 1,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+
+        self._cond = threading.Condition()
+        self._window = float(self.max_concurrency)
+        self._in_flight = 0
+        self._blocked_until = 0.0
+
+        self.throttled = 0
+
+    @property
+    def window(self) -> int:
+        return int(self._window)
+
+    def _wait_time_locked(self, est_tokens: int) -> Optional[float]:
+        """0 — можно идти; > 0 — сколько ждать; None — ждать освобождения слота."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._in_flight >= int(self._window):
+            return None
+
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(est_tokens, now))
+        return wait
+
+    def _take_locked(self, est_tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(est_tokens)
+        self._in_flight += 1
+
+    def acquire(self, est_tokens: int) -> None:
+        with self._cond:
+            while True:
+                wait = self._wait_time_locked(est_tokens)
+                if wait == 0:
+                    self._take_locked(est_tokens)
+                    return
+                self._cond.wait(timeout=wait)
+
+    def release(self, *, est_tokens: int = 0, used_tokens: Optional[int] = None) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if self._tokens is not None and used_tokens is not None:
+                self._tokens.adjust(used_tokens - est_tokens)
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            # аддитивный рост: примерно +1 слот за "окно" успешных ответов
+            self._window = min(float(self.max_concurrency), self._window + 1.0 / max(1.0, self._window))
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._cond:
+            self.throttled += 1
+            # мультипликативное уменьшение окна
+            self._window = max(float(self.min_concurrency), self._window / 2.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Если сервер сообщает, что лимит исчерпан, — не шлём запросы до сброса."""
+        if not headers:
+            return
+        remaining = headers.get("X-RateLimit-Remaining") or headers.get("x-ratelimit-remaining")
+        if remaining is None or remaining.strip() not in {"0", "0.0"}:
+            return
+        reset_raw = headers.get("X-RateLimit-Reset") or headers.get("x-ratelimit-reset")
+        reset = parse_retry_after({"X-RateLimit-Reset": reset_raw}) if reset_raw else None
+        if reset:
+            with self._cond:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+    @contextmanager
+    def slot(self, est_tokens: int) -> Iterator[dict]:
+        """
+        with limiter.slot(est) as s:
+            ...
+            s["used_tokens"] = usage.total_tokens
+        """
+        self.acquire(est_tokens)
+        state: dict = {"used_tokens": None}
+        try:
+            yield state
+        finally:
+            self.release(est_tokens=est_tokens, used_tokens=state["used_tokens"])
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Collection, Dict, List, Optional, Sequence
+
+from config import AppConfig
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Модель из пула: имя, длина контекста (None — не ограничиваем) и вес предпочтения."""
+
+    name: str
+    context_tokens: Optional[int] = None
+    weight: float = 1.0
+
+
+def parse_model_spec(raw: str) -> ModelSpec:
+    """
+    "vendor/model[@контекст][*вес]", например "qwen/qwen3-14b:free@40000*2".
+    Контекст можно писать с k: "@128k".
+    """
+    spec = raw.strip()
+    weight = 1.0
+    if "*" in spec:
+        spec, w = spec.rsplit("*", 1)
+        weight = float(w)
+        if weight <= 0:
+            raise ValueError(f"Вес модели должен быть > 0: {raw}")
+    ctx: Optional[int] = None
+    if "@" in spec:
+        spec, c = spec.rsplit("@", 1)
+        c = c.strip().lower()
+        ctx = int(float(c[:-1]) * 1000) if c.endswith("k") else int(c)
+    name = spec.strip()
+    if not name:
+        raise ValueError(f"Пустое имя модели: {raw}")
+    return ModelSpec(name=name, context_tokens=ctx, weight=weight)
+
+
+class _ModelHealth:
+    """Скользящие (EWMA) задержка и доля ошибок модели + «предохранитель» после серии сбоев."""
+
+    def __init__(self) -> None:
+        self.latency_sec: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+
+class ModelRouter:
+    """
+    Выбор модели на каждый запрос из пула (OPENROUTER_MODEL_POOL).
+
+    - по каждой модели копятся скользящая задержка и доля ошибок (EWMA, alpha);
+      после fail_threshold ошибок подряд модель выводится из ротации на cooldown_sec,
+      потом получает один пробный запрос
+    - маленький запрос (оценка ≤ small_tokens) идёт самой быстрой модели:
+      минимум задержка × (1 + 4 × доля ошибок) / вес; у модели без замеров задержка
+      считается равной лучшей известной, так что при равенстве решает порядок в пуле
+    - большой запрос — модели с самым длинным контекстом из подходящих
+    - модели, чей контекст меньше оценки запроса, не выбираются (если подходящих
+      нет совсем — берётся самая «длинная»)
+    - exclude — модели, уже не ответившие на этот запрос: так делается переключение
+      на следующую модель при повторе
+
+    Потокобезопасен.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[ModelSpec],
+        *,
+        small_tokens: int = 6000,
+        alpha: float = 0.2,
+        fail_threshold: int = 3,
+        cooldown_sec: float = 30.0,
+    ) -> None:
+        if not models:
+            raise ValueError("Пул моделей пуст")
+        self.models = list(models)
+        self.small_tokens = small_tokens
+        self.alpha = alpha
+        self.fail_threshold = max(1, fail_threshold)
+        self.cooldown_sec = cooldown_sec
+        self._lock = threading.Lock()
+        self._health: Dict[str, _ModelHealth] = {m.name: _ModelHealth() for m in self.models}
+
+    @property
+    def primary(self) -> str:
+        return self.models[0].name
+
+    def _score(self, spec: ModelSpec, best_latency: float) -> float:
+        h = self._health[spec.name]
+        latency = h.latency_sec if h.latency_sec is not None else best_latency
+        return latency * (1.0 + 4.0 * h.error_rate) / spec.weight
+
+    def choose(self, est_tokens: int, exclude: Collection[str] = ()) -> str:
+        now = time.monotonic()
+        with self._lock:
+            pool = [m for m in self.models if m.name not in exclude] or list(self.models)
+            fitting = [m for m in pool if m.context_tokens is None or m.context_tokens >= est_tokens]
+            if not fitting:
+                fitting = [max(pool, key=lambda m: m.context_tokens or 0)]
+
+            healthy = [m for m in fitting if self._health[m.name].cooldown_until <= now]
+            if not healthy:
+                # Все подходящие «на паузе» — та, что освободится раньше всех
+                return min(fitting, key=lambda m: self._health[m.name].cooldown_until).name
+
+            known = [self._health[m.name].latency_sec for m in healthy]
+            best_latency = min((x for x in known if x is not None), default=1.0)
+
+            if est_tokens > self.small_tokens:
+                longest = max(m.context_tokens or 0 for m in healthy)
+                healthy = [m for m in healthy if (m.context_tokens or 0) == longest]
+            # min() стабилен: при равном счёте выигрывает модель, стоящая в пуле раньше
+            return min(healthy, key=lambda m: self._score(m, best_latency)).name
+
+    def observe(self, model: str, *, ok: bool, latency_sec: Optional[float] = None) -> None:
+        with self._lock:
+            h = self._health.get(model)
+            if h is None:
+                return
+            h.calls += 1
+            h.error_rate += self.alpha * ((0.0 if ok else 1.0) - h.error_rate)
+            if ok:
+                h.consecutive_errors = 0
+                h.cooldown_until = 0.0
+                if latency_sec is not None:
+                    h.latency_sec = (
+                        latency_sec
+                        if h.latency_sec is None
+                        else h.latency_sec + self.alpha * (latency_sec - h.latency_sec)
+                    )
+                return
+            h.errors += 1
+            h.consecutive_errors += 1
+            if h.consecutive_errors >= self.fail_threshold:
+                h.cooldown_until = time.monotonic() + self.cooldown_sec
+
+    def block(self, model: str, seconds: Optional[float]) -> None:
+        """Модель просит подождать (429 с Retry-After) — до тех пор её не выбираем."""
+        if not seconds:
+            return
+        with self._lock:
+            h = self._health.get(model)
+            if h is not None:
+                h.cooldown_until = max(h.cooldown_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние пула (для run_summary.json)."""
+        with self._lock:
+            return {
+                m.name: {
+                    "context_tokens": m.context_tokens,
+                    "weight": m.weight,
+                    "calls": self._health[m.name].calls,
+                    "errors": self._health[m.name].errors,
+                    "latency_sec": (
+                        round(self._health[m.name].latency_sec, 3)
+                        if self._health[m.name].latency_sec is not None
+                        else None
+                    ),
+                    "error_rate": round(self._health[m.name].error_rate, 3),
+                }
+                for m in self.models
+            }
+
+
+def make_model_router(cfg: AppConfig) -> Optional[ModelRouter]:
+    """Роутер по настройкам из конфига (None — все запросы идут в OPENROUTER_MODEL)."""
+    if not cfg.openrouter_model_pool:
+        return None
+    specs: List[ModelSpec] = [parse_model_spec(s) for s in cfg.openrouter_model_pool]
+    return ModelRouter(
+        specs,
+        small_tokens=cfg.llm_router_small_tokens,
+        cooldown_sec=cfg.llm_router_cooldown_sec,
+    )
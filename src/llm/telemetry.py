@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+
+# Кому принадлежит текущий вызов LLM: файл и чанк. Контекст наследуется
+# через contextvars — в пулы потоков его передают явно (copy_context().run).
+_scope: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("llm_scope", default={})
+
+
+@contextmanager
+def llm_scope(**fields: Any) -> Iterator[None]:
+    """Помечает вызовы LLM внутри блока: with llm_scope(file="a.pdf", chunk=3): ..."""
+    token = _scope.set({**_scope.get(), **fields})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> Dict[str, Any]:
+    return dict(_scope.get())
+
+
+@dataclass
+class CallRecord:
+    """Один вызов chat/chat_messages (с учётом всех повторов внутри)."""
+
+    ts: float
+    model: str
+    file: Optional[str] = None
+    # Вызов на несколько файлов сразу (пакет): файл -> доля расхода
+    files: Optional[Dict[str, float]] = None
+    chunk: Optional[Any] = None
+    stage: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    # Стоимость, если провайдер её сообщил (usage.cost у OpenRouter)
+    cost: Optional[float] = None
+    latency_sec: float = 0.0
+    ttft_sec: Optional[float] = None
+    # Повторы: обычные (сеть, 5xx), на 429 и «по длине» (пустой content)
+    retries: int = 0
+    throttled: int = 0
+    length_retries: int = 0
+    # Отправлялся дубль (хеджирование) и ответ дал именно он
+    hedged: bool = False
+    hedge_won: bool = False
+    cached: bool = False
+    stream: bool = False
+    status: str = "ok"
+    error: Optional[str] = None
+
+
+@dataclass
+class CallStats:
+    """Сумма по набору вызовов (файл или весь запуск)."""
+
+    calls: int = 0
+    cached_calls: int = 0
+    failed_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cost: float = 0.0
+    latency_sec: float = 0.0
+    retries: int = 0
+    throttled: int = 0
+    length_retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    # Какие модели отвечали и сколько раз (при пуле моделей их может быть несколько)
+    models: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, rec: CallRecord, share: float = 1.0) -> None:
+        """share — доля токенов и стоимости вызова, приходящаяся на этот набор."""
+        self.calls += 1
+        self.cached_calls += int(rec.cached)
+        self.failed_calls += int(rec.status != "ok")
+        self.prompt_tokens += round(rec.prompt_tokens * share)
+        self.completion_tokens += round(rec.completion_tokens * share)
+        self.total_tokens += round(rec.total_tokens * share)
+        self.cost += (rec.cost or 0.0) * share
+        self.latency_sec += rec.latency_sec
+        self.retries += rec.retries
+        self.throttled += rec.throttled
+        self.length_retries += rec.length_retries
+        self.hedges += int(rec.hedged)
+        self.hedge_wins += int(rec.hedge_won)
+        if rec.status == "ok" and rec.model:
+            self.models[rec.model] = self.models.get(rec.model, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["cost"] = round(self.cost, 6)
+        d["latency_sec"] = round(self.latency_sec, 3)
+        return d
+
+
+def usage_counts(raw: Any) -> Dict[str, Any]:
+    """prompt/completion/total tokens и cost из usage ответа (чего нет — 0/None)."""
+    usage = raw.get("usage") if isinstance(raw, dict) else None
+    if not isinstance(usage, dict):
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": None}
+
+    def _int(name: str) -> int:
+        v = usage.get(name)
+        return int(v) if isinstance(v, (int, float)) else 0
+
+    prompt, completion = _int("prompt_tokens"), _int("completion_tokens")
+    cost = usage.get("cost")
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": _int("total_tokens") or prompt + completion,
+        "cost": float(cost) if isinstance(cost, (int, float)) else None,
+    }
+
+
+class Telemetry:
+    """
+    Учёт вызовов LLM: токены, задержка, повторы, модель, файл/чанк.
+
+    - сумма по каждому файлу (pop_file — для meta.json) и по запуску (summary)
+    - если задан trace_path — каждый вызов отдельной строкой JSONL (файл на запуск);
+      при max_trace_bytes > 0 трасса больше предела уходит в <имя>.1 (прежний .1
+      удаляется) и пишется заново — долгоживущие --watch / --serve не забивают диск
+    Потокобезопасен.
+    """
+
+    def __init__(self, trace_path: Optional[Path] = None, max_trace_bytes: int = 0) -> None:
+        self.trace_path = Path(trace_path) if trace_path else None
+        self.max_trace_bytes = max_trace_bytes
+        self._trace: Optional[TextIO] = None
+        self._trace_bytes = 0
+        self._lock = threading.Lock()
+        self._by_file: Dict[str, CallStats] = {}
+        self._by_stage: Dict[str, CallStats] = {}
+        self.total = CallStats()
+        self.started = time.time()
+
+    def record(self, rec: CallRecord) -> None:
+        with self._lock:
+            self.total.add(rec)
+            if rec.file is not None:
+                self._by_file.setdefault(rec.file, CallStats()).add(rec)
+            for file, share in (rec.files or {}).items():
+                self._by_file.setdefault(file, CallStats()).add(rec, share)
+            if rec.stage is not None:
+                self._by_stage.setdefault(rec.stage, CallStats()).add(rec)
+
+            if self.trace_path is not None:
+                if self._trace is None:
+                    self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._trace = self.trace_path.open("w", encoding="utf-8", buffering=1)
+                    self._trace_bytes = 0
+                line = json.dumps(asdict(rec), ensure_ascii=False) + "\n"
+                self._trace.write(line)
+                self._trace_bytes += len(line.encode("utf-8"))
+                if self.max_trace_bytes and self._trace_bytes >= self.max_trace_bytes:
+                    self._rotate_trace()
+
+    def _rotate_trace(self) -> None:
+        assert self.trace_path is not None and self._trace is not None
+        self._trace.close()
+        self._trace = None
+        os.replace(self.trace_path, self.trace_path.with_name(self.trace_path.name + ".1"))
+
+    def pop_file(self, file: str) -> Optional[Dict[str, Any]]:
+        """Итог по файлу (и забыть его — память не растёт с числом файлов)."""
+        with self._lock:
+            stats = self._by_file.pop(file, None)
+        return stats.to_dict() if stats is not None else None
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started": self.started,
+                "wall_sec": round(time.time() - self.started, 3),
+                "total": self.total.to_dict(),
+                "by_stage": {k: v.to_dict() for k, v in sorted(self._by_stage.items())},
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+def make_telemetry(output_dir: Path, trace: bool, trace_max_mb: int = 0) -> Telemetry:
+    return Telemetry(output_dir / "llm_trace.jsonl" if trace else None, trace_max_mb << 20)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Callable, Optional
+
+try:
+    import tiktoken
+except ImportError:  # необязательная зависимость
+    tiktoken = None
+
+
+# Калибровка оценки "символов на токен" по классам символов.
+# Кириллица у BPE-токенизаторов дробится заметно мельче латиницы,
+# поэтому одна константа "4 символа = токен" для русских документов сильно врёт.
+CHARS_PER_TOKEN_CYRILLIC = 2.6
+CHARS_PER_TOKEN_LATIN = 4.0
+CHARS_PER_TOKEN_DIGITS = 2.5
+
+_CYRILLIC_RE = re.compile(r"[Ѐ-ӿ]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_DIGIT_RE = re.compile(r"\d")
+_SPACE_RE = re.compile(r"\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Быстрая оценка числа токенов без токенизатора.
+    Пробелы почти всегда "приклеиваются" к соседнему токену, прочие символы
+    (пунктуация, кавычки, спецсимволы) обычно идут отдельным токеном.
+    """
+    if not text:
+        return 0
+    cyr = len(_CYRILLIC_RE.findall(text))
+    lat = len(_LATIN_RE.findall(text))
+    dig = len(_DIGIT_RE.findall(text))
+    spaces = len(_SPACE_RE.findall(text))
+    other = max(0, len(text) - cyr - lat - dig - spaces)
+    tokens = (
+        cyr / CHARS_PER_TOKEN_CYRILLIC
+        + lat / CHARS_PER_TOKEN_LATIN
+        + dig / CHARS_PER_TOKEN_DIGITS
+        + other
+    )
+    return max(1, int(tokens + 0.5))
+
+
+class TokenCounter:
+    """
+    Счётчик токенов для бюджетов чанков/промптов.
+
+    - "tiktoken": локальный BPE-токенизатор (если установлен пакет tiktoken).
+      Точного токенизатора для большинства моделей OpenRouter локально нет,
+      o200k_base — близкое приближение для современных моделей.
+    - "estimate": калиброванная оценка по классам символов (без зависимостей).
+    - "auto": tiktoken, если установлен, иначе оценка.
+
+    scale — поправочный коэффициент под конкретную модель (например, 1.1,
+    если по usage видно, что модель насчитывает на 10% больше).
+    """
+
+    def __init__(self, method: str = "auto", scale: float = 1.0) -> None:
+        self.scale = scale
+        self._encode: Optional[Callable[[str], list]] = None
+
+        if method not in {"auto", "tiktoken", "estimate"}:
+            raise ValueError(f"Неизвестный TOKENIZER: {method}")
+        if method == "tiktoken" and tiktoken is None:
+            raise RuntimeError("TOKENIZER=tiktoken, но пакет tiktoken не установлен")
+
+        if method in {"auto", "tiktoken"} and tiktoken is not None:
+            self._encode = tiktoken.get_encoding("o200k_base").encode
+            self.method = "tiktoken"
+        else:
+            self.method = "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encode is not None:
+            n = len(self._encode(text))
+        else:
+            n = estimate_tokens(text)
+        return max(1, int(n * self.scale + 0.5))
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(method: str = "auto", scale: float = 1.0) -> TokenCounter:
+    return TokenCounter(method, scale)
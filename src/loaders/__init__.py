@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import time
 from pathlib import Path
+from typing import Tuple
 
 from src.loaders.base import LoadedDoc
 from src.loaders.docx import load_docx
@@ -9,6 +11,11 @@ from src.loaders.text import load_text_file
 from src.loaders.image_ocr import load_image_ocr
 
 
+# Увеличивать при изменениях в загрузчиках, которые меняют извлечённый текст:
+# по ней кэш извлечения (src/loaders/cache.py) понимает, что старые записи устарели.
+LOADER_VERSION = "2"
+
+
 def load_document(path: str | Path) -> LoadedDoc:
     p = Path(path)
     ext = p.suffix.lower()
@@ -23,3 +30,10 @@ def load_document(path: str | Path) -> LoadedDoc:
         return load_image_ocr(p)
 
     return LoadedDoc(path=p, text="", loader="unknown")
+
+
+def load_document_timed(path: str | Path) -> Tuple[LoadedDoc, float]:
+    """load_document + время извлечения в секундах (для кэша извлечения)."""
+    started = time.perf_counter()
+    loaded = load_document(path)
+    return loaded, time.perf_counter() - started
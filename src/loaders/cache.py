@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from config import AppConfig
+from src.loaders.base import LoadedDoc
+from src.utils.disk_cache import CacheStats, DiskCache
+
+
+class ExtractionCache:
+    """
+    Кэш извлечённого текста (результат load_document) на диске.
+
+    Ключ — версия загрузчиков + расширение + sha256 содержимого файла, значение —
+    сжатый zlib JSON с текстом, именем загрузчика и временем извлечения.
+    Смена модели или промптов не приводит к повторному OCR/разбору PDF.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        loader_version: str,
+        *,
+        max_bytes: Optional[int] = None,
+        max_age_sec: Optional[float] = None,
+    ) -> None:
+        self._store = DiskCache(path, max_bytes=max_bytes, max_age_sec=max_age_sec)
+        self.loader_version = loader_version
+        self._lock = threading.Lock()
+        # Сколько секунд извлечения сэкономили попадания в кэш за этот запуск
+        self.time_saved_sec = 0.0
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._store.stats
+
+    def _key(self, sha256: str, ext: str) -> str:
+        return f"{self.loader_version}:{ext.lower()}:{sha256}"
+
+    def get(self, path: Path, sha256: str) -> Optional[LoadedDoc]:
+        blob = self._store.get(self._key(sha256, path.suffix))
+        if blob is None:
+            return None
+        try:
+            data = json.loads(zlib.decompress(blob).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+        with self._lock:
+            self.time_saved_sec += float(data.get("extract_sec") or 0.0)
+        return LoadedDoc(path=path, text=data["text"], loader=data["loader"])
+
+    def put(self, sha256: str, loaded: LoadedDoc, extract_sec: float) -> None:
+        # Ошибки загрузки не кэшируем: в следующий раз может получиться (например, поставили tesseract)
+        if loaded.loader.endswith("_error"):
+            return
+        payload = json.dumps(
+            {"text": loaded.text, "loader": loaded.loader, "extract_sec": round(extract_sec, 3)},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self._store.set(self._key(sha256, loaded.path.suffix), zlib.compress(payload, 6))
+
+    def close(self) -> None:
+        self._store.close()
+
+
+def make_extraction_cache(cfg: AppConfig, loader_version: str) -> Optional[ExtractionCache]:
+    """Кэш по настройкам из конфига (None, если кэш выключен)."""
+    if cfg.extract_cache_dir is None:
+        return None
+    return ExtractionCache(
+        cfg.extract_cache_dir / "extracted.sqlite3",
+        loader_version,
+        max_bytes=cfg.extract_cache_max_mb * 1024 * 1024,
+    )
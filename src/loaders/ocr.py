@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence
+
+from PIL import Image, ImageOps
+import pytesseract
+
+from config import AppConfig
+
+
+@dataclass(frozen=True)
+class OcrSettings:
+    """Настройки OCR из AppConfig; в процессы-воркеры передаются через ocr_worker_init."""
+
+    lang: str = "rus+eng"
+    target_dpi: int = 300
+    binarize: bool = True
+    workers: int = 1
+    # Распознавать страницы PDF без текстового слоя
+    pdf_fallback: bool = True
+
+
+def ocr_settings(cfg: AppConfig) -> OcrSettings:
+    return OcrSettings(
+        lang=cfg.ocr_lang,
+        target_dpi=cfg.ocr_target_dpi,
+        binarize=cfg.ocr_binarize,
+        workers=cfg.ocr_workers,
+        pdf_fallback=cfg.pdf_ocr_fallback,
+    )
+
+
+# Загрузчики вызываются по пути файла (в том числе в процессах-воркерах), поэтому
+# настройки OCR — на уровне процесса: configure_ocr в основном, ocr_worker_init в воркере
+_settings = OcrSettings()
+
+# Пул для OCR нескольких страниц скана в основном процессе: один на весь процесс,
+# создаётся при первом скане (а не на каждый PDF)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def configure_ocr(settings: OcrSettings) -> None:
+    global _settings
+    _settings = settings
+
+
+def current_ocr_settings() -> OcrSettings:
+    return _settings
+
+
+def configure_tesseract_if_needed() -> None:
+    """
+    На Windows tesseract.exe может не быть в PATH.
+    Можно задать путь через переменную окружения TESSERACT_CMD.
+    Например:
+      TESSERACT_CMD=C:\\Program Files\\Tesseract-OCR\\tesseract.exe
+    """
+    cmd = os.getenv("TESSERACT_CMD", "").strip()
+    if cmd:
+        pytesseract.pytesseract.tesseract_cmd = cmd
+
+
+def ocr_worker_init(settings: Optional[OcrSettings] = None) -> None:
+    """
+    Инициализация процесса-воркера для OCR (и загрузки документов): настройки OCR
+    из основного процесса. Tesseract сам распараллеливается через OpenMP; когда
+    параллелим мы (по процессу на ядро), его потоки только мешают друг другу — ограничиваем одним.
+    """
+    if settings is not None:
+        configure_ocr(settings)
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    configure_tesseract_if_needed()
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    """Порог бинаризации по Оцу по гистограмме 8-битного изображения."""
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    if total == 0:
+        return 128
+
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = 0.0
+    weight_bg = 0
+    best_t, best_var = 128, -1.0
+
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best_var, best_t = var, t
+    return best_t
+
+
+def preprocess_image(
+    img: Image.Image,
+    *,
+    target_dpi: Optional[int] = None,
+    binarize: Optional[bool] = None,
+) -> Image.Image:
+    """
+    Подготовка изображения к OCR:
+    - оттенки серого
+    - приведение к target_dpi: фото с телефона в 4000px при 72 dpi уменьшаются
+      (tesseract на них тратит в разы больше времени без выигрыша в качестве),
+      мелкие сканы увеличиваются до читаемого размера букв
+    - автоконтраст и бинаризация по Оцу
+    """
+    target_dpi = target_dpi or _settings.target_dpi
+    binarize = _settings.binarize if binarize is None else binarize
+
+    img = ImageOps.exif_transpose(img)
+    gray = img.convert("L")
+
+    dpi = img.info.get("dpi")
+    src_dpi = float(dpi[0]) if dpi and dpi[0] else None
+    w, h = gray.size
+
+    if src_dpi and src_dpi >= 72:
+        scale = target_dpi / src_dpi
+    else:
+        # DPI неизвестен: считаем, что это лист A4, и подгоняем длинную сторону
+        scale = (11.7 * target_dpi) / max(w, h)
+
+    # Не раздуваем мелкие картинки бесконечно и не ужимаем в нечитаемое;
+    # длинная сторона — не больше листа A4 (с запасом) при target_dpi
+    # (телефонные фото часто врут про 72 dpi)
+    scale = max(0.25, min(scale, 3.0, (12 * target_dpi) / max(w, h)))
+    if abs(scale - 1.0) > 0.1:
+        gray = gray.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    if binarize:
+        threshold = _otsu_threshold(gray)
+        gray = gray.point(lambda v: 255 if v > threshold else 0, mode="1")
+    return gray
+
+
+def ocr_image(
+    img: Image.Image,
+    lang: Optional[str] = None,
+    *,
+    preprocess: bool = True,
+    settings: Optional[OcrSettings] = None,
+) -> str:
+    settings = settings or _settings
+    configure_tesseract_if_needed()
+    if preprocess:
+        img = preprocess_image(img, target_dpi=settings.target_dpi, binarize=settings.binarize)
+    text = pytesseract.image_to_string(img, lang=lang or settings.lang)
+    return (text or "").strip()
+
+
+def _ocr_one(img: Image.Image, settings: OcrSettings) -> str:
+    try:
+        # Настройки — явно: воркер общего пула мог стартовать с другими
+        return ocr_image(img, settings=settings)
+    except Exception:
+        # Одна нечитаемая страница не должна ронять весь документ
+        return ""
+
+
+def _ocr_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=ocr_worker_init)
+        return _pool
+
+
+def ocr_images(
+    images: Sequence[Image.Image],
+    lang: Optional[str] = None,
+    *,
+    workers: Optional[int] = None,
+) -> List[str]:
+    """
+    OCR набора изображений (например, страниц скана) с сохранением порядка.
+
+    Если мы в основном процессе и картинок больше одной — в общем пуле процессов
+    (tesseract нагружает CPU, потоки тут не помогают). Внутри процесса-воркера
+    (например, пула загрузчиков) — последовательно, чтобы не плодить вложенные пулы.
+    """
+    settings = _settings if lang is None else replace(_settings, lang=lang)
+    workers = workers or settings.workers
+
+    if len(images) <= 1 or workers <= 1 or multiprocessing.parent_process() is not None:
+        return [_ocr_one(img, settings) for img in images]
+
+    return list(_ocr_pool(workers).map(_ocr_one, images, [settings] * len(images)))
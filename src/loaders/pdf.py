@@ -1,22 +1,169 @@
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Deque, Iterator, List, Optional
 
+from PIL import Image
 from pypdf import PdfReader
 
 from src.loaders.base import LoadedDoc
+from src.loaders.ocr import current_ocr_settings, ocr_images, ocr_worker_init
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # необязательная зависимость: без неё берём картинку скана из страницы
+    pdfium = None
+
+
+# Страница с текстовым слоем короче этого считается сканом (пустой слой или мусор)
+MIN_TEXT_LAYER_CHARS = 20
 
 
 def load_pdf(path: str | Path) -> LoadedDoc:
     p = Path(path)
+    ocr = current_ocr_settings().pdf_fallback
     reader = PdfReader(str(p))
 
-    parts: list[str] = []
-    for page in reader.pages:
-        text: Optional[str] = page.extract_text()
-        if text:
-            parts.append(text)
+    texts: List[str] = []
+    scanned: List[int] = []
+    for i, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        texts.append(text)
+        if ocr and _is_scanned(text):
+            scanned.append(i)
 
+    # Страницы без текстового слоя — растеризуем и распознаём (параллельно, если можно)
+    if scanned:
+        images = _page_images(str(p), reader, scanned)
+        found = [(i, img) for i, img in zip(scanned, images) if img is not None]
+        ocr_texts = ocr_images([img for _, img in found])
+        for (i, _), t in zip(found, ocr_texts):
+            if t:
+                texts[i] = t
+
+    parts = [t for t in texts if t]
     joined = "\n\n".join(parts).strip()
-    return LoadedDoc(path=p, text=joined, loader="pdf")
+    loader = "pdf+ocr" if scanned else "pdf"
+    return LoadedDoc(path=p, text=joined, loader=loader)
+
+
+def _is_scanned(text: str) -> bool:
+    return len(text.strip()) < MIN_TEXT_LAYER_CHARS
+
+
+def _page_images(path: str, reader: Any, indices: List[int]) -> List[Optional[Image.Image]]:
+    """
+    Картинки страниц для OCR.
+    С pypdfium2 — честная растеризация страницы в OCR_TARGET_DPI;
+    без него — самое большое встроенное изображение страницы (у сканов это и есть лист).
+    """
+    out: List[Optional[Image.Image]] = []
+
+    if pdfium is not None:
+        doc = pdfium.PdfDocument(path)
+        try:
+            for i in indices:
+                try:
+                    out.append(doc[i].render(scale=current_ocr_settings().target_dpi / 72).to_pil())
+                except Exception:
+                    out.append(None)
+        finally:
+            doc.close()
+        return out
+
+    for i in indices:
+        try:
+            candidates = [im.image for im in reader.pages[i].images]
+            out.append(max(candidates, key=lambda im: im.width * im.height) if candidates else None)
+        except Exception:
+            out.append(None)
+    return out
+
+
+def pdf_page_count(path: str | Path) -> int:
+    return len(PdfReader(str(path)).pages)
+
+
+def _extract_page_range(path: str, start: int, end: int, ocr: bool = False) -> List[str]:
+    """
+    Выполняется в процессе-воркере: каждый воркер сам открывает PDF.
+    Страницы-сканы распознаются тут же, в этом воркере, — так OCR
+    распараллеливается по диапазонам страниц вместе с извлечением текста.
+    """
+    reader = PdfReader(path)
+    out: List[str] = []
+    scanned: List[int] = []
+    for i in range(start, end):
+        text: Optional[str] = reader.pages[i].extract_text()
+        out.append(text or "")
+        if ocr and _is_scanned(text or ""):
+            scanned.append(i)
+
+    if scanned:
+        images = _page_images(path, reader, scanned)
+        for i, img in zip(scanned, images):
+            if img is None:
+                continue
+            t = ocr_images([img])[0]
+            if t:
+                out[i - start] = t
+    return out
+
+
+def iter_pdf_pages(
+    path: str | Path,
+    *,
+    executor: Optional[Executor] = None,
+    workers: int = 1,
+    pages_per_task: int = 8,
+) -> Iterator[str]:
+    """
+    Текст страниц PDF по порядку, по мере извлечения.
+
+    - без executor и workers<=1 — последовательно в текущем процессе
+    - иначе страницы режутся на диапазоны по pages_per_task и извлекаются
+      в пуле процессов (страницы без текстового слоя там же распознаются OCR);
+      в работе держится ограниченное окно диапазонов, так что память не растёт
+      с размером документа, а потребитель (чанкинг/саммари) получает первые
+      страницы, пока остальные ещё извлекаются
+    """
+    p = str(path)
+
+    ocr = current_ocr_settings().pdf_fallback
+    n = pdf_page_count(p)
+
+    if executor is None and workers <= 1:
+        for start in range(0, n, pages_per_task):
+            yield from _extract_page_range(p, start, min(n, start + pages_per_task), ocr)
+        return
+
+    own_pool: Optional[ProcessPoolExecutor] = None
+    if executor is None:
+        own_pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=ocr_worker_init, initargs=(current_ocr_settings(),)
+        )
+        executor = own_pool
+
+    window = max(2, workers * 2)
+    ranges = iter(range(0, n, pages_per_task))
+    pending: Deque[Future] = deque()
+
+    def _submit_next() -> None:
+        start = next(ranges, None)
+        if start is not None:
+            pending.append(executor.submit(_extract_page_range, p, start, min(n, start + pages_per_task), ocr))
+
+    try:
+        for _ in range(window):
+            _submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            _submit_next()
+            yield from pages
+    finally:
+        for f in pending:
+            f.cancel()
+        if own_pool is not None:
+            own_pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from config import AppConfig
+from src.llm.openrouter_client import OpenRouterClient
+from src.llm.telemetry import llm_scope
+from src.loaders import load_document_timed
+from src.loaders.base import LoadedDoc
+from src.loaders.cache import ExtractionCache
+from src.loaders.ocr import configure_ocr, ocr_settings, ocr_worker_init
+from src.loaders.pdf import iter_pdf_pages, pdf_page_count
+from src.summarize.batch import DocBatcher
+from src.summarize.boilerplate import BoilerplateIndex
+from src.summarize.summarize_doc import summarize_document_stream, summarize_document_text
+from src.utils.files import FileItem, file_sha256
+from src.utils.manifest import FileCheck, Manifest
+from src.utils.near_dup import NearDupIndex
+
+
+EMPTY_SUMMARY = "Текст не извлечён или файл пустой."
+
+
+@dataclass
+class FileResult:
+    key: str
+    path: Path
+    summary: str
+    meta: Dict[str, Any]
+    check: FileCheck
+    reused: bool = False
+
+
+def summarize_loaded(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    loaded: LoadedDoc,
+    boilerplate: Optional[BoilerplateIndex] = None,
+    batcher: Optional[DocBatcher] = None,
+    chunk_pool: Optional[Executor] = None,
+    key: Optional[str] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Саммари уже загруженного документа + запись для meta.json.
+    key — ключ файла (путь относительно DOCS_DIR), под ним пакетный вызов попадает в телеметрию.
+    """
+    text = loaded.text or ""
+    stripped = None
+    batched = False
+
+    if not text.strip():
+        summary = EMPTY_SUMMARY
+        status = "empty"
+    else:
+        if boilerplate is not None:
+            stripped = boilerplate.strip(text)
+        body = stripped.text if stripped else text
+        # Короткий документ — в общий пакет с другими; не вышло — отдельным запросом
+        summary = batcher.summarize(key or loaded.path.name, body) if batcher is not None else None
+        batched = summary is not None
+        if summary is None:
+            summary = summarize_document_text(cfg, llm, body, chunk_pool)
+        status = "ok"
+
+    meta: Dict[str, Any] = {
+        "file": loaded.path.name,
+        "loader": loaded.loader,
+        "text_len": len(text),
+        "status": status,
+    }
+    if stripped is not None and stripped.lines_removed:
+        meta["boilerplate_lines"] = stripped.lines_removed
+        meta["boilerplate_removed_pct"] = round(stripped.removed_pct, 1)
+    if batched:
+        meta["batched"] = True
+    return summary, meta
+
+
+class _TextCounter:
+    """
+    Пропускает поток страниц насквозь и считает длину текста (для meta.json).
+    keep=True — ещё и собирает текст (для кэша извлечения); extract_sec — сколько
+    потребитель простоял в ожидании страниц, т.е. цена извлечения для конвейера.
+    """
+
+    def __init__(self, pieces: Iterable[str], keep: bool = False) -> None:
+        self._pieces = pieces
+        self.text_len = 0
+        self.has_text = False
+        self.extract_sec = 0.0
+        self.parts: Optional[List[str]] = [] if keep else None
+
+    def __iter__(self) -> Iterator[str]:
+        it = iter(self._pieces)
+        while True:
+            started = time.perf_counter()
+            piece = next(it, None)
+            self.extract_sec += time.perf_counter() - started
+            if piece is None:
+                return
+
+            self.text_len += len(piece)
+            if not self.has_text and piece.strip():
+                self.has_text = True
+            if self.parts is not None and piece:
+                self.parts.append(piece)
+            yield piece
+
+
+def summarize_pdf_stream(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    path: Path,
+    executor: Optional[Executor],
+    *,
+    sha256: Optional[str] = None,
+    extraction_cache: Optional[ExtractionCache] = None,
+    chunk_pool: Optional[Executor] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Большой PDF: страницы извлекаются в пуле процессов, саммари чанков стартуют сразу."""
+    pages = _TextCounter(
+        iter_pdf_pages(
+            path,
+            executor=executor,
+            workers=max(1, cfg.loader_workers),
+            pages_per_task=cfg.pdf_pages_per_task,
+        ),
+        keep=extraction_cache is not None and sha256 is not None,
+    )
+    summary = summarize_document_stream(cfg, llm, pages, chunk_pool)
+    status = "ok"
+    if not pages.has_text:
+        summary = EMPTY_SUMMARY
+        status = "empty"
+
+    if pages.parts is not None and extraction_cache is not None and sha256 is not None:
+        text = "\n\n".join(pages.parts).strip()
+        extraction_cache.put(sha256, LoadedDoc(path=path, text=text, loader="pdf_stream"), pages.extract_sec)
+
+    meta = {
+        "file": path.name,
+        "loader": "pdf_stream",
+        "text_len": pages.text_len,
+        "status": status,
+    }
+    return summary, meta
+
+
+@dataclass
+class _Job:
+    key: str
+    item: FileItem
+    check: FileCheck
+    # Уже извлечённый текст (из кэша извлечения или предварительного прохода)
+    loaded: Optional[LoadedDoc] = None
+    extract_cached: bool = False
+    # Загрузка, уже отправленная в пул процессов
+    loaded_future: Optional[Future] = None
+
+
+@dataclass
+class _RunContext:
+    """Общее для всех файлов одного запуска."""
+
+    cfg: AppConfig
+    llm: OpenRouterClient
+    loader_pool: Optional[Executor] = None
+    # Запросы по чанкам всех документов запуска (один пул, а не по пулу на документ)
+    chunk_pool: Optional[Executor] = None
+    extraction_cache: Optional[ExtractionCache] = None
+    near_dups: Optional[NearDupIndex[Future]] = None
+    boilerplate: Optional[BoilerplateIndex] = None
+    batcher: Optional[DocBatcher] = None
+
+    @property
+    def stream_pdfs(self) -> bool:
+        # Для индекса типового текста нужен полный текст всех файлов заранее
+        return self.cfg.pdf_stream_min_pages > 0 and self.boilerplate is None
+
+
+def _summarize_or_reuse(ctx: _RunContext, key: str, loaded: LoadedDoc) -> Tuple[str, Dict[str, Any]]:
+    """
+    Саммари документа с учётом почти-дубликатов.
+
+    Первый файл группы (представитель) суммаризируется как обычно; остальные ждут
+    его саммари и берут его себе, не тратя запросы к LLM. В meta копии пишется,
+    дубликатом какого файла она признана и с каким сходством.
+    """
+    near_dups = ctx.near_dups
+    if near_dups is None or not (loaded.text or "").strip():
+        return summarize_loaded(ctx.cfg, ctx.llm, loaded, ctx.boilerplate, ctx.batcher, ctx.chunk_pool, key)
+
+    done: Future = Future()
+    match = near_dups.find_or_add(key, near_dups.sketch(loaded.text), done)
+
+    if match is None:
+        try:
+            summary, meta = summarize_loaded(ctx.cfg, ctx.llm, loaded, ctx.boilerplate, ctx.batcher, ctx.chunk_pool, key)
+        except BaseException as e:
+            done.set_exception(e)
+            raise
+        done.set_result(summary)
+        return summary, meta
+
+    try:
+        summary = match.value.result()
+    except Exception:
+        # У представителя не получилось — суммаризируем копию сами
+        return summarize_loaded(ctx.cfg, ctx.llm, loaded, ctx.boilerplate, ctx.batcher, ctx.chunk_pool, key)
+
+    meta = {
+        "file": loaded.path.name,
+        "loader": loaded.loader,
+        "text_len": len(loaded.text),
+        "status": "ok",
+        "duplicate_of": match.key,
+        "similarity": round(match.similarity, 3),
+    }
+    return summary, meta
+
+
+def _load(ctx: _RunContext, job: _Job) -> LoadedDoc:
+    """Текст файла: готовый, из уже запущенной загрузки или загрузить сейчас (+ в кэш)."""
+    if job.loaded is not None:
+        return job.loaded
+
+    if job.loaded_future is not None:
+        loaded, extract_sec = job.loaded_future.result()
+    else:
+        loaded, extract_sec = load_document_timed(job.item.path)
+
+    if ctx.extraction_cache is not None and job.check.sha256 is not None:
+        ctx.extraction_cache.put(job.check.sha256, loaded, extract_sec)
+    return loaded
+
+
+def _process(ctx: _RunContext, job: _Job) -> FileResult:
+    # Все вызовы LLM по файлу (включая чанки в других потоках) помечаются его ключом,
+    # итог по ним пишется в meta["llm"]
+    try:
+        with llm_scope(file=job.key):
+            res = _process_file(ctx, job)
+    finally:
+        # И при ошибке: иначе итог по упавшему файлу навсегда остаётся в памяти
+        # (долгоживущие --watch / --serve)
+        calls = ctx.llm.telemetry.pop_file(job.key)
+    if calls is not None:
+        res.meta["llm"] = calls
+        if calls["models"]:
+            # Какая модель написала саммари (при пуле — та, что ответила на большинство вызовов)
+            res.meta["model"] = max(calls["models"], key=calls["models"].get)
+    return res
+
+
+def _process_file(ctx: _RunContext, job: _Job) -> FileResult:
+    item = job.item
+    cfg = ctx.cfg
+
+    if job.loaded is None and job.loaded_future is None and item.ext == ".pdf" and ctx.stream_pdfs:
+        if pdf_page_count(item.path) >= cfg.pdf_stream_min_pages:
+            # Потоковые PDF в поиске дубликатов не участвуют: текст целиком появляется
+            # только к концу саммари
+            summary, meta = summarize_pdf_stream(
+                cfg,
+                ctx.llm,
+                item.path,
+                ctx.loader_pool,
+                sha256=job.check.sha256,
+                extraction_cache=ctx.extraction_cache,
+                chunk_pool=ctx.chunk_pool,
+            )
+            return FileResult(key=job.key, path=item.path, summary=summary, meta=meta, check=job.check)
+        if ctx.loader_pool is not None:
+            job.loaded_future = ctx.loader_pool.submit(load_document_timed, item.path)
+
+    summary, meta = _summarize_or_reuse(ctx, job.key, _load(ctx, job))
+    if job.extract_cached:
+        meta["extract_cached"] = True
+    return FileResult(key=job.key, path=item.path, summary=summary, meta=meta, check=job.check)
+
+
+def _make_job(ctx: _RunContext, key: str, item: FileItem, check: FileCheck) -> _Job:
+    """Задание на файл: текст из кэша извлечения или загрузка, сразу отправленная в пул."""
+    job = _Job(key=key, item=item, check=check)
+
+    if ctx.extraction_cache is not None:
+        # Хэш всё равно нужен манифесту — считаем один раз здесь
+        if check.sha256 is None:
+            check.sha256 = file_sha256(item.path)
+        job.loaded = ctx.extraction_cache.get(item.path, check.sha256)
+        job.extract_cached = job.loaded is not None
+
+    # PDF: большой или нет, решает поток обработки (большие идут потоково)
+    if (
+        job.loaded is None
+        and ctx.loader_pool is not None
+        and not (item.ext == ".pdf" and ctx.stream_pdfs)
+    ):
+        job.loaded_future = ctx.loader_pool.submit(load_document_timed, item.path)
+    return job
+
+
+def _index_boilerplate(
+    ctx: _RunContext,
+    items: List[FileItem],
+    manifest: Manifest,
+    fingerprint: str,
+) -> Dict[str, _Job]:
+    """
+    Предварительный проход для индекса типового текста: извлекает текст всех
+    изменённых файлов (в пуле процессов) и учитывает его в ctx.boilerplate.
+    Неизменённые файлы тоже учитываются, если их текст есть в кэше извлечения.
+    Возвращает задания с уже загруженным текстом — второй раз файлы не читаются.
+    """
+    assert ctx.boilerplate is not None
+    jobs: Dict[str, _Job] = {}
+
+    for item in items:
+        key = item.path.relative_to(ctx.cfg.docs_dir).as_posix()
+        check = manifest.check(key, item.path, fingerprint)
+        if check is None:
+            # Файл удалили после обхода папки
+            continue
+        if check.entry is not None:
+            if ctx.extraction_cache is not None and check.sha256:
+                cached = ctx.extraction_cache.get(item.path, check.sha256)
+                if cached is not None:
+                    ctx.boilerplate.add(cached.text)
+            continue
+        jobs[key] = _make_job(ctx, key, item, check)
+
+    for job in jobs.values():
+        job.loaded = _load(ctx, job)
+        job.loaded_future = None
+        ctx.boilerplate.add(job.loaded.text)
+    return jobs
+
+
+def run_pipeline(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    items: Iterable[FileItem],
+    manifest: Manifest,
+    fingerprint: str,
+    extraction_cache: Optional[ExtractionCache] = None,
+    boilerplate: Optional[BoilerplateIndex] = None,
+    batcher: Optional[DocBatcher] = None,
+    loader_pool: Optional[Executor] = None,
+) -> Iterator[FileResult]:
+    """
+    Конвейер обработки файлов.
+
+    - загрузка/OCR идёт в пуле процессов (cfg.loader_workers, 0 — в потоке обработки)
+    - большие PDF (от cfg.pdf_stream_min_pages страниц) извлекаются по диапазонам страниц
+      в том же пуле, а саммари их чанков начинаются до конца извлечения
+    - извлечённый текст берётся из кэша извлечения (по sha256 файла), если он там есть
+    - почти-дубликаты (cfg.near_dup_threshold) не суммаризируются повторно:
+      копия получает саммари первого файла своей группы
+    - с boilerplate сначала извлекается текст всех файлов и строится индекс
+      типового текста, который затем вырезается перед чанкингом (потоковой
+      обработки PDF в этом режиме нет)
+    - с batcher короткие документы суммаризируются пакетом, по нескольку в запросе
+    - саммари файлов идут в пуле потоков; число одновременных запросов к LLM
+      ограничивает сам клиент (cfg.llm_concurrency)
+    - результаты отдаются строго в порядке items, в памяти держится
+      только скользящее окно незавершённых файлов
+    - loader_pool — уже запущенный пул загрузки (долгоживущий сервис): тогда свой
+      пул не создаётся, а переданный по окончании не закрывается
+    """
+    ctx = _RunContext(
+        cfg=cfg,
+        llm=llm,
+        extraction_cache=extraction_cache,
+        boilerplate=boilerplate,
+        batcher=batcher,
+    )
+    # Загрузка без пула процессов идёт в этом процессе — с настройками OCR этого запуска
+    configure_ocr(ocr_settings(cfg))
+    own_loader_pool = loader_pool is None and cfg.loader_workers > 0
+    if own_loader_pool:
+        ctx.loader_pool = ProcessPoolExecutor(
+            max_workers=cfg.loader_workers, initializer=ocr_worker_init, initargs=(ocr_settings(cfg),)
+        )
+    else:
+        ctx.loader_pool = loader_pool
+    if cfg.near_dup_threshold > 0:
+        ctx.near_dups = NearDupIndex(cfg.near_dup_threshold)
+
+    # Потоков чуть больше, чем слотов LLM: пока одни ждут сеть, другие ждут загрузку
+    llm_pool = ThreadPoolExecutor(max_workers=cfg.llm_concurrency * 2, thread_name_prefix="summarize")
+    # Чанки — листовые задачи (сами ничего в пул не ставят), так что общий пул не заклинит
+    ctx.chunk_pool = ThreadPoolExecutor(max_workers=cfg.llm_concurrency, thread_name_prefix="chunk")
+    window = cfg.llm_concurrency * 2 + max(1, cfg.loader_workers)
+
+    pending: Deque[Union[FileResult, Future]] = deque()
+
+    def _pop() -> FileResult:
+        head = pending.popleft()
+        return head if isinstance(head, FileResult) else head.result()
+
+    try:
+        prepared: Dict[str, _Job] = {}
+        if boilerplate is not None:
+            items = list(items)
+            prepared = _index_boilerplate(ctx, items, manifest, fingerprint)
+
+        for item in items:
+            key = item.path.relative_to(cfg.docs_dir).as_posix()
+
+            job = prepared.pop(key, None)
+            if job is None:
+                check = manifest.check(key, item.path, fingerprint)
+                if check is None:
+                    # Файл удалили после обхода папки: результата по нему нет,
+                    # и из манифеста он уйдёт как удалённый
+                    continue
+                if check.entry is not None:
+                    pending.append(
+                        FileResult(
+                            key=key,
+                            path=item.path,
+                            summary=check.entry.summary,
+                            meta=check.entry.meta,
+                            check=check,
+                            reused=True,
+                        )
+                    )
+                else:
+                    job = _make_job(ctx, key, item, check)
+
+            if job is not None:
+                pending.append(llm_pool.submit(_process, ctx, job))
+
+            while len(pending) > window:
+                yield _pop()
+
+        while pending:
+            yield _pop()
+    finally:
+        for f in pending:
+            if isinstance(f, Future):
+                f.cancel()
+        llm_pool.shutdown(wait=True, cancel_futures=True)
+        ctx.chunk_pool.shutdown(wait=True, cancel_futures=True)
+        if own_loader_pool:
+            ctx.loader_pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,506 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import queue
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from config import AppConfig
+from src.llm.openrouter_client import OpenRouterClient
+from src.loaders.cache import ExtractionCache
+from src.loaders.ocr import ocr_settings, ocr_worker_init
+from src.pipeline import FileResult, run_pipeline
+from src.summarize.batch import DocBatcher
+from src.summarize.summarize_folder import summarize_folder
+from src.utils.files import DEFAULT_EXTS, FileItem, walk_files
+from src.utils.manifest import Manifest, run_fingerprint
+
+
+log = logging.getLogger(__name__)
+
+_UPLOAD_BLOCK = 1 << 20
+# Тело JSON-запросов (POST /jobs/folder): путь к папке, больше не нужно
+_MAX_JSON_BODY = 64 << 10
+# Сколько секунд можно ждать готовности задания в GET /jobs/<id>?wait=
+_MAX_WAIT_SEC = 60.0
+
+
+class ServiceBusy(RuntimeError):
+    """Очередь заданий заполнена: клиенту стоит повторить через retry_after секунд."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Очередь заданий заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """Задание сервиса: один загруженный документ или папка внутри SERVICE_ROOT."""
+
+    id: str
+    kind: str  # document | folder
+    source: str  # имя загруженного файла или путь папки
+    created: float = field(default_factory=time.time)
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    total: int = 0
+    done: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    files: List[Dict[str, Any]] = field(default_factory=list)
+    folder_summary: Optional[str] = None
+    error: Optional[str] = None
+    # Загруженный файл (для документа); удаляется после обработки
+    upload: Optional[Path] = None
+    finished_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self, *, results: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "id": self.id,
+            "kind": self.kind,
+            "source": self.source,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+        }
+        if self.started is not None:
+            data["queued_sec"] = round(self.started - self.created, 3)
+        if self.started is not None and self.finished is not None:
+            data["run_sec"] = round(self.finished - self.started, 3)
+        if self.error:
+            data["error"] = self.error
+        if results and self.status == "done":
+            data["files"] = self.files
+            if self.kind == "folder":
+                data["folder_summary"] = self.folder_summary
+        return data
+
+
+class SummaryService:
+    """
+    Саммари по запросу для других инструментов (main.py --serve).
+
+    Клиент LLM (с пулом соединений, лимитером и кэшем ответов), кэш извлечения,
+    упаковщик пакетов и пул процессов загрузки создаются один раз и общие для всех
+    заданий — запрос не платит за запуск CLI и «холодные» кэши.
+
+    - задания ставятся в очередь длиной cfg.service_queue_size; очередь полна —
+      ServiceBusy (HTTP 429 с Retry-After), а не бесконечное ожидание
+    - одновременно выполняется cfg.service_workers заданий; число запросов к LLM
+      в сумме ограничивает сам клиент (cfg.llm_concurrency)
+    - у заданий-папок свой манифест (output/service_manifest.json): неизменённые
+      файлы между запросами не суммаризируются заново
+    - готовые задания хранятся cfg.service_job_ttl_sec, потом забываются
+    """
+
+    def __init__(
+        self,
+        cfg: AppConfig,
+        llm: OpenRouterClient,
+        extraction_cache: Optional[ExtractionCache] = None,
+        batcher: Optional[DocBatcher] = None,
+    ) -> None:
+        self.cfg = cfg
+        self.llm = llm
+        self.extraction_cache = extraction_cache
+        self.batcher = batcher
+        self.fingerprint = run_fingerprint(cfg)
+        self.manifest = Manifest.load(cfg.output_dir / "service_manifest.json")
+        self.upload_dir = cfg.output_dir / "uploads"
+        self.queue: "queue.Queue[Job]" = queue.Queue(maxsize=cfg.service_queue_size)
+        self.jobs: Dict[str, Job] = {}
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Скользящая средняя длительности задания — для оценки Retry-After
+        self._job_sec: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self.loader_pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> "SummaryService":
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        if self.cfg.loader_workers > 0:
+            self.loader_pool = ProcessPoolExecutor(
+                max_workers=self.cfg.loader_workers,
+                initializer=ocr_worker_init,
+                initargs=(ocr_settings(self.cfg),),
+            )
+            # Процессы поднимаются заранее, а не на первом запросе
+            for f in [self.loader_pool.submit(time.sleep, 0) for _ in range(self.cfg.loader_workers)]:
+                f.result()
+        for i in range(self.cfg.service_workers):
+            t = threading.Thread(target=self._worker, name=f"service-job-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        return self
+
+    def close(self) -> None:
+        """Новые задания не берутся; выполняющиеся дорабатывают, ждущие в очереди отменяются."""
+        self._stop.set()
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._cleanup(job)
+            job.status = "cancelled"
+            job.finished_event.set()
+        for t in self._workers:
+            t.join()
+        self.manifest.save()
+        if self.loader_pool is not None:
+            self.loader_pool.shutdown(wait=True, cancel_futures=True)
+
+    # --- постановка заданий ---
+
+    def _retry_after(self) -> int:
+        per_job = self._job_sec or 5.0
+        backlog = self.queue.qsize() + self.running
+        return max(1, min(300, math.ceil(per_job * backlog / self.cfg.service_workers)))
+
+    def _busy(self) -> ServiceBusy:
+        with self._lock:
+            self.rejected += 1
+        return ServiceBusy(self._retry_after())
+
+    def check_capacity(self) -> None:
+        """ServiceBusy, если очередь уже полна (проверка до чтения тела запроса)."""
+        if self.queue.full():
+            raise self._busy()
+
+    def _enqueue(self, job: Job) -> Job:
+        self._expire()
+        with self._lock:
+            self.jobs[job.id] = job
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job.id]
+            self._cleanup(job)
+            raise self._busy() from None
+        return job
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.cfg.service_job_ttl_sec
+        with self._lock:
+            old = [j.id for j in self.jobs.values() if j.finished is not None and j.finished < cutoff]
+            for job_id in old:
+                del self.jobs[job_id]
+
+    def submit_document(self, name: str, body: BinaryIO, length: int) -> Job:
+        """Задание на загруженный документ: тело (length байт) пишется на диск потоково."""
+        name = Path(name.replace("\\", "/")).name
+        ext = Path(name).suffix.lower()
+        if not name or ext not in DEFAULT_EXTS:
+            raise ValueError(f"Неподдерживаемый файл: {name!r} (нужно одно из {', '.join(sorted(DEFAULT_EXTS))})")
+        self.check_capacity()
+
+        job = Job(id=uuid.uuid4().hex[:12], kind="document", source=name)
+        job.upload = self.upload_dir / job.id / name
+        job.upload.parent.mkdir(parents=True)
+        left = length
+        with job.upload.open("wb") as f:
+            while left > 0:
+                block = body.read(min(_UPLOAD_BLOCK, left))
+                if not block:
+                    break
+                f.write(block)
+                left -= len(block)
+        if left:
+            self._cleanup(job)
+            raise ValueError(f"Загрузка оборвалась: получено {length - left} из {length} байт")
+        return self._enqueue(job)
+
+    def submit_folder(self, path: str) -> Job:
+        """Задание на папку: путь внутри SERVICE_ROOT (абсолютный или относительно него)."""
+        root = self.cfg.service_root
+        folder = (root / path).resolve()
+        if not folder.is_relative_to(root):
+            raise ValueError(f"Папка вне SERVICE_ROOT ({root}): {path}")
+        if not folder.is_dir():
+            raise ValueError(f"Папка не найдена: {path}")
+        return self._enqueue(Job(id=uuid.uuid4().hex[:12], kind="folder", source=str(folder)))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self.queue.qsize(),
+                "queue_size": self.cfg.service_queue_size,
+                "running": self.running,
+                "workers": self.cfg.service_workers,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_job_sec": round(self._job_sec, 3) if self._job_sec is not None else None,
+            }
+
+    # --- выполнение ---
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            self.running += 1
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if job.kind == "document":
+                self._run_document(job)
+            else:
+                self._run_folder(job)
+            job.status = "done"
+        except Exception as e:
+            log.error("Job %s (%s) failed: %s", job.id, job.source, e)
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            self._cleanup(job)
+            job.finished = time.time()
+            elapsed = job.finished - job.started
+            with self._lock:
+                self.running -= 1
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._job_sec = elapsed if self._job_sec is None else self._job_sec + 0.2 * (elapsed - self._job_sec)
+            job.finished_event.set()
+
+    def _file_entry(self, job: Job, res: FileResult) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"file": res.path.name, "summary": res.summary, "meta": res.meta}
+        if job.kind == "folder":
+            entry["path"] = res.path.relative_to(job.source).as_posix()
+        if res.reused:
+            entry["reused"] = True
+        return entry
+
+    def _run_document(self, job: Job) -> None:
+        assert job.upload is not None
+        # Ключ файла — "<id задания>/<имя>": уникален, телеметрия заданий не смешивается.
+        # Загрузки в манифест не пишутся (повторы дешёвые за счёт кэшей извлечения и ответов)
+        cfg = replace(self.cfg, docs_dir=self.upload_dir)
+        job.total = 1
+        item = FileItem(path=job.upload, ext=job.upload.suffix.lower())
+        results = run_pipeline(
+            cfg,
+            self.llm,
+            [item],
+            Manifest(self.upload_dir / "manifest.json"),
+            self.fingerprint,
+            self.extraction_cache,
+            None,
+            self.batcher,
+            self.loader_pool,
+        )
+        for res in results:
+            job.files.append(self._file_entry(job, res))
+            job.done += 1
+
+    def _run_folder(self, job: Job) -> None:
+        cfg = replace(self.cfg, docs_dir=self.cfg.service_root)
+        items = list(
+            walk_files(
+                Path(job.source),
+                include=cfg.docs_include,
+                exclude=cfg.docs_exclude,
+                max_depth=cfg.docs_max_depth,
+                workers=cfg.docs_walk_workers,
+                sort=True,
+            )
+        )
+        job.total = len(items)
+
+        summaries: Dict[str, str] = {}
+        duplicates: Dict[str, str] = {}
+        results = run_pipeline(
+            cfg,
+            self.llm,
+            items,
+            self.manifest,
+            self.fingerprint,
+            self.extraction_cache,
+            None,
+            self.batcher,
+            self.loader_pool,
+        )
+        for res in results:
+            if not res.reused:
+                self.manifest.put(res.key, res.path, res.check, self.fingerprint, res.summary, res.meta)
+            job.files.append(self._file_entry(job, res))
+            # Ключ — путь относительно SERVICE_ROOT: одноимённые файлы из разных подпапок не затирают друг друга
+            summaries[res.key] = res.summary
+            if res.meta.get("duplicate_of"):
+                duplicates[res.key] = res.meta["duplicate_of"]
+            job.done += 1
+
+        job.folder_summary = summarize_folder(cfg, self.llm, summaries, duplicates)
+        self.manifest.save()
+
+    def _cleanup(self, job: Job) -> None:
+        if job.upload is not None:
+            shutil.rmtree(job.upload.parent, ignore_errors=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "ServiceHTTPServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        log.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"code": status, "message": message}}, headers)
+
+    def _reject(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        # Тело запроса не дочитано — соединение дальше не используем
+        self.close_connection = True
+        self._error(status, message, {**(headers or {}), "Connection": "close"})
+
+    def _accepted(self, job: Job) -> None:
+        self._send_json(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        service = self.server.service
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", **service.stats()})
+        elif parts == ["jobs"]:
+            self._send_json(200, [job.to_dict(results=False) for job in service.list_jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = service.get(parts[1])
+            if job is None:
+                self._error(404, "job not found")
+                return
+            # ?wait=N — подождать завершения задания до N секунд (long polling)
+            wait = parse_qs(url.query).get("wait")
+            if wait:
+                try:
+                    job.finished_event.wait(min(_MAX_WAIT_SEC, max(0.0, float(wait[0]))))
+                except ValueError:
+                    self._error(400, "wait must be a number")
+                    return
+            self._send_json(200, job.to_dict())
+        else:
+            self._error(404, "not found")
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._reject(400, "bad Content-Length")
+            return
+
+        if url.path.rstrip("/") == "/jobs/document":
+            name = (parse_qs(url.query).get("name") or [self.headers.get("X-Filename", "")])[0]
+            limit = self.server.max_upload_bytes
+            if length <= 0:
+                self._reject(411, "Content-Length required")
+                return
+            if length > limit:
+                self._reject(413, f"file is larger than {limit // (1 << 20)} MB")
+                return
+            try:
+                job = service.submit_document(name, self.rfile, length)
+            except ServiceBusy as e:
+                self._reject(429, str(e), {"Retry-After": str(e.retry_after)})
+                return
+            except ValueError as e:
+                self._reject(400, str(e))
+                return
+            self._accepted(job)
+            return
+
+        if length > _MAX_JSON_BODY:
+            self._reject(413, f"request body is larger than {_MAX_JSON_BODY // 1024} KB")
+            return
+        raw = self.rfile.read(length)
+        if url.path.rstrip("/") == "/jobs/folder":
+            try:
+                path = json.loads(raw.decode("utf-8"))["path"]
+                job = service.submit_folder(str(path))
+            except ServiceBusy as e:
+                self._error(429, str(e), {"Retry-After": str(e.retry_after)})
+                return
+            except (ValueError, KeyError, TypeError) as e:
+                self._error(400, f"bad request: {e}")
+                return
+            self._accepted(job)
+            return
+
+        self._error(404, "not found")
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    """HTTP-обёртка над SummaryService; потоки соединений лёгкие — работа идёт в пуле заданий."""
+
+    daemon_threads = True
+
+    def __init__(self, service: SummaryService, host: str, port: int, max_upload_mb: int) -> None:
+        super().__init__((host, port), _Handler)
+        self.service = service
+        self.max_upload_bytes = max_upload_mb << 20
+
+
+def serve(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    extraction_cache: Optional[ExtractionCache] = None,
+    batcher: Optional[DocBatcher] = None,
+) -> None:
+    """Запускает сервис и обслуживает запросы до Ctrl-C."""
+    service = SummaryService(cfg, llm, extraction_cache, batcher).start()
+    server = ServiceHTTPServer(service, cfg.service_host, cfg.service_port, cfg.service_max_upload_mb)
+    host, port = server.server_address[:2]
+    print(
+        f"SERVICE: http://{host}:{port} | workers={cfg.service_workers} "
+        f"queue={cfg.service_queue_size} | folders under {cfg.service_root}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nSERVICE: stopping")
+    finally:
+        server.server_close()
+        service.close()
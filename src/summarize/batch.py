@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import AppConfig
+from src.llm.openrouter_client import OpenRouterClient, OpenRouterError
+from src.llm.prompts import SYSTEM_SUMMARIZER_RU, make_batch_summary_user_prompt
+from src.llm.telemetry import llm_scope
+from src.llm.tokens import TokenCounter, get_token_counter
+from src.summarize.continuation import finish_reason
+
+
+log = logging.getLogger(__name__)
+
+
+# Маркер раздела в ответе: "=== ДОКУМЕНТ 3 ===" (модель может добавить **, #, пробелы)
+_MARKER_RE = re.compile(r"^[#*\s]*=+\s*ДОКУМЕНТ\s+(\d+)\s*=+[*\s]*$", re.IGNORECASE | re.MULTILINE)
+
+# Ответ на пакет: на сводку одного документа закладываем столько токенов
+_OUTPUT_TOKENS_PER_DOC = 900
+_MAX_OUTPUT_TOKENS = 8000
+
+
+def parse_batch_response(text: str, n_docs: int) -> Dict[int, str]:
+    """
+    Разбирает ответ на пакетный запрос по маркерам "=== ДОКУМЕНТ n ===".
+    Возвращает {номер документа (с 1): сводка}; документы без своего раздела,
+    с пустым или повторным разделом в результат не попадают.
+    """
+    marks = [(m.start(), m.end(), int(m.group(1))) for m in _MARKER_RE.finditer(text or "")]
+    sections: Dict[int, str] = {}
+    repeated = set()
+    for i, (_, end, n) in enumerate(marks):
+        body_end = marks[i + 1][0] if i + 1 < len(marks) else len(text)
+        body = text[end:body_end].strip()
+        if not 1 <= n <= n_docs:
+            continue
+        if n in sections:
+            repeated.add(n)
+            continue
+        if body:
+            sections[n] = body
+    for n in repeated:
+        sections.pop(n, None)
+    return sections
+
+
+@dataclass
+class _Batch:
+    texts: List[str] = field(default_factory=list)
+    keys: List[str] = field(default_factory=list)
+    # Токены текста каждого документа (по ним делится расход на пакет)
+    doc_tokens: List[int] = field(default_factory=list)
+    results: List[Future] = field(default_factory=list)
+    tokens: int = 0
+    # Пакет закрыт для новых документов (набран или уже отправлен)
+    closed: threading.Event = field(default_factory=threading.Event)
+
+
+class DocBatcher:
+    """
+    Упаковка коротких документов в один запрос к LLM.
+
+    Документ не длиннее doc_max_tokens вместо отдельного запроса попадает в общий
+    пакет. Пакет уходит, когда набран token_budget токенов текста или max_docs
+    документов, либо через linger_sec после первого документа — тот, кто открыл
+    пакет, его и отправляет. Ответ разбирается по маркерам разделов; документ,
+    чей раздел не нашёлся (или весь запрос не удался), получает None и
+    суммаризируется отдельным запросом как обычно.
+
+    summarize() блокирует до ответа; вызывается из потоков обработки файлов.
+    """
+
+    def __init__(
+        self,
+        llm: OpenRouterClient,
+        *,
+        token_budget: int,
+        doc_max_tokens: int,
+        max_docs: int = 8,
+        linger_sec: float = 0.3,
+        counter: Optional[TokenCounter] = None,
+    ) -> None:
+        self.llm = llm
+        self.token_budget = token_budget
+        self.doc_max_tokens = doc_max_tokens
+        self.max_docs = max(2, max_docs)
+        self.linger_sec = linger_sec
+        self.counter = counter or get_token_counter()
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        # Итог по запуску
+        self.batches = 0
+        self.batched_docs = 0
+        self.fallback_docs = 0
+
+    def summarize(self, key: str, text: str) -> Optional[str]:
+        """
+        Сводка документа из пакета или None — суммаризировать отдельно.
+        key — ключ файла в телеметрии: на него записывается его доля вызова.
+        """
+        tokens = self.counter.count(text)
+        if tokens > self.doc_max_tokens:
+            return None
+
+        done: Future = Future()
+        with self._lock:
+            batch = self._open
+            if batch is not None and batch.tokens + tokens > self.token_budget:
+                # Не влезает — текущий пакет уходит без него, открываем новый
+                batch.closed.set()
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            batch.texts.append(text)
+            batch.keys.append(key)
+            batch.doc_tokens.append(tokens)
+            batch.results.append(done)
+            batch.tokens += tokens
+            if len(batch.texts) >= self.max_docs or batch.tokens >= self.token_budget:
+                batch.closed.set()
+            if batch.closed.is_set() and self._open is batch:
+                self._open = None
+
+        if leader:
+            batch.closed.wait(self.linger_sec)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+                batch.closed.set()
+            self._send(batch)
+
+        return done.result()
+
+    def _send(self, batch: _Batch) -> None:
+        sections: Dict[int, str] = {}
+        if len(batch.texts) > 1:
+            try:
+                sections = self._request(batch)
+            except OpenRouterError as e:
+                log.warning("Batch of %d documents failed, falling back to single calls: %s", len(batch.texts), e)
+            except BaseException as e:
+                for f in batch.results:
+                    f.set_exception(e)
+                raise
+
+        with self._lock:
+            if sections:
+                self.batches += 1
+                self.batched_docs += len(sections)
+            self.fallback_docs += len(batch.texts) - len(sections)
+        for i, f in enumerate(batch.results, start=1):
+            f.set_result(sections.get(i))
+
+    def _request(self, batch: _Batch) -> Dict[int, str]:
+        n = len(batch.texts)
+        max_tokens = min(_MAX_OUTPUT_TOKENS, _OUTPUT_TOKENS_PER_DOC * n)
+        # Пакет — не вызов какого-то одного файла: в телеметрии он отдельным этапом,
+        # а в итог по каждому файлу идёт доля вызова по токенам его текста
+        total = sum(batch.doc_tokens) or 1
+        shares = {k: t / total for k, t in zip(batch.keys, batch.doc_tokens)}
+        with llm_scope(file=None, files=shares, chunk=None, stage="batch"):
+            resp = self.llm.chat(
+                system=SYSTEM_SUMMARIZER_RU,
+                user=make_batch_summary_user_prompt(batch.texts),
+                max_tokens=max_tokens,
+            )
+
+        sections = parse_batch_response(resp.text, n)
+        if finish_reason(resp.raw) == "length" and sections:
+            # Ответ оборван: последний разобранный раздел, скорее всего, неполный
+            sections.pop(max(sections))
+        missing = [batch.keys[i - 1] for i in range(1, n + 1) if i not in sections]
+        if missing:
+            log.info("Batch response has no section for %d of %d documents: %s", len(missing), n, missing)
+        return sections
+
+
+def make_doc_batcher(cfg: AppConfig, llm: OpenRouterClient) -> Optional[DocBatcher]:
+    """Упаковщик по настройкам из конфига (None — каждый документ отдельным запросом)."""
+    if cfg.batch_token_budget <= 0:
+        return None
+    return DocBatcher(
+        llm,
+        token_budget=cfg.batch_token_budget,
+        doc_max_tokens=min(cfg.batch_doc_max_tokens, cfg.batch_token_budget),
+        max_docs=cfg.batch_max_docs,
+        linger_sec=cfg.batch_linger_ms / 1000.0,
+        counter=get_token_counter(cfg.tokenizer, cfg.token_count_scale),
+    )
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+from src.llm.tokens import TokenCounter, get_token_counter
+
+
+BOILERPLATE_PLACEHOLDER = "[типовой текст, повторяющийся в других документах папки, опущен]"
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _line_key(line: str) -> str:
+    """Хэш нормализованной строки: регистр и пробелы не важны."""
+    norm = _SPACE_RE.sub(" ", line).strip().lower()
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=8).hexdigest()
+
+
+@dataclass
+class StripResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    lines_removed: int
+
+    @property
+    def removed_pct(self) -> float:
+        if self.tokens_before <= 0:
+            return 0.0
+        return 100.0 * (self.tokens_before - self.tokens_after) / self.tokens_before
+
+
+class BoilerplateIndex:
+    """
+    Индекс типового текста по всей папке.
+
+    Единица — абзац в понимании загрузчиков: строка текста (DOCX отдаёт абзац строкой,
+    в PDF это строка вёрстки). Для каждой достаточно длинной строки считается,
+    в скольких документах она встречается; строки, которые есть хотя бы в min_docs
+    документах (стандартные условия, реквизиты, блоки подписей), перед чанкингом
+    заменяются одной отметкой на каждую подряд идущую серию.
+
+    Сначала add() по всем документам, потом strip(). Потокобезопасен.
+    """
+
+    def __init__(self, min_docs: int, *, min_chars: int = 40, counter: Optional[TokenCounter] = None) -> None:
+        self.min_docs = max(2, min_docs)
+        self.min_chars = min_chars
+        self.counter = counter or get_token_counter()
+        self._doc_freq: Counter = Counter()
+        self._docs = 0
+        self._lock = threading.Lock()
+        # Итог по запуску: сколько токенов пришло и сколько ушло в LLM
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def _keys(self, text: str) -> Set[str]:
+        return {_line_key(line) for line in text.splitlines() if len(line.strip()) >= self.min_chars}
+
+    def add(self, text: str) -> None:
+        """Учесть документ (каждая строка считается один раз на документ)."""
+        keys = self._keys(text)
+        with self._lock:
+            self._doc_freq.update(keys)
+            self._docs += 1
+
+    @property
+    def docs(self) -> int:
+        return self._docs
+
+    def is_boilerplate(self, line: str) -> bool:
+        if len(line.strip()) < self.min_chars:
+            return False
+        return self._doc_freq.get(_line_key(line), 0) >= self.min_docs
+
+    def strip(self, text: str) -> StripResult:
+        out: List[str] = []
+        removed = 0
+        in_run = False
+        skipped_blank = False
+
+        for line in text.splitlines():
+            if self.is_boilerplate(line):
+                removed += 1
+                if not in_run:
+                    out.append(BOILERPLATE_PLACEHOLDER)
+                    in_run = True
+                continue
+            # Пустые строки внутри серии типового текста серию не прерывают
+            if in_run and not line.strip():
+                skipped_blank = True
+                continue
+            if in_run and skipped_blank:
+                out.append("")
+            in_run = skipped_blank = False
+            out.append(line)
+
+        stripped = "\n".join(out).strip() if removed else text
+        before = self.counter.count(text)
+        after = self.counter.count(stripped) if removed else before
+
+        with self._lock:
+            self.tokens_before += before
+            self.tokens_after += after
+        return StripResult(text=stripped, tokens_before=before, tokens_after=after, lines_removed=removed)
+
+    def totals(self) -> Tuple[int, int, float]:
+        """(токенов до, токенов после, % удалено) за все strip() этого запуска."""
+        with self._lock:
+            before, after = self.tokens_before, self.tokens_after
+        pct = 100.0 * (before - after) / before if before else 0.0
+        return before, after, pct
@@ -1,23 +1,168 @@
 from __future__ import annotations
 
-from typing import List
+import re
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
 
+from src.llm.tokens import TokenCounter, get_token_counter
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
-    text = text.strip()
-    if not text:
-        return []
 
-    chunks: List[str] = []
-    start = 0
-    n = len(text)
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n[ \t]*\n+")
+# Конец предложения: . ! ? … (и закрывающие кавычки/скобки), затем пробел
+# и начало нового предложения с заглавной буквы, цифры или открывающей кавычки.
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…][»\"')\]])\s+|(?<=[.!?…])\s+(?=[«\"'(\[A-ZА-ЯЁ0-9—-])")
 
-    while start < n:
-        end = min(n, start + chunk_size)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end == n:
-            break
-        start = max(0, end - overlap)
+# (текст, токены, начинается ли с нового абзаца)
+_Unit = Tuple[str, int, bool]
 
-    return chunks
+
+def _iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Абзацы из потока кусков текста (например, страниц PDF).
+    Граница куска считается границей абзаца.
+    """
+    for piece in pieces:
+        if not piece:
+            continue
+        for para in _PARAGRAPH_SPLIT_RE.split(piece):
+            para = para.strip()
+            if para:
+                yield para
+
+
+def _split_sentences(paragraph: str) -> List[str]:
+    return [s for s in (x.strip() for x in _SENTENCE_SPLIT_RE.split(paragraph)) if s]
+
+
+def _split_run(run: str, max_tokens: int, counter: TokenCounter) -> Iterator[Tuple[str, int]]:
+    """Сплошная строка без пробелов длиннее бюджета (base64, длинный URL, OCR-каша) — режем по символам."""
+    rest = run
+    while rest:
+        t = counter.count(rest)
+        if t <= max_tokens:
+            yield rest, t
+            return
+        # Прикидка по доле символов, потом ужимаем, пока кусок не влезет
+        n = max(1, len(rest) * max_tokens // t)
+        while n > 1 and counter.count(rest[:n]) > max_tokens:
+            n = n * 3 // 4
+        yield rest[:n], counter.count(rest[:n])
+        rest = rest[n:]
+
+
+def _split_oversized(sentence: str, max_tokens: int, counter: TokenCounter) -> Iterator[Tuple[str, int]]:
+    """Предложение длиннее бюджета (таблицы, OCR-каша) — режем по словам, слишком длинное слово — по символам."""
+    words = sentence.split()
+    part: List[str] = []
+    part_tokens = 0
+    for w in words:
+        t = counter.count(w + " ")
+        if t > max_tokens:
+            if part:
+                yield " ".join(part), part_tokens
+                part, part_tokens = [], 0
+            yield from _split_run(w, max_tokens, counter)
+            continue
+        if part and part_tokens + t > max_tokens:
+            yield " ".join(part), part_tokens
+            part, part_tokens = [], 0
+        part.append(w)
+        part_tokens += t
+    if part:
+        yield " ".join(part), part_tokens
+
+
+def _join(units: Iterable[_Unit]) -> str:
+    out: List[str] = []
+    for text, _, new_para in units:
+        if out:
+            out.append("\n\n" if new_para else " ")
+        out.append(text)
+    return "".join(out)
+
+
+def iter_chunks(
+    source: str | Iterable[str],
+    max_tokens: int,
+    overlap_sentences: int = 1,
+    counter: Optional[TokenCounter] = None,
+) -> Iterator[str]:
+    """
+    Нарезает текст на чанки не больше max_tokens токенов.
+
+    - один линейный проход, чанки отдаются лениво по мере готовности
+      (source может быть генератором страниц — чанкинг начинается до конца загрузки)
+    - режем по границам абзацев; абзац, который не влезает, — по предложениям;
+      предложение длиннее бюджета — по словам, слово длиннее бюджета — по символам
+    - перекрытие между соседними чанками — последние overlap_sentences предложений
+      (но не больше четверти бюджета)
+    """
+    counter = counter or get_token_counter()
+    pieces = [source] if isinstance(source, str) else source
+    max_tokens = max(1, max_tokens)
+    overlap_budget = max_tokens // 4
+
+    current: List[_Unit] = []
+    current_tokens = 0
+    # Сколько предложений в текущем чанке новые (а не хвост перекрытия)
+    fresh = 0
+
+    def _flush() -> Iterator[str]:
+        nonlocal current, current_tokens, fresh
+        yield _join(current)
+
+        # Перекрытие: хвост из последних предложений (в пределах бюджета перекрытия)
+        tail: Deque[_Unit] = deque()
+        tail_tokens = 0
+        for unit in reversed(current):
+            if len(tail) >= overlap_sentences or tail_tokens + unit[1] > overlap_budget:
+                break
+            tail.appendleft(unit)
+            tail_tokens += unit[1]
+        current = list(tail)
+        current_tokens = tail_tokens
+        fresh = 0
+
+    for para in _iter_paragraphs(pieces):
+        units: List[_Unit] = []
+        for i, s in enumerate(_split_sentences(para)):
+            t = counter.count(s)
+            if t > max_tokens:
+                for j, (part, pt) in enumerate(_split_oversized(s, max_tokens, counter)):
+                    units.append((part, pt, i == 0 and j == 0))
+            else:
+                units.append((s, t, i == 0))
+        para_tokens = sum(u[1] for u in units)
+
+        # Абзац не влезает в остаток, но влезет в новый чанк — закрываем чанк
+        # на границе абзаца, если он уже заполнен хотя бы наполовину
+        if (
+            fresh
+            and current_tokens + para_tokens > max_tokens
+            and para_tokens <= max_tokens
+            and current_tokens >= max_tokens // 2
+        ):
+            yield from _flush()
+
+        for unit in units:
+            if current_tokens + unit[1] > max_tokens:
+                if fresh:
+                    yield from _flush()
+                if current_tokens + unit[1] > max_tokens:
+                    # хвост перекрытия + предложение не влезают — идём без перекрытия
+                    current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit[1]
+            fresh += 1
+
+    if fresh:
+        yield _join(current)
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int,
+    overlap_sentences: int = 1,
+    counter: Optional[TokenCounter] = None,
+) -> List[str]:
+    return list(iter_chunks(text, max_tokens, overlap_sentences, counter))
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from config import AppConfig
+from src.llm.openrouter_client import LLMResponse, OpenRouterClient, OpenRouterError, usage_total_tokens
+from src.llm.rate_limit import estimate_messages_tokens
+from src.llm.telemetry import llm_scope
+
+
+log = logging.getLogger(__name__)
+
+
+CONTINUE_USER_RU = (
+    "Ответ оборвался. Продолжи ровно с места обрыва и допиши до логического завершения. "
+    "Не повторяй уже написанное, не добавляй новых фактов, сохрани формат. "
+    "Если данных нет — пиши 'не найдено'."
+)
+
+
+def finish_reason(raw: dict) -> Optional[str]:
+    try:
+        choice = (raw.get("choices") or [{}])[0]
+        return choice.get("finish_reason")
+    except Exception:
+        return None
+
+
+def looks_truncated(text: str) -> bool:
+    t = (text or "").strip()
+    if not t:
+        return True
+    # если конец выглядит как обрыв (нет точки/закрытия/или заканчивается на "...")
+    bad_endings = (",", ":", "-", "(", "реальный", "упущенная", "и")
+    if t.endswith(bad_endings):
+        return True
+    # если последний символ не "конец мысли"
+    if t[-1] not in ".!?)]\"»":
+        return True
+    return False
+
+
+def needs_continuation(resp: LLMResponse) -> bool:
+    """
+    Нужно ли продолжение: модель упёрлась в max_tokens (finish_reason="length")
+    или текст выглядит оборванным — бесплатные модели нередко обрывают ответ
+    с finish_reason="stop". Лишние раунды ограничены числом раундов и бюджетом токенов.
+    """
+    return finish_reason(resp.raw) == "length" or looks_truncated(resp.text)
+
+
+@dataclass
+class ContinuationResult:
+    text: str
+    # Сколько раундов продолжения понадобилось и сколько токенов они стоили
+    rounds: int
+    tokens: int
+    # Ответ так и остался оборванным (кончились раунды или бюджет)
+    truncated: bool
+
+
+def _raw_content(resp: LLMResponse) -> str:
+    """Текст ответа без strip: при prefill важны пробел/перевод строки на стыке."""
+    try:
+        content = resp.raw["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        content = None
+    return content if isinstance(content, str) and content.strip() else resp.text
+
+
+def _join(prev: str, piece: str, prefill: bool) -> str:
+    if prefill:
+        return prev + piece
+    # В многоходовом режиме модель начинает новую реплику — склеиваем по границе
+    prev = prev.rstrip()
+    piece = piece.lstrip()
+    sep = "\n" if prev[-1:] in ("", ".", "!", "?", ":", ")", "»") else " "
+    return (prev + sep + piece).strip()
+
+
+def complete_truncated(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    system: str,
+    user: str,
+    first: LLMResponse,
+    *,
+    max_tokens: Optional[int] = 2200,
+) -> ContinuationResult:
+    """
+    Дописывает оборванный ответ first на запрос (system, user).
+
+    Продолжение — это тот же диалог: исходный запрос, уже полученный ответ
+    ассистентом и (в режиме multiturn) короткая просьба продолжить. В режиме prefill
+    диалог заканчивается самим ответом ассистента, и модель дописывает его с места обрыва.
+    Модель видит исходный контекст, а не только свой обрывок; отдельный системный
+    промпт «продолжателя» не нужен.
+
+    Раундов — не больше cfg.continuation_max_rounds; суммарно на продолжения тратится
+    не больше cfg.continuation_token_budget токенов (0 — без ограничения): раунд,
+    который по оценке выйдет за бюджет, не отправляется.
+    """
+    prefill = cfg.continuation_mode == "prefill"
+    budget = cfg.continuation_token_budget
+
+    text = _raw_content(first) if prefill else first.text
+    last = first
+    rounds = 0
+    spent = 0
+
+    while rounds < cfg.continuation_max_rounds and needs_continuation(last):
+        messages: List[Dict[str, str]] = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+            {"role": "assistant", "content": text},
+        ]
+        if not prefill:
+            messages.append({"role": "user", "content": CONTINUE_USER_RU})
+
+        est = estimate_messages_tokens(messages, max_tokens)
+        if budget > 0 and spent + est > budget:
+            log.info("Continuation budget exhausted: spent %d + next ~%d > %d tokens", spent, est, budget)
+            break
+
+        try:
+            with llm_scope(stage="continuation"):
+                resp = llm.chat_messages(messages, max_tokens=max_tokens)
+        except OpenRouterError as e:
+            # Недописанный ответ лучше, чем никакого
+            log.warning("Continuation round %d failed: %s", rounds + 1, e)
+            break
+
+        rounds += 1
+        used = usage_total_tokens(resp.raw) or est
+        spent += used
+        log.debug("Continuation round %d: %d tokens (total %d)", rounds, used, spent)
+
+        text = _join(text, _raw_content(resp) if prefill else resp.text, prefill)
+        last = resp
+
+    return ContinuationResult(text=text.strip(), rounds=rounds, tokens=spent, truncated=needs_continuation(last))
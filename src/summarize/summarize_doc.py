@@ -1,98 +1,104 @@
 from __future__ import annotations
 
-from typing import List
+import contextvars
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional
 
 from config import AppConfig
-from src.llm.openrouter_client import OpenRouterClient
+from src.llm.openrouter_client import LLMResponse, OpenRouterClient
 from src.llm.prompts import SYSTEM_SUMMARIZER_RU, make_doc_summary_user_prompt
-from src.summarize.chunking import chunk_text
-
-
-def _finish_reason_is_length(resp_raw: dict) -> bool:
-    try:
-        choice = (resp_raw.get("choices") or [{}])[0]
-        return choice.get("finish_reason") == "length"
-    except Exception:
-        return False
-
-
-def _looks_truncated(text: str) -> bool:
-    t = (text or "").strip()
-    if not t:
-        return True
-    # если конец выглядит как обрыв (нет точки/закрытия/или заканчивается на "...")
-    bad_endings = (",", ":", "-", "(", "реальный", "упущенная", "и")
-    if t.endswith(bad_endings):
-        return True
-    # если последний символ не "конец мысли"
-    if t[-1] not in ".!?)]\"»":
-        return True
-    return False
-
-
-def summarize_document_text(cfg: AppConfig, llm: OpenRouterClient, text: str) -> str:
-    chunks = chunk_text(text, cfg.chunk_size_chars, cfg.chunk_overlap_chars)
-    if not chunks:
+from src.llm.telemetry import llm_scope
+from src.llm.tokens import get_token_counter
+from src.summarize.chunking import iter_chunks
+from src.summarize.continuation import complete_truncated
+
+
+def summarize_document_text(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    text: str,
+    executor: Optional[Executor] = None,
+) -> str:
+    return summarize_document_stream(cfg, llm, [text], executor)
+
+
+def summarize_document_stream(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    pieces: Iterable[str],
+    executor: Optional[Executor] = None,
+) -> str:
+    """
+    Саммари документа, текст которого приходит кусками (например, страницами PDF).
+    Чанки нарезаются на лету, и каждый готовый чанк сразу уходит в LLM —
+    не дожидаясь, пока загрузится весь документ.
+
+    executor — общий пул для чанков (конвейер держит один на весь запуск);
+    без него пул создаётся на этот документ.
+    """
+    counter = get_token_counter(cfg.tokenizer, cfg.token_count_scale)
+    chunks = iter_chunks(pieces, cfg.chunk_size_tokens, cfg.chunk_overlap_sentences, counter)
+
+    first = next(chunks, None)
+    if first is None:
         return "Документ пустой или текст не извлечён."
 
-    # Если документ маленький — суммарим сразу
-    if len(chunks) == 1:
-        resp = llm.chat(
-            system=SYSTEM_SUMMARIZER_RU,
-            user=make_doc_summary_user_prompt(chunks[0]),
-            max_tokens=2200,
-        )
-
-        result = resp.text
-        last_raw = resp.raw  # <-- важно: храним raw последнего ответа
-
-        # Автопродолжение: максимум 2 попытки
-        for _ in range(2):
-            if not (_finish_reason_is_length(last_raw) or _looks_truncated(result)):
-                break
-
-            cont = llm.chat(
-                system="Ты продолжаешь текст. Не повторяй уже написанное. Сохрани стиль и формат.",
-                user=(
-                    "Текст оборвался. Продолжи с места обрыва и допиши до логического завершения.\n\n"
-                    "ВАЖНО: Не повторяй уже написанное. Не добавляй новых фактов. "
-                    "Если данных нет — пиши 'не найдено'.\n\n"
-                    "ТЕКСТ, КОТОРЫЙ УЖЕ ЕСТЬ:\n"
-                    f"{result}\n\n"
-                    "ПРОДОЛЖЕНИЕ (только недостающая часть):"
-                ),
-                max_tokens=1200,
+    def _summarize_chunk(ch: str, idx: int) -> LLMResponse:
+        with llm_scope(stage="chunk", chunk=idx):
+            return llm.chat(
+                system=SYSTEM_SUMMARIZER_RU,
+                user=make_doc_summary_user_prompt(ch),
+                max_tokens=2200,
             )
 
-            # Добавляем продолжение
-            result = (result.rstrip() + "\n" + cont.text.lstrip()).strip()
-            last_raw = cont.raw  # <-- важно: обновляем raw
-
-        return result
+    def _submit(ch: str, idx: int) -> Future:
+        # Метки телеметрии (файл) передаём в поток чанка вместе с контекстом
+        return pool.submit(contextvars.copy_context().run, _summarize_chunk, ch, idx)
 
-
-
-    # Если кусков много — суммарим по кускам, потом объединяем
-    partial_summaries: List[str] = []
-    for idx, ch in enumerate(chunks, start=1):
-        resp = llm.chat(
-            system=SYSTEM_SUMMARIZER_RU,
-            user=make_doc_summary_user_prompt(ch),
-            max_tokens=2200,
-        )
-        partial_summaries.append(f"### Часть {idx}\n{resp.text}")
+    # Общий лимит одновременных запросов держит клиент (cfg.llm_concurrency),
+    # поэтому параллельные документы не превышают его в сумме.
+    own_pool = executor is None
+    pool = executor or ThreadPoolExecutor(max_workers=cfg.llm_concurrency, thread_name_prefix="chunk")
+    futures: List[Future] = []
+    try:
+        # Первый чанк отправляем сразу: для одночанкового документа это тот же самый запрос
+        futures.append(_submit(first, 1))
+
+        # Остальные чанки отправляем по мере нарезки (генератор может ещё читать страницы)
+        for ch in chunks:
+            futures.append(_submit(ch, len(futures) + 1))
+
+        # Если документ маленький — одна сводка + автопродолжение
+        if len(futures) == 1:
+            return complete_truncated(
+                cfg,
+                llm,
+                SYSTEM_SUMMARIZER_RU,
+                make_doc_summary_user_prompt(first),
+                futures[0].result(),
+                max_tokens=2200,
+            ).text
+
+        # Если кусков много — собираем строго в порядке кусков, потом объединяем
+        partial_summaries: List[str] = [
+            f"### Часть {idx}\n{f.result().text}" for idx, f in enumerate(futures, start=1)
+        ]
+    finally:
+        # Если документ упал, его ещё не начатые чанки общий пул не выполняет
+        for f in futures:
+            f.cancel()
+        if own_pool:
+            pool.shutdown(wait=True)
 
     combined = "\n\n".join(partial_summaries)
 
-    # Финальная “сборка” из частичных саммари
-    resp_final = llm.chat(
-        system=SYSTEM_SUMMARIZER_RU,
-        user=(
-            "Собери финальную единую сводку по документу по шаблону. "
-            "Источник — только частичные сводки ниже. "
-            "Если чего-то нет — пиши 'не найдено'.\n\n"
-            + combined
-        ),
-        max_tokens=2200,
+    # Финальная “сборка” из частичных саммари (тоже с автопродолжением)
+    reduce_user = (
+        "Собери финальную единую сводку по документу по шаблону. "
+        "Источник — только частичные сводки ниже. "
+        "Если чего-то нет — пиши 'не найдено'.\n\n"
+        + combined
     )
-    return resp_final.text
+    with llm_scope(stage="reduce", chunk=None):
+        resp_final = llm.chat(system=SYSTEM_SUMMARIZER_RU, user=reduce_user, max_tokens=2200)
+        return complete_truncated(cfg, llm, SYSTEM_SUMMARIZER_RU, reduce_user, resp_final, max_tokens=2200).text
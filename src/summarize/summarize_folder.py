@@ -1,9 +1,17 @@
 from __future__ import annotations
 
-from typing import Dict, List
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 from config import AppConfig
 from src.llm.openrouter_client import OpenRouterClient
+from src.llm.telemetry import llm_scope
+from src.llm.tokens import TokenCounter, get_token_counter
+
+
+log = logging.getLogger(__name__)
 
 
 FOLDER_SYSTEM_RU = """\
@@ -15,22 +23,7 @@ FOLDER_SYSTEM_RU = """\
 """
 
 
-def summarize_folder(cfg: AppConfig, llm: OpenRouterClient, summaries_by_file: Dict[str, str]) -> str:
-    if not summaries_by_file:
-        return "В папке нет обработанных документов."
-
-    # Собираем единый контекст из саммари файлов (не исходных текстов!)
-    blocks: List[str] = []
-    for filename, summ in summaries_by_file.items():
-        blocks.append(f"## Файл: {filename}\n{summ}")
-
-    combined = "\n\n".join(blocks)
-
-    user_prompt = f"""\
-Составь ОБЩЕЕ саммари по всей папке на основе сводок файлов ниже.
-
-Формат Markdown:
-
+FOLDER_SUMMARY_SCHEMA_MD = """\
 # Итог по папке
 
 ## Общие темы
@@ -50,16 +43,139 @@ def summarize_folder(cfg: AppConfig, llm: OpenRouterClient, summaries_by_file: D
 
 ## Что уточнить у клиента (общие вопросы)
 - ...
+"""
+
+
+def _final_user_prompt(combined: str, source_label: str) -> str:
+    return f"""\
+Составь ОБЩЕЕ саммари по всей папке на основе сводок ниже.
+
+Формат Markdown:
 
+{FOLDER_SUMMARY_SCHEMA_MD}
+{source_label} (это единственный источник правды):
+---
+{combined}
+---
+"""
+
+
+def _group_user_prompt(combined: str) -> str:
+    return f"""\
+Составь промежуточный итог по ГРУППЕ файлов на основе сводок ниже.
+Он будет объединён с итогами других групп, поэтому сохрани конкретику:
+даты, суммы, стороны, риски — с указанием файла, к которому они относятся.
+
+Формат Markdown — как у общего итога:
+
+{FOLDER_SUMMARY_SCHEMA_MD}
 Сводки по файлам (это единственный источник правды):
 ---
 {combined}
 ---
 """
 
-    resp = llm.chat(
-        system=FOLDER_SYSTEM_RU,
-        user=user_prompt,
-        max_tokens=2200,
-    )
+
+def _group_blocks(blocks: List[str], token_budget: int, fan_in: int, counter: TokenCounter) -> List[List[str]]:
+    """
+    Жадно раскладывает блоки по группам: в группе не больше fan_in блоков
+    и не больше token_budget токенов (блок больше бюджета идёт отдельной группой).
+    """
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for block in blocks:
+        tokens = counter.count(block)
+        if current and (len(current) >= fan_in or current_tokens + tokens > token_budget):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_folder(
+    cfg: AppConfig,
+    llm: OpenRouterClient,
+    summaries_by_file: Dict[str, str],
+    duplicates: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Общее саммари по папке.
+
+    Если все сводки файлов влезают в один промпт (cfg.folder_reduce_token_budget) —
+    один запрос, как раньше. Иначе — многоуровневая свёртка: сводки делятся на группы
+    (не больше cfg.folder_reduce_fan_in в группе), группы сворачиваются параллельно,
+    затем итоги групп сворачиваются снова, пока не останется одна группа.
+
+    duplicates: файл -> файл-оригинал для почти-дубликатов. Сводка копии в промпт
+    не повторяется — только отметка, копией чего она является.
+    """
+    if not summaries_by_file:
+        return "В папке нет обработанных документов."
+
+    # Собираем единый контекст из саммари файлов (не исходных текстов!)
+    blocks: List[str] = []
+    duplicates = duplicates or {}
+    for filename, summ in summaries_by_file.items():
+        original = duplicates.get(filename)
+        if original:
+            blocks.append(f"## Файл: {filename}\nКопия (почти дубликат) файла {original}, см. его сводку.")
+        else:
+            blocks.append(f"## Файл: {filename}\n{summ}")
+
+    source_label = "Сводки по файлам"
+    budget = cfg.folder_reduce_token_budget
+    fan_in = max(2, cfg.folder_reduce_fan_in)
+    counter = get_token_counter(cfg.tokenizer, cfg.token_count_scale)
+
+    def _fits(bs: List[str]) -> bool:
+        return sum(counter.count(b) for b in bs) <= budget
+
+    for depth in range(cfg.folder_reduce_max_depth):
+        if _fits(blocks):
+            break
+        groups = _group_blocks(blocks, budget, fan_in, counter)
+
+        log.info("Folder reduce level %d: %d blocks -> %d groups", depth + 1, len(blocks), len(groups))
+
+        def _reduce_group(group: List[str], idx: int) -> str:
+            with llm_scope(stage="folder_group", chunk=f"{depth + 1}.{idx}"):
+                resp = llm.chat(
+                    system=FOLDER_SYSTEM_RU,
+                    user=_group_user_prompt("\n\n".join(group)),
+                    max_tokens=2200,
+                )
+            return resp.text
+
+        with ThreadPoolExecutor(max_workers=min(len(groups), cfg.llm_concurrency)) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _reduce_group, group, idx)
+                for idx, group in enumerate(groups, start=1)
+            ]
+            group_summaries = [f.result() for f in futures]
+
+        blocks = [
+            f"## Группа {idx}\n{summ}" for idx, summ in enumerate(group_summaries, start=1)
+        ]
+        source_label = "Промежуточные итоги по группам файлов"
+    else:
+        if not _fits(blocks):
+            log.warning(
+                "Folder reduce depth limit (%d) reached, final prompt exceeds budget",
+                cfg.folder_reduce_max_depth,
+            )
+
+    combined = "\n\n".join(blocks)
+
+    with llm_scope(stage="folder"):
+        resp = llm.chat(
+            system=FOLDER_SYSTEM_RU,
+            user=_final_user_prompt(combined, source_label),
+            max_tokens=2200,
+        )
     return resp.text
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+
+class DiskCache:
+    """
+    Простое персистентное key-value хранилище на SQLite (stdlib, один файл).
+
+    - значения — произвольные bytes
+    - вытеснение по возрасту (max_age_sec) и по суммарному размеру (max_bytes, LRU)
+    - счётчики попаданий/промахов
+    - потокобезопасно (одно соединение + lock)
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_bytes: Optional[int] = None,
+        max_age_sec: Optional[float] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON entries(accessed_at)")
+        self._conn.commit()
+
+        self.evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, created_at = row
+            if self.max_age_sec is not None and now - created_at > self.max_age_sec:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats.misses += 1
+                self.stats.evictions += 1
+                return None
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats.hits += 1
+            return bytes(value)
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries(key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now),
+            )
+            self._conn.commit()
+            self.stats.writes += 1
+
+        if self.max_bytes is not None and self.stats.writes % 50 == 0:
+            # Проверка размера — не на каждую запись, чтобы не сканировать таблицу постоянно
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Удаляет устаревшие записи и самые давно использованные, пока кэш не влезет в max_bytes.
+        Возвращает число удалённых записей.
+        """
+        removed = 0
+        with self._lock:
+            if self.max_age_sec is not None:
+                cur = self._conn.execute(
+                    "DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age_sec,)
+                )
+                removed += cur.rowcount
+
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    to_free = total - self.max_bytes
+                    keys: list[str] = []
+                    for key, size in self._conn.execute(
+                        "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+                    ):
+                        keys.append(key)
+                        to_free -= size
+                        if to_free <= 0:
+                            break
+                    self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+                    removed += len(keys)
+
+            self._conn.commit()
+            self.stats.evictions += removed
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence, Set
+from typing import Deque, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 
 DEFAULT_EXTS: Set[str] = {
@@ -17,33 +22,172 @@ class FileItem:
     ext: str
 
 
-def iter_files(
+def _matches(rel: str, patterns: Sequence[str]) -> bool:
+    rel = rel.lower()
+    name = rel.rsplit("/", 1)[-1]
+    return any(fnmatchcase(rel, p) or fnmatchcase(name, p) for p in patterns)
+
+
+class _Walker:
+    """Фильтры обхода: расширения, include/exclude, глубина."""
+
+    def __init__(
+        self,
+        root: Path,
+        exts: Optional[Sequence[str]],
+        include: Sequence[str],
+        exclude: Sequence[str],
+        max_depth: Optional[int],
+        sort: bool,
+    ) -> None:
+        self.root = root
+        self.allowed = set(e.lower() for e in (exts or DEFAULT_EXTS))
+        self.include = [p.lower() for p in include]
+        self.exclude = [p.lower() for p in exclude]
+        self.max_depth = max_depth
+        self.sort = sort
+
+    def scan(self, path: str, rel: str, depth: int) -> Tuple[List[FileItem], List[Tuple[str, str, int]]]:
+        """Одна папка: подходящие файлы и подпапки, в которые надо зайти."""
+        files: List[FileItem] = []
+        dirs: List[Tuple[str, str, int]] = []
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name.lower()) if self.sort else list(it)
+        except OSError:
+            # Нет доступа / папку удалили во время обхода — пропускаем
+            return files, dirs
+
+        for entry in entries:
+            name = entry.name
+            entry_rel = f"{rel}/{name}" if rel else name
+            # Сначала дешёвые проверки по имени, stat (is_dir/is_file) — только потом
+            ext = os.path.splitext(name)[1].lower()
+            if ext in self.allowed:
+                try:
+                    is_file = entry.is_file()
+                except OSError:
+                    continue
+                if is_file:
+                    if self.exclude and _matches(entry_rel, self.exclude):
+                        continue
+                    if self.include and not _matches(entry_rel, self.include):
+                        continue
+                    files.append(FileItem(path=Path(entry.path), ext=ext))
+                    continue
+            if self.max_depth is not None and depth >= self.max_depth:
+                continue
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            if self.exclude and _matches(entry_rel, self.exclude):
+                continue
+            dirs.append((entry.path, entry_rel, depth + 1))
+        return files, dirs
+
+
+def walk_files(
     root: Path,
     *,
     exts: Optional[Sequence[str]] = None,
-    recursive: bool = True,
-) -> List[FileItem]:
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    max_depth: Optional[int] = None,
+    workers: int = 0,
+    sort: bool = True,
+) -> Iterator[FileItem]:
     """
-    Собирает список файлов в папке root.
-    - recursive=True: ходим по подпапкам
-    - exts: список расширений (например [".pdf", ".docx"])
+    Ленивый обход папки root на os.scandir: файлы отдаются по мере нахождения,
+    обработка может начаться с первого же файла.
+
+    - exts: расширения (по умолчанию DEFAULT_EXTS); фильтр по имени идёт до stat
+    - include / exclude: glob-шаблоны по пути относительно root ("*.pdf",
+      "contracts/*", "archive"); * захватывает и "/". Шаблон exclude, совпавший
+      с папкой, отсекает её целиком
+    - max_depth: 0 — только сама root, None — без ограничения
+    - workers > 1: подпапки сканируются параллельно в пуле потоков
+      (помогает на сетевых дисках, где каждый scandir — сетевой запрос)
+    - sort: детерминированный порядок — имена внутри папки по алфавиту; без
+      пула — обход в глубину, с пулом — по уровням. sort=False — как быстрее
     """
     root = Path(root)
     if not root.exists():
         raise FileNotFoundError(f"Папка не найдена: {root}")
 
-    allowed = set(e.lower() for e in (exts or DEFAULT_EXTS))
+    walker = _Walker(root, exts, include, exclude, max_depth, sort)
 
-    pattern = "**/*" if recursive else "*"
-    items: List[FileItem] = []
+    if workers <= 1:
+        stack: List[Tuple[str, str, int]] = [(str(root), "", 0)]
+        while stack:
+            files, dirs = walker.scan(*stack.pop())
+            yield from files
+            stack.extend(reversed(dirs))
+        return
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk")
+    try:
+        first = pool.submit(walker.scan, str(root), "", 0)
+        if sort:
+            queue: Deque[Future] = deque([first])
+            while queue:
+                files, dirs = queue.popleft().result()
+                queue.extend(pool.submit(walker.scan, *d) for d in dirs)
+                yield from files
+        else:
+            running: Set[Future] = {first}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    files, dirs = f.result()
+                    running.update(pool.submit(walker.scan, *d) for d in dirs)
+                    yield from files
+    finally:
+        # Обход могли бросить на середине (MAX_FILES) — незапущенные сканы не нужны
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def file_item(
+    root: Path,
+    path: Path,
+    *,
+    exts: Optional[Sequence[str]] = None,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    max_depth: Optional[int] = None,
+) -> Optional[FileItem]:
+    """
+    Тот же фильтр, что у walk_files, для одного пути (события наблюдения за папкой).
+    None — файл не подходит (или это не файл внутри root). Существование не проверяется.
+    """
+    try:
+        rel = Path(path).relative_to(root).as_posix()
+    except ValueError:
+        return None
+    ext = Path(path).suffix.lower()
+    if ext not in set(e.lower() for e in (exts or DEFAULT_EXTS)):
+        return None
+    if max_depth is not None and rel.count("/") > max_depth:
+        return None
+    parts = rel.split("/")
+    excl = [p.lower() for p in exclude]
+    # Исключённая папка на пути отсекает файл, как и при обходе
+    for i in range(1, len(parts) + 1):
+        if excl and _matches("/".join(parts[:i]), excl):
+            return None
+    if include and not _matches(rel, [p.lower() for p in include]):
+        return None
+    return FileItem(path=Path(path), ext=ext)
 
-    for p in root.glob(pattern):
-        if not p.is_file():
-            continue
-        ext = p.suffix.lower()
-        if ext in allowed:
-            items.append(FileItem(path=p, ext=ext))
 
-    # Стабильная сортировка: сначала по расширению, потом по имени
-    items.sort(key=lambda x: (x.ext, x.path.name.lower()))
-    return items
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    """Хэш содержимого файла (читаем блоками, чтобы не грузить большие PDF целиком)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, TextIO, Tuple
+
+
+@dataclass
+class JournalRecord:
+    """Готовый файл: саммари, запись для meta.json и данные для манифеста."""
+
+    key: str
+    file: str
+    summary: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+    reused: bool = False
+    fingerprint: str = ""
+    size: int = 0
+    mtime_ns: int = 0
+    sha256: Optional[str] = None
+    # Файл удалён из папки (режим наблюдения): запись-«надгробие»
+    deleted: bool = False
+
+
+class ResultJournal:
+    """
+    Журнал результатов запуска (output/journal.jsonl): строка на файл, дописывается
+    сразу, как файл готов, и сбрасывается на диск (fsync). Если запуск упал или
+    прерван, всё, что успело попасть в журнал, не теряется: с --resume такие файлы
+    пропускаются, а by_file.json / meta.json собираются из журнала потоково —
+    в памяти держатся только ключи файлов.
+
+    Без resume журнал начинается заново. Недописанная последняя строка (обрыв
+    посреди записи) при открытии отрезается.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        # Файлы, уже записанные в журнал с текущими настройками (их можно не обрабатывать)
+        self.done: Set[str] = set()
+        # Записей с последнего compact() (или с начала)
+        self.appended = 0
+        self._out: Optional[TextIO] = None
+
+    @classmethod
+    def start(cls, path: Path, fingerprint: str, *, resume: bool = False) -> "ResultJournal":
+        journal = cls(path)
+        journal.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and journal.path.exists():
+            journal._truncate_partial_tail()
+            for rec in journal.records():
+                if rec.fingerprint == fingerprint and not rec.deleted:
+                    journal.done.add(rec.key)
+                else:
+                    journal.done.discard(rec.key)
+            mode = "a"
+        else:
+            mode = "w"
+        journal._out = journal.path.open(mode, encoding="utf-8")
+        return journal
+
+    def _truncate_partial_tail(self) -> None:
+        # Ищем последний перевод строки с конца файла, блоками
+        with self.path.open("rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                block = f.read(step)
+                nl = block.rfind(b"\n")
+                if nl >= 0:
+                    end = pos - step + nl + 1
+                    break
+                pos -= step
+            else:
+                end = 0
+            if end < size:
+                f.truncate(end)
+
+    def append(self, rec: JournalRecord) -> None:
+        assert self._out is not None, "journal is not started"
+        self._out.write(json.dumps(asdict(rec), ensure_ascii=False) + "\n")
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        if rec.deleted:
+            self.done.discard(rec.key)
+        else:
+            self.done.add(rec.key)
+        self.appended += 1
+
+    def compact(self) -> None:
+        """
+        Переписывает журнал, оставляя по одной (последней) записи на живой файл.
+        Нужно долгоживущему режиму наблюдения: иначе журнал растёт с каждым изменением.
+        """
+        assert self._out is not None, "journal is not started"
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for rec in self.latest():
+                f.write(json.dumps(asdict(rec), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._out.close()
+        os.replace(tmp, self.path)
+        self._out = self.path.open("a", encoding="utf-8")
+        self.appended = 0
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+    def records(self) -> Iterator[JournalRecord]:
+        """Все записи журнала по порядку (битые строки пропускаются)."""
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield JournalRecord(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue
+
+    def latest(self) -> Iterator[JournalRecord]:
+        """
+        Записи без повторов: если файл попал в журнал дважды (перезапуск с другими
+        настройками, изменение файла), берётся последняя запись (и её место в порядке
+        файлов). Удалённые файлы пропускаются.
+        """
+        last: Dict[str, int] = {}
+        for i, rec in enumerate(self.records()):
+            last[rec.key] = i
+            if rec.deleted:
+                del last[rec.key]
+        wanted = set(last.values())
+        for i, rec in enumerate(self.records()):
+            if i in wanted:
+                yield rec
+
+    def write_artifacts(self, by_file_path: Path, meta_path: Path) -> Tuple[int, Dict[str, str]]:
+        """
+        by_file.json и meta.json из журнала (потоково, с атомарной заменой файлов).
+        Ключи — пути относительно DOCS_DIR (одноимённые файлы из разных подпапок
+        не затирают друг друга). Возвращает число файлов и почти-дубликаты
+        (файл -> оригинал) для итога по папке.
+        """
+        duplicates: Dict[str, str] = {}
+        count = 0
+        by_file_tmp = by_file_path.with_suffix(by_file_path.suffix + ".tmp")
+        meta_tmp = meta_path.with_suffix(meta_path.suffix + ".tmp")
+
+        with by_file_tmp.open("w", encoding="utf-8") as by_file, meta_tmp.open("w", encoding="utf-8") as meta:
+            by_file.write("{")
+            meta.write("[")
+            for rec in self.latest():
+                sep = "," if count else ""
+                name = json.dumps(rec.key, ensure_ascii=False)
+                by_file.write(f"{sep}\n  {name}: {json.dumps(rec.summary, ensure_ascii=False)}")
+
+                entry = {**rec.meta, "reused": True} if rec.reused else rec.meta
+                entry_json = json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                meta.write(f"{sep}\n  {entry_json}")
+
+                if rec.meta.get("duplicate_of"):
+                    duplicates[rec.key] = rec.meta["duplicate_of"]
+                count += 1
+            by_file.write("\n}" if count else "}")
+            meta.write("\n]" if count else "]")
+
+        os.replace(by_file_tmp, by_file_path)
+        os.replace(meta_tmp, meta_path)
+        return count, duplicates
+
+    def summaries(self) -> Dict[str, str]:
+        """Саммари по файлам (относительный путь -> саммари) для итога по папке."""
+        return {rec.key: rec.summary for rec in self.latest()}
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import AppConfig
+from src.llm.prompts import PROMPT_VERSION, SUMMARY_SCHEMA_MD, SYSTEM_SUMMARIZER_RU
+from src.utils.files import file_sha256
+
+
+MANIFEST_VERSION = 1
+
+
+def run_fingerprint(cfg: AppConfig) -> str:
+    """
+    Отпечаток настроек, от которых зависит саммари файла:
+    модель, версия/текст промптов, параметры чанкинга, вырезания типового текста,
+    пакетной суммаризации и автопродолжения.
+    Если он поменялся — сохранённые саммари считаются устаревшими.
+    """
+    settings: Dict[str, Any] = {
+        "model": cfg.openrouter_model,
+        "prompt_version": PROMPT_VERSION,
+        "system": SYSTEM_SUMMARIZER_RU,
+        "schema": SUMMARY_SCHEMA_MD,
+        "chunk_size_tokens": cfg.chunk_size_tokens,
+        "chunk_overlap_sentences": cfg.chunk_overlap_sentences,
+        "tokenizer": cfg.tokenizer,
+        "boilerplate_min_docs": cfg.boilerplate_min_docs,
+        "boilerplate_min_chars": cfg.boilerplate_min_chars,
+        "batch_token_budget": cfg.batch_token_budget,
+        "batch_doc_max_tokens": cfg.batch_doc_max_tokens,
+        "batch_max_docs": cfg.batch_max_docs,
+        "continuation_mode": cfg.continuation_mode,
+        "continuation_max_rounds": cfg.continuation_max_rounds,
+        "continuation_token_budget": cfg.continuation_token_budget,
+    }
+    if cfg.openrouter_model_pool:
+        # С пулом саммари может написать любая из моделей
+        settings["model_pool"] = list(cfg.openrouter_model_pool)
+    material = json.dumps(settings, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    fingerprint: str
+    summary: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class FileCheck:
+    """Результат сверки файла с манифестом."""
+
+    size: int
+    mtime_ns: int
+    sha256: Optional[str]
+    # Непустой, если файл не менялся и саммари можно переиспользовать
+    entry: Optional[ManifestEntry]
+
+
+class Manifest:
+    """
+    Манифест обработанных файлов (output/manifest.json).
+
+    Ключ — путь файла относительно DOCS_DIR. Для каждого файла хранятся
+    размер, mtime, sha256 содержимого, отпечаток модели/промптов и готовое саммари.
+    check/put/prune/save потокобезопасны (сервис сверяет и пишет файлы из нескольких заданий).
+    """
+
+    def __init__(self, path: Path, entries: Optional[Dict[str, ManifestEntry]] = None) -> None:
+        self.path = Path(path)
+        self.entries: Dict[str, ManifestEntry] = entries or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        p = Path(path)
+        if not p.exists():
+            return cls(p)
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except ValueError:
+            # Битый манифест — просто начинаем заново
+            return cls(p)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(p)
+
+        entries = {
+            key: ManifestEntry(**value) for key, value in (data.get("files") or {}).items()
+        }
+        return cls(p, entries)
+
+    def check(self, key: str, path: Path, fingerprint: str) -> Optional[FileCheck]:
+        """Сверка файла с манифестом; None — файла уже нет (удалили после обхода папки)."""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+
+        if entry is None or entry.fingerprint != fingerprint:
+            return FileCheck(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=None, entry=None)
+
+        # Быстрый путь: размер и mtime совпали — файл не трогали, хэш не считаем
+        if entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return FileCheck(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=entry.sha256, entry=entry)
+
+        # mtime поменялся (копирование, touch) — сверяем содержимое
+        try:
+            sha = file_sha256(path)
+        except FileNotFoundError:
+            return None
+        if sha == entry.sha256:
+            with self._lock:
+                entry.size = st.st_size
+                entry.mtime_ns = st.st_mtime_ns
+            return FileCheck(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=sha, entry=entry)
+
+        return FileCheck(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=sha, entry=None)
+
+    def put(
+        self,
+        key: str,
+        path: Path,
+        check: FileCheck,
+        fingerprint: str,
+        summary: str,
+        meta: Dict[str, Any],
+    ) -> None:
+        entry = ManifestEntry(
+            size=check.size,
+            mtime_ns=check.mtime_ns,
+            sha256=check.sha256 or file_sha256(path),
+            fingerprint=fingerprint,
+            summary=summary,
+            meta=meta,
+        )
+        with self._lock:
+            self.entries[key] = entry
+
+    def prune(self, keep: Iterable[str]) -> List[str]:
+        """Удаляет записи о файлах, которых больше нет в папке. Возвращает удалённые ключи."""
+        keep_set = set(keep)
+        with self._lock:
+            removed = [k for k in self.entries if k not in keep_set]
+            for k in removed:
+                del self.entries[k]
+        return removed
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "files": {key: asdict(entry) for key, entry in sorted(self.entries.items())},
+            }
+        # Атомарная запись: сначала во временный файл, потом replace
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
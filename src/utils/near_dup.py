@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Sketch:
+    """
+    MinHash-эскиз текста (bottom-k): k наименьших хэшей словесных шинглов.
+    По двум эскизам оценивается коэффициент Жаккара множеств шинглов.
+    """
+
+    hashes: Tuple[int, ...]
+    words: int
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def make_sketch(text: str, *, k: int = 128, shingle_words: int = 3) -> Sketch:
+    """
+    Эскиз текста: слова в нижнем регистре без пунктуации, шинглы по shingle_words слов.
+    Регистр, переносы строк и знаки препинания не влияют — скан и DOCX одного
+    договора дают близкие эскизы, несмотря на разную вёрстку.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < shingle_words:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i : i + shingle_words]) for i in range(len(words) - shingle_words + 1)}
+
+    hashes = heapq.nsmallest(k, {_shingle_hash(s) for s in shingles})
+    return Sketch(hashes=tuple(hashes), words=len(words))
+
+
+def estimate_jaccard(a: Sketch, b: Sketch) -> float:
+    """Оценка Жаккара по bottom-k эскизам (для коротких текстов — точное значение)."""
+    if not a.hashes or not b.hashes:
+        return 0.0
+    k = max(len(a), len(b))
+    union = heapq.nsmallest(k, set(a.hashes) | set(b.hashes))
+    common = set(a.hashes) & set(b.hashes)
+    return sum(1 for h in union if h in common) / len(union)
+
+
+@dataclass
+class NearDupMatch(Generic[T]):
+    key: str
+    similarity: float
+    value: T
+
+
+class NearDupIndex(Generic[T]):
+    """
+    Индекс почти-дубликатов: хранит эскизы «представителей» групп.
+
+    find_or_add ищет представителя, похожего на новый текст не меньше threshold;
+    если такого нет — новый текст сам становится представителем.
+    Сравнение линейное по представителям: в папке клиента их десятки-сотни,
+    а сравнение двух эскизов — пересечение пары множеств из k чисел.
+    Потокобезопасен.
+    """
+
+    def __init__(self, threshold: float, *, k: int = 128, shingle_words: int = 3, min_words: int = 50) -> None:
+        self.threshold = threshold
+        self.k = k
+        self.shingle_words = shingle_words
+        # Короткие тексты (сопроводительные письма, бланки) слишком легко «совпадают»
+        self.min_words = min_words
+        self._lock = threading.Lock()
+        self._reps: Dict[str, Tuple[Sketch, T]] = {}
+
+    def sketch(self, text: str) -> Sketch:
+        return make_sketch(text, k=self.k, shingle_words=self.shingle_words)
+
+    def find_or_add(self, key: str, sketch: Sketch, value: T) -> Optional[NearDupMatch[T]]:
+        """Возвращает найденного представителя или None (тогда key добавлен как представитель)."""
+        if sketch.words < self.min_words:
+            return None
+
+        with self._lock:
+            best: Optional[NearDupMatch[T]] = None
+            for rep_key, (rep_sketch, rep_value) in self._reps.items():
+                # Сильно разная длина — заведомо не дубликаты, эскизы не сравниваем
+                lo, hi = sorted((sketch.words, rep_sketch.words))
+                if lo < hi * self.threshold:
+                    continue
+                sim = estimate_jaccard(sketch, rep_sketch)
+                if sim >= self.threshold and (best is None or sim > best.similarity):
+                    best = NearDupMatch(key=rep_key, similarity=sim, value=rep_value)
+
+            if best is None:
+                self._reps[key] = (sketch, value)
+            return best
+
+    def representatives(self) -> List[str]:
+        with self._lock:
+            return list(self._reps)
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import AppConfig
+from src.llm.openrouter_client import OpenRouterClient
+from src.loaders.cache import ExtractionCache
+from src.loaders.ocr import ocr_settings, ocr_worker_init
+from src.pipeline import FileResult, run_pipeline
+from src.summarize.batch import DocBatcher
+from src.summarize.summarize_folder import summarize_folder
+from src.utils.files import FileItem, file_item, walk_files
+from src.utils.journal import JournalRecord, ResultJournal
+from src.utils.manifest import Manifest
+
+try:
+    from watchdog.events import FileSystemEvent, FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # необязательная зависимость: без неё папка опрашивается
+    Observer = None
+    FileSystemEventHandler = object
+
+
+log = logging.getLogger(__name__)
+
+# Сигнатура файла для сравнения: размер и mtime
+_Sig = Tuple[int, int]
+
+
+def _sig(path: Path) -> Optional[_Sig]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class _PollingSource:
+    """Изменения папки опросом: снимок (размер, mtime) всех файлов раз в cfg.watch_poll_sec."""
+
+    def __init__(self, cfg: AppConfig) -> None:
+        self.cfg = cfg
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, _Sig]:
+        cfg = self.cfg
+        snapshot: Dict[Path, _Sig] = {}
+        for item in walk_files(
+            cfg.docs_dir,
+            include=cfg.docs_include,
+            exclude=cfg.docs_exclude,
+            max_depth=cfg.docs_max_depth,
+            workers=cfg.docs_walk_workers,
+            sort=False,
+        ):
+            sig = _sig(item.path)
+            if sig is not None:
+                snapshot[item.path] = sig
+        return snapshot
+
+    def poll(self, timeout: float) -> Tuple[Set[Path], Set[Path]]:
+        time.sleep(timeout)
+        current = self._scan()
+        changed = {p for p, sig in current.items() if self._snapshot.get(p) != sig}
+        deleted = set(self._snapshot) - set(current)
+        self._snapshot = current
+        return changed, deleted
+
+    def close(self) -> None:
+        pass
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, events: "queue.Queue[Tuple[str, Path]]") -> None:
+        super().__init__()
+        self.events = events
+
+    def on_any_event(self, event: "FileSystemEvent") -> None:
+        kind = "dir" if event.is_directory else "file"
+        if event.event_type in ("created", "modified", "closed"):
+            # modified у папки — в ней добавили/удалили/переименовали файл; сами файлы
+            # придут своими событиями, обходить папку заново незачем
+            if not (event.is_directory and event.event_type != "created"):
+                self.events.put((f"{kind}_changed", Path(event.src_path)))
+        elif event.event_type == "deleted":
+            self.events.put((f"{kind}_deleted", Path(event.src_path)))
+        elif event.event_type == "moved":
+            self.events.put((f"{kind}_deleted", Path(event.src_path)))
+            self.events.put((f"{kind}_changed", Path(event.dest_path)))
+
+
+class _WatchdogSource:
+    """Изменения папки по событиям ОС (inotify / ReadDirectoryChangesW / FSEvents) через watchdog."""
+
+    def __init__(self, cfg: AppConfig) -> None:
+        self.cfg = cfg
+        self._events: "queue.Queue[Tuple[str, Path]]" = queue.Queue()
+        self._observer = Observer()
+        self._observer.schedule(_EventHandler(self._events), str(cfg.docs_dir), recursive=True)
+        self._observer.start()
+
+    def poll(self, timeout: float) -> Tuple[Set[Path], Set[Path]]:
+        changed: Set[Path] = set()
+        deleted: Set[Path] = set()
+        try:
+            events = [self._events.get(timeout=timeout)]
+        except queue.Empty:
+            return changed, deleted
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+
+        cfg = self.cfg
+        for kind, path in events:
+            if kind == "file_changed":
+                changed.add(path)
+                deleted.discard(path)
+            elif kind == "dir_changed":
+                # Папку создали или перенесли внутрь — событий по её файлам может не быть
+                changed.update(self._walk_dir(path))
+            else:
+                # Для папки — все файлы под ней (их ключи сравниваются по префиксу)
+                deleted.add(path)
+                changed.discard(path)
+        return changed, deleted
+
+    def _walk_dir(self, path: Path) -> Set[Path]:
+        """Подходящие файлы новой папки (с теми же фильтрами, что у обхода DOCS_DIR)."""
+        cfg = self.cfg
+        try:
+            depth = len(path.relative_to(cfg.docs_dir).parts)
+        except ValueError:
+            return set()
+        if not path.is_dir() or (cfg.docs_max_depth is not None and depth > cfg.docs_max_depth):
+            return set()
+        # include/exclude заданы относительно DOCS_DIR — окончательно фильтрует file_item
+        found = walk_files(
+            path,
+            max_depth=cfg.docs_max_depth - depth if cfg.docs_max_depth is not None else None,
+            sort=False,
+        )
+        return {
+            item.path
+            for item in found
+            if file_item(
+                cfg.docs_dir,
+                item.path,
+                include=cfg.docs_include,
+                exclude=cfg.docs_exclude,
+                max_depth=cfg.docs_max_depth,
+            )
+        }
+
+    def close(self) -> None:
+        self._observer.stop()
+        self._observer.join(timeout=5)
+
+
+def make_change_source(cfg: AppConfig):
+    """watchdog, если установлен (и не включён WATCH_POLLING), иначе опрос."""
+    if Observer is not None and not cfg.watch_polling:
+        return _WatchdogSource(cfg)
+    return _PollingSource(cfg)
+
+
+class _Debouncer:
+    """
+    Файлы, которые ещё могут дописываться: файл «готов», когда его размер и mtime
+    не менялись cfg.watch_settle_sec (копирование по сети, сохранение скана).
+    """
+
+    def __init__(self, settle_sec: float) -> None:
+        self.settle_sec = settle_sec
+        self._pending: Dict[Path, Tuple[Optional[_Sig], float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, path: Path) -> None:
+        self._pending[path] = (None, time.monotonic())
+
+    def discard(self, path: Path) -> None:
+        self._pending.pop(path, None)
+
+    def ready(self) -> List[Path]:
+        now = time.monotonic()
+        out: List[Path] = []
+        for path, (sig, since) in list(self._pending.items()):
+            current = _sig(path)
+            if current is None:
+                # Файл исчез (временный файл переименовали и т.п.)
+                del self._pending[path]
+            elif current != sig:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle_sec:
+                del self._pending[path]
+                out.append(path)
+        return out
+
+
+class WatchSession:
+    """
+    Долгоживущий режим (main.py --watch): клиент LLM, кэши и пулы создаются один раз,
+    папка отслеживается, новые и изменённые файлы суммаризируются по мере появления.
+
+    - дописываемые файлы ждут, пока перестанут меняться (cfg.watch_settle_sec)
+    - by_file.json / meta.json / manifest.json обновляются после каждой порции файлов
+    - итог по папке пересобирается не чаще, чем раз в cfg.watch_folder_debounce_sec
+      после последнего изменения (каждый новый файл откладывает пересборку)
+    - удалённые файлы убираются из журнала, манифеста и итогов
+    """
+
+    def __init__(
+        self,
+        cfg: AppConfig,
+        llm: OpenRouterClient,
+        manifest: Manifest,
+        fingerprint: str,
+        journal: ResultJournal,
+        extraction_cache: Optional[ExtractionCache] = None,
+        batcher: Optional[DocBatcher] = None,
+    ) -> None:
+        self.cfg = cfg
+        self.llm = llm
+        self.manifest = manifest
+        self.fingerprint = fingerprint
+        self.journal = journal
+        self.extraction_cache = extraction_cache
+        self.batcher = batcher
+        self.processed = 0
+        self._folder_due: Optional[float] = None
+        self._outputs_dirty = False
+        # Пул процессов загрузки — один на всю сессию (поднимается в run())
+        self.loader_pool: Optional[ProcessPoolExecutor] = None
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.cfg.docs_dir).as_posix()
+
+    def _record(self, res: FileResult) -> None:
+        self.journal.append(
+            JournalRecord(
+                key=res.key,
+                file=res.path.name,
+                summary=res.summary,
+                meta=res.meta,
+                reused=res.reused,
+                fingerprint=self.fingerprint,
+                size=res.check.size,
+                mtime_ns=res.check.mtime_ns,
+                sha256=res.check.sha256,
+            )
+        )
+        if res.reused:
+            return
+        self.manifest.put(res.key, res.path, res.check, self.fingerprint, res.summary, res.meta)
+        self.processed += 1
+        self._folder_due = time.monotonic() + self.cfg.watch_folder_debounce_sec
+        print(f"[watch] {res.key} | loader={res.meta.get('loader')} | {res.meta.get('status')}")
+
+    def process(self, items: List[FileItem]) -> None:
+        """Порция файлов через общий конвейер; сбойный файл не роняет остальные."""
+        if not items:
+            return
+        done: Set[str] = set()
+        try:
+            results = run_pipeline(
+                self.cfg,
+                self.llm,
+                items,
+                self.manifest,
+                self.fingerprint,
+                self.extraction_cache,
+                None,
+                self.batcher,
+                self.loader_pool,
+            )
+            for res in results:
+                self._record(res)
+                done.add(res.key)
+        except Exception as e:
+            if len(items) == 1:
+                log.error("Failed to process %s: %s", items[0].path, e)
+                return
+            # Не знаем, какой файл виноват, — оставшиеся по одному
+            for item in items:
+                if self._key(item.path) not in done:
+                    self.process([item])
+        finally:
+            if done:
+                self._outputs_dirty = True
+
+    def remove(self, path: Path) -> None:
+        """Файл (или папка целиком) удалён из DOCS_DIR."""
+        try:
+            prefix = self._key(path)
+        except ValueError:
+            return
+        gone = [k for k in self.journal.done if k == prefix or k.startswith(prefix + "/")]
+        for key in gone:
+            self.journal.append(JournalRecord(key=key, file=Path(key).name, summary="", deleted=True))
+            self.manifest.entries.pop(key, None)
+            print(f"[watch] {key} | removed")
+        if gone:
+            self._outputs_dirty = True
+            self._folder_due = time.monotonic() + self.cfg.watch_folder_debounce_sec
+
+    def flush_outputs(self) -> None:
+        if not self._outputs_dirty:
+            return
+        self.manifest.save()
+        self.journal.write_artifacts(self.cfg.output_dir / "by_file.json", self.cfg.output_dir / "meta.json")
+        # Журнал растёт с каждым изменением — время от времени переписываем начисто
+        if self.journal.appended > max(1000, 2 * len(self.journal.done)):
+            self.journal.compact()
+        self._outputs_dirty = False
+
+    def refresh_folder(self, *, force: bool = False) -> None:
+        if self._folder_due is None or (not force and time.monotonic() < self._folder_due):
+            return
+        self._folder_due = None
+        _, duplicates = self.journal.write_artifacts(
+            self.cfg.output_dir / "by_file.json", self.cfg.output_dir / "meta.json"
+        )
+        folder_summary = summarize_folder(self.cfg, self.llm, self.journal.summaries(), duplicates)
+        (self.cfg.output_dir / "folder_summary.md").write_text(folder_summary, encoding="utf-8")
+        print("[watch] folder summary updated")
+
+    def run(self) -> None:
+        cfg = self.cfg
+        # Источник изменений — до первого прохода: то, что появится во время него, не потеряется
+        source = make_change_source(cfg)
+        if cfg.loader_workers > 0:
+            self.loader_pool = ProcessPoolExecutor(
+                max_workers=cfg.loader_workers, initializer=ocr_worker_init, initargs=(ocr_settings(cfg),)
+            )
+        debouncer = _Debouncer(cfg.watch_settle_sec)
+        print(f"WATCH: {cfg.docs_dir} ({'polling' if isinstance(source, _PollingSource) else 'watchdog'})")
+
+        # Первый проход — как обычный запуск (неизменённые файлы берутся из манифеста)
+        initial = walk_files(
+            cfg.docs_dir,
+            include=cfg.docs_include,
+            exclude=cfg.docs_exclude,
+            max_depth=cfg.docs_max_depth,
+            workers=cfg.docs_walk_workers,
+            sort=cfg.docs_sort,
+        )
+        self.process(list(initial))
+        self.manifest.prune(self.journal.done)
+        self._outputs_dirty = True
+        if self.processed or not (cfg.output_dir / "folder_summary.md").exists():
+            self._folder_due = time.monotonic()
+
+        try:
+            while True:
+                self.flush_outputs()
+                self.refresh_folder()
+
+                # Пока есть дописываемые файлы, проверяем их чаще
+                timeout = min(cfg.watch_poll_sec, 0.5) if len(debouncer) else cfg.watch_poll_sec
+                changed, deleted = source.poll(timeout)
+                for path in deleted:
+                    debouncer.discard(path)
+                    self.remove(path)
+                for path in changed:
+                    if file_item(
+                        cfg.docs_dir,
+                        path,
+                        include=cfg.docs_include,
+                        exclude=cfg.docs_exclude,
+                        max_depth=cfg.docs_max_depth,
+                    ):
+                        debouncer.touch(path)
+
+                # В debouncer попадают только подходящие файлы — фильтр уже пройден
+                self.process([FileItem(path=p, ext=p.suffix.lower()) for p in debouncer.ready()])
+        except KeyboardInterrupt:
+            print("\nWATCH: stopping")
+        finally:
+            source.close()
+            self.flush_outputs()
+            self.refresh_folder(force=True)
+            if self.loader_pool is not None:
+                self.loader_pool.shutdown(wait=True, cancel_futures=True)
+                self.loader_pool = None
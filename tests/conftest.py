@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from dotenv import dotenv_values
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+from config import AppConfig, load_config  # noqa: E402
+
+
+@pytest.fixture
+def make_config(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Callable[..., AppConfig]:
+    """
+    AppConfig для теста: без значений из .env, без кэшей и трассы на диске,
+    во временных DOCS_DIR / OUTPUT_DIR. Переопределения — как переменные окружения.
+    """
+    for name in dotenv_values(ROOT / ".env"):
+        monkeypatch.delenv(name, raising=False)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    base = {
+        "OPENROUTER_API_KEY": "test",
+        "DOCS_DIR": str(docs),
+        "OUTPUT_DIR": str(tmp_path / "output"),
+        "LLM_CACHE": "0",
+        "EXTRACT_CACHE": "0",
+        "LLM_TRACE": "0",
+        "LLM_RPM": "0",
+    }
+
+    def _make(**env: str) -> AppConfig:
+        for k, v in {**base, **env}.items():
+            monkeypatch.setenv(k, v)
+        return load_config()
+
+    return _make
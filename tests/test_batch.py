@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+from mock_openrouter import MockBehavior, MockOpenRouter
+from src.llm.openrouter_client import LLMResponse, OpenRouterClient
+from src.llm.telemetry import llm_scope
+from src.summarize.batch import DocBatcher, make_doc_batcher, parse_batch_response
+
+
+def test_batch_call_is_attributed_to_member_files(make_config):
+    srv = MockOpenRouter(behavior=MockBehavior(latency_ms=0, latency_dist="fixed")).start()
+    try:
+        cfg = make_config(
+            OPENROUTER_BASE_URL=srv.base_url,
+            OPENROUTER_MODEL="mock/batch",
+            BATCH_TOKEN_BUDGET="4000",
+            BATCH_MAX_DOCS="2",
+            BATCH_LINGER_MS="2000",
+        )
+        llm = OpenRouterClient(cfg)
+        batcher = make_doc_batcher(cfg, llm)
+        assert batcher is not None
+        out: Dict[str, Optional[str]] = {}
+
+        def _one(key: str, text: str) -> None:
+            with llm_scope(file=key):
+                out[key] = batcher.summarize(key, text)
+
+        threads = [
+            threading.Thread(target=_one, args=("a/short.txt", "Короткий документ. " * 10)),
+            threading.Thread(target=_one, args=("b/long.txt", "Документ подлиннее. " * 30)),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        calls = srv.stats.snapshot()["by_kind"]
+    finally:
+        srv.stop()
+
+    assert calls == {"batch": 1}
+    assert all(out.values())
+    short, long = llm.telemetry.pop_file("a/short.txt"), llm.telemetry.pop_file("b/long.txt")
+    assert short["calls"] == long["calls"] == 1
+    assert short["models"] == {"mock/batch": 1}
+    # Расход пакета делится по длине текста
+    assert 0 < short["prompt_tokens"] < long["prompt_tokens"]
+    total = llm.telemetry.summary()["by_stage"]["batch"]
+    assert abs(short["total_tokens"] + long["total_tokens"] - total["total_tokens"]) <= 1
+
+
+def test_parse_batch_response_tolerates_marker_noise():
+    text = (
+        "Вступление модели, которое не относится ни к одному документу.\n"
+        "**=== ДОКУМЕНТ 1 ===**\nСводка первого.\n"
+        "## === документ 2 ===\n\n"
+        "=== ДОКУМЕНТ 3 ===\nСводка третьего.\n"
+        "=== ДОКУМЕНТ 3 ===\nЕщё раз третий.\n"
+        "=== ДОКУМЕНТ 9 ===\nЛишний.\n"
+    )
+    # Пустой (2), повторный (3) и чужой (9) разделы не засчитываются
+    assert parse_batch_response(text, 3) == {1: "Сводка первого."}
+
+
+class _StubLLM:
+    """Отвечает на пакет разделом только для первого документа."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def chat(self, system: str, user: str, max_tokens: int) -> LLMResponse:
+        self.calls += 1
+        text = "=== ДОКУМЕНТ 1 ===\nСводка первого."
+        return LLMResponse(text=text, raw={"choices": [{"message": {"content": text}, "finish_reason": "stop"}]})
+
+
+def test_document_without_section_falls_back_to_single_call():
+    llm = _StubLLM()
+    batcher = DocBatcher(llm, token_budget=4000, doc_max_tokens=800, max_docs=2, linger_sec=2.0)  # type: ignore[arg-type]
+    out: Dict[str, Optional[str]] = {}
+
+    def _one(key: str) -> None:
+        out[key] = batcher.summarize(key, f"Текст документа {key}.")
+
+    # Первый открывает пакет и ждёт до linger_sec, второй его закрывает (max_docs=2)
+    threads = [threading.Thread(target=_one, args=(key,)) for key in ("a.txt", "b.txt")]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+
+    assert llm.calls == 1
+    assert out == {"a.txt": "Сводка первого.", "b.txt": None}
+    assert (batcher.batched_docs, batcher.fallback_docs) == (1, 1)
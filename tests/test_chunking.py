@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import logging
+
+from src.llm.tokens import get_token_counter
+from src.summarize.chunking import chunk_text
+
+COUNTER = get_token_counter("estimate")
+
+
+def _text(n: int) -> str:
+    paras = []
+    for i in range(n):
+        paras.append(" ".join(f"Предложение {i}.{j} про сроки поставки и оплату." for j in range(4)))
+    return "\n\n".join(paras)
+
+
+def test_chunks_fit_the_token_budget():
+    chunks = chunk_text(_text(40), 120, overlap_sentences=0, counter=COUNTER)
+    assert len(chunks) > 3
+    assert all(COUNTER.count(c) <= 120 for c in chunks)
+
+
+def test_neighbour_chunks_share_the_overlap():
+    chunks = chunk_text(_text(40), 120, overlap_sentences=1, counter=COUNTER)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        last_sentence = prev.rsplit(". ", 1)[-1].split("\n\n")[-1]
+        assert nxt.startswith(last_sentence)
+
+
+def test_single_run_longer_than_budget_is_hard_split():
+    blob = "QUJD" * 2000  # base64 без пробелов
+    chunks = chunk_text(f"Вложение: {blob}", 100, overlap_sentences=0, counter=COUNTER)
+    assert len(chunks) > 1
+    assert all(COUNTER.count(c) <= 100 for c in chunks)
+    # Куски склеиваются обратно без потерь
+    assert "".join(chunks).replace(" ", "") == f"Вложение:{blob}"
+
+
+def test_legacy_char_settings_are_mapped_with_a_warning(make_config, caplog):
+    with caplog.at_level(logging.WARNING, logger="config"):
+        cfg = make_config(CHUNK_SIZE_CHARS="12000", CHUNK_OVERLAP_CHARS="800")
+    assert cfg.chunk_size_tokens == 3000
+    assert "CHUNK_SIZE_CHARS" in caplog.text
+    assert "CHUNK_OVERLAP_CHARS" in caplog.text
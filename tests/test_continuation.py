@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import pytest
+
+from src.llm.openrouter_client import LLMResponse
+from src.summarize.continuation import needs_continuation
+
+
+def _resp(text: str, reason: Optional[str]) -> LLMResponse:
+    choice = {"message": {"content": text}, "finish_reason": reason}
+    return LLMResponse(text=text, raw={"choices": [choice]})
+
+
+@pytest.mark.parametrize(
+    "text, reason, expected",
+    [
+        ("Сводка закончена.", "length", True),
+        ("Сводка закончена.", "stop", False),
+        ("Сводка закончена.", None, False),
+        # Модель оборвала ответ, но сообщила stop
+        ("Стороны договора:", "stop", True),
+        ("Срок действия до", None, True),
+    ],
+)
+def test_needs_continuation(text, reason, expected):
+    assert needs_continuation(_resp(text, reason)) is expected
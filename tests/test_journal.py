@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import json
+
+from src.utils.journal import JournalRecord, ResultJournal
+
+
+def _rec(key: str, summary: str, **meta) -> JournalRecord:
+    return JournalRecord(key=key, file=key.rsplit("/", 1)[-1], summary=summary, meta=meta, fingerprint="fp")
+
+
+def test_artifacts_are_keyed_by_relative_path(tmp_path):
+    journal = ResultJournal.start(tmp_path / "journal.jsonl", "fp")
+    journal.append(_rec("a/x.txt", "first"))
+    journal.append(_rec("b/x.txt", "second", duplicate_of="a/x.txt"))
+    count, duplicates = journal.write_artifacts(tmp_path / "by_file.json", tmp_path / "meta.json")
+    journal.close()
+
+    by_file = json.loads((tmp_path / "by_file.json").read_text(encoding="utf-8"))
+    assert count == 2
+    assert by_file == {"a/x.txt": "first", "b/x.txt": "second"}
+    assert duplicates == {"b/x.txt": "a/x.txt"}
+    assert journal.summaries() == by_file
+
+
+def test_resume_after_torn_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = ResultJournal.start(path, "fp")
+    journal.append(_rec("a.txt", "first"))
+    journal.append(_rec("b.txt", "second"))
+    journal.close()
+    # Запуск оборвался посреди записи третьей строки
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"key": "c.txt", "file": "c.txt", "summ')
+
+    journal = ResultJournal.start(path, "fp", resume=True)
+    assert journal.done == {"a.txt", "b.txt"}
+    # Обрывок отрезан: новая запись не склеивается с ним
+    journal.append(_rec("c.txt", "third"))
+    journal.close()
+
+    assert [rec.key for rec in journal.records()] == ["a.txt", "b.txt", "c.txt"]
+    assert journal.summaries() == {"a.txt": "first", "b.txt": "second", "c.txt": "third"}
+
+
+def test_resume_skips_records_of_other_settings(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = ResultJournal.start(path, "old")
+    journal.append(JournalRecord(key="a.txt", file="a.txt", summary="s", fingerprint="old"))
+    journal.close()
+
+    journal = ResultJournal.start(path, "new", resume=True)
+    journal.close()
+    assert journal.done == set()
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from src.utils.manifest import Manifest, run_fingerprint
+
+
+def test_check_of_removed_file_is_none(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("текст", encoding="utf-8")
+    manifest = Manifest(tmp_path / "manifest.json")
+    check = manifest.check("a.txt", path, "fp")
+    manifest.put("a.txt", path, check, "fp", "сводка", {})
+    assert manifest.check("a.txt", path, "fp").entry is not None
+
+    path.unlink()
+    assert manifest.check("a.txt", path, "fp") is None
+
+
+def test_fingerprint_covers_batch_and_continuation(make_config):
+    base = run_fingerprint(make_config())
+    assert run_fingerprint(make_config(BATCH_TOKEN_BUDGET="6000")) != base
+    assert run_fingerprint(make_config(BATCH_TOKEN_BUDGET="0", CONTINUATION_MAX_ROUNDS="5")) != base
+    assert run_fingerprint(make_config(CONTINUATION_MAX_ROUNDS="2", CONTINUATION_MODE="prefill")) != base
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from mock_openrouter import MockBehavior, MockOpenRouter
+from src.llm.openrouter_client import OpenRouterClient, OpenRouterError
+
+
+def test_429_from_one_model_does_not_delay_the_other(make_config):
+    srv = MockOpenRouter(
+        behavior=MockBehavior(
+            latency_ms=0,
+            latency_dist="fixed",
+            retry_after_sec=5,
+            throttled_models=("slow/a",),
+        )
+    ).start()
+    try:
+        cfg = make_config(OPENROUTER_BASE_URL=srv.base_url, OPENROUTER_MODEL_POOL="slow/a,fast/b")
+        llm = OpenRouterClient(cfg)
+
+        started = time.monotonic()
+        first = llm.chat("system", "user", retry_sleep_sec=0.01)
+        # Retry-After модели A не блокирует лимитер: следующий запрос сразу уходит к B
+        second = llm.chat("system", "another user", retry_sleep_sec=0.01)
+        elapsed = time.monotonic() - started
+    finally:
+        srv.stop()
+
+    assert first.raw["model"] == "fast/b"
+    assert second.raw["model"] == "fast/b"
+    assert elapsed < 2.0
+    # Второй запрос к A уже не ходил: модель на паузе в роутере
+    assert srv.stats.snapshot()["by_kind"].get("429") == 1
+
+
+def test_429_without_other_model_waits_retry_after(make_config):
+    srv = MockOpenRouter(
+        behavior=MockBehavior(latency_ms=0, latency_dist="fixed", retry_after_sec=1, throttled_models=("only/a",))
+    ).start()
+    try:
+        cfg = make_config(
+            OPENROUTER_BASE_URL=srv.base_url,
+            OPENROUTER_MODEL_POOL="only/a",
+            LLM_RATE_LIMIT_RETRIES="1",
+        )
+        llm = OpenRouterClient(cfg)
+        started = time.monotonic()
+        with pytest.raises(OpenRouterError):
+            llm.chat("system", "user", retry_sleep_sec=0.01)
+        elapsed = time.monotonic() - started
+    finally:
+        srv.stop()
+
+    assert elapsed >= 0.9
+
+
+def test_cassette_pins_pool_to_primary_model(make_config, tmp_path):
+    srv = MockOpenRouter(behavior=MockBehavior(latency_ms=0, latency_dist="fixed")).start()
+    cassette = tmp_path / "run.jsonl"
+    try:
+        pool = "first/a@32k*2, second/b"
+        cfg = make_config(
+            OPENROUTER_BASE_URL=srv.base_url,
+            OPENROUTER_MODEL_POOL=pool,
+            LLM_CASSETTE=str(cassette),
+            LLM_CASSETTE_MODE="record",
+        )
+        recorded = OpenRouterClient(cfg).chat("system", "user")
+    finally:
+        srv.stop()
+
+    assert cfg.openrouter_model == "first/a"
+    assert recorded.raw["model"] == "first/a"
+    # Воспроизведение без сервера: строгий отпечаток совпадает, потому что модель та же
+    cfg = make_config(LLM_CASSETTE_MODE="replay")
+    replayed = OpenRouterClient(cfg).chat("system", "user")
+    assert replayed.text == recorded.text
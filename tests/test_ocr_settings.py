@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from src.loaders import ocr
+
+
+def test_ocr_settings_come_from_config(make_config, monkeypatch):
+    cfg = make_config(OCR_LANG="eng", OCR_TARGET_DPI="200", OCR_BINARIZE="0", OCR_WORKERS="3", PDF_OCR_FALLBACK="0")
+    settings = ocr.ocr_settings(cfg)
+    assert settings == ocr.OcrSettings(lang="eng", target_dpi=200, binarize=False, workers=3, pdf_fallback=False)
+
+    # Воркер пула загрузки получает настройки основного процесса
+    monkeypatch.setattr(ocr, "_settings", ocr.OcrSettings())
+    ocr.ocr_worker_init(settings)
+    assert ocr.current_ocr_settings() == settings
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import http.client
+import json
+import threading
+from typing import Dict, Iterator, Tuple
+
+import pytest
+
+from src.llm.openrouter_client import OpenRouterClient
+from src.service import ServiceHTTPServer, SummaryService
+
+
+@pytest.fixture
+def service_addr(make_config) -> Iterator[Tuple[str, int]]:
+    cfg = make_config(LOADER_WORKERS="0", SERVICE_WORKERS="1")
+    service = SummaryService(cfg, OpenRouterClient(cfg)).start()
+    server = ServiceHTTPServer(service, "127.0.0.1", 0, cfg.service_max_upload_mb)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def _post(addr: Tuple[str, int], path: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, dict]:
+    # http.client сам выставил бы верный Content-Length — заголовки пишем вручную
+    conn = http.client.HTTPConnection(*addr, timeout=10)
+    try:
+        conn.putrequest("POST", path, skip_accept_encoding=True)
+        for k, v in headers.items():
+            conn.putheader(k, v)
+        conn.endheaders(body)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_bad_content_length_is_400(service_addr, length):
+    status, data = _post(service_addr, "/jobs/folder", b"{}", {"Content-Length": length})
+    assert status == 400
+    assert data["error"]["code"] == 400
+
+
+def test_large_folder_body_is_413_before_reading(service_addr):
+    # Заявлено 1 МБ, отправлено чуть-чуть: сервис не ждёт тело, а сразу отвечает
+    status, _ = _post(service_addr, "/jobs/folder", b'{"path": "x"}', {"Content-Length": str(1 << 20)})
+    assert status == 413
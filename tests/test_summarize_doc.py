@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_openrouter import MockBehavior, MockOpenRouter
+from src.llm.openrouter_client import OpenRouterClient
+from src.summarize.summarize_doc import summarize_document_text
+
+
+def test_chunks_go_to_the_shared_pool(make_config):
+    srv = MockOpenRouter(behavior=MockBehavior(latency_ms=0, latency_dist="fixed")).start()
+    text = "\n\n".join(f"Абзац номер {i}. В нём несколько слов про договор и сроки." for i in range(60))
+    try:
+        cfg = make_config(OPENROUTER_BASE_URL=srv.base_url, CHUNK_SIZE_TOKENS="120", TOKENIZER="estimate")
+        llm = OpenRouterClient(cfg)
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="shared")
+        try:
+            first = summarize_document_text(cfg, llm, text, pool)
+            # Пул не закрыт документом: второй документ идёт в тот же пул
+            second = summarize_document_text(cfg, llm, text, pool)
+        finally:
+            pool.shutdown(wait=True)
+        calls = srv.stats.snapshot()["requests"]
+    finally:
+        srv.stop()
+
+    assert first and second
+    # Несколько чанков + сборка на каждый документ
+    assert calls >= 2 * 3
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from src.llm.telemetry import CallRecord, Telemetry
+
+
+def test_trace_rotates_past_the_size_cap(tmp_path):
+    trace = tmp_path / "llm_trace.jsonl"
+    telemetry = Telemetry(trace, max_trace_bytes=2000)
+    for i in range(50):
+        telemetry.record(CallRecord(ts=float(i), model="m", file=f"f{i}.txt", stage="chunk"))
+    telemetry.close()
+
+    rotated = trace.with_name("llm_trace.jsonl.1")
+    assert rotated.exists()
+    assert rotated.stat().st_size <= 2000 + 1000
+    assert trace.stat().st_size < 2000
+    # Итоги по запуску трасса не трогает
+    assert telemetry.summary()["total"]["calls"] == 50
@@ -0,0 +1,369 @@
+"""
+Бенчмарк конвейера на синтетических документах против локального mock OpenRouter
+(tools/mock_openrouter.py) — без расхода лимитов.
+
+Генерирует корпус (TXT / DOCX / PDF / изображения), прогоняет тот же путь, что main.py
+(run_pipeline + summarize_folder), для каждого сценария поведения модели и печатает:
+  docs/min, вызовов LLM на документ, p50/p99 задержки вызова, ошибки.
+
+Запуск:
+  python tools/bench_pipeline.py                          # все сценарии
+  python tools/bench_pipeline.py --scenario flaky --docs 40 --kinds txt,pdf
+  python tools/bench_pipeline.py --save bench.json        # сохранить как эталон
+  python tools/bench_pipeline.py --baseline bench.json    # код возврата 1 при регрессии
+
+Изображения по умолчанию только если установлен tesseract.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Set
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mock_openrouter import MockBehavior, MockOpenRouter  # noqa: E402
+
+
+SCENARIOS: Dict[str, MockBehavior] = {
+    # Быстрая стабильная модель
+    "clean": MockBehavior(latency_ms=200, latency_dist="lognormal", sigma=0.3, seed=1),
+    # Бесплатная модель: медленно, хвосты, 429/5xx, обрывы и пустой content
+    "flaky": MockBehavior(
+        latency_ms=600,
+        latency_dist="lognormal",
+        sigma=0.8,
+        p429=0.05,
+        retry_after_sec=0.5,
+        p5xx=0.02,
+        p_length=0.1,
+        p_reasoning_only=0.05,
+        seed=2,
+    ),
+    # Потоковые ответы с конечной скоростью генерации
+    "stream": MockBehavior(latency_ms=150, latency_dist="uniform", jitter_ms=50, stream_tokens_per_sec=400, seed=3),
+}
+
+_WORDS = (
+    "договор сторона исполнитель заказчик оплата срок поставка товар услуга акт претензия "
+    "неустойка ответственность расторжение уведомление реквизиты счёт сумма рубль период "
+    "обязательство гарантия качество приёмка работа этап график штраф просрочка порядок"
+).split()
+_WORDS_LATIN = (
+    "agreement party contractor customer payment term delivery goods service act claim "
+    "penalty liability termination notice details invoice amount period obligation warranty"
+).split()
+
+
+def _paragraphs(rnd: random.Random, n: int, words: Sequence[str]) -> List[str]:
+    out = []
+    for _ in range(n):
+        sentences = []
+        for _ in range(rnd.randint(3, 7)):
+            s = " ".join(rnd.choice(words) for _ in range(rnd.randint(8, 18)))
+            sentences.append(s.capitalize() + ".")
+        out.append(" ".join(sentences))
+    return out
+
+
+def _write_pdf(path: Path, pages: List[List[str]]) -> None:
+    """Минимальный PDF с текстовым слоем (Helvetica, латиница) — без сторонних библиотек."""
+    objects: List[bytes] = []
+
+    def _obj(body: str | bytes) -> int:
+        objects.append(body.encode("latin-1") if isinstance(body, str) else body)
+        return len(objects)
+
+    font = _obj("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objects) + 1 + 2 * len(pages) + 1  # зарезервируем номер заранее
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "14 TL", "40 800 Td"]
+        for line in lines:
+            esc = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({esc}) '")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content = _obj(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+        kids.append(
+            _obj(
+                f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>"
+            )
+        )
+    catalog = _obj(f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+    kids_ref = " ".join(f"{k} 0 R" for k in kids)
+    if _obj(f"<< /Type /Pages /Kids [{kids_ref}] /Count {len(kids)} >>") != pages_id:
+        raise AssertionError("PDF: номер объекта /Pages рассчитан неверно")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines, cur = [], ""
+    for w in text.split():
+        if cur and len(cur) + 1 + len(w) > width:
+            lines.append(cur)
+            cur = w
+        else:
+            cur = f"{cur} {w}".strip()
+    if cur:
+        lines.append(cur)
+    return lines
+
+
+def make_corpus(root: Path, docs: int, kinds: Sequence[str], *, pdf_pages: int, seed: int) -> List[Path]:
+    rnd = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    paths: List[Path] = []
+
+    for i in range(docs):
+        kind = kinds[i % len(kinds)]
+        size = rnd.choice([4, 12, 40])  # абзацев: короткий / средний / длинный документ
+        p = root / f"doc_{i:04d}.{kind}"
+
+        if kind == "txt":
+            p.write_text("\n\n".join(_paragraphs(rnd, size, _WORDS)), encoding="utf-8")
+        elif kind == "docx":
+            from docx import Document
+
+            d = Document()
+            for para in _paragraphs(rnd, size, _WORDS):
+                d.add_paragraph(para)
+            d.save(str(p))
+        elif kind == "pdf":
+            lines = [ln for para in _paragraphs(rnd, max(size, pdf_pages * 4), _WORDS_LATIN) for ln in _wrap(para) + [""]]
+            per_page = max(1, -(-len(lines) // pdf_pages))
+            _write_pdf(p, [lines[j : j + per_page] for j in range(0, len(lines), per_page)])
+        elif kind == "png":
+            from PIL import Image, ImageDraw
+
+            img = Image.new("L", (1240, 1754), 255)
+            draw = ImageDraw.Draw(img)
+            y = 60
+            for para in _paragraphs(rnd, 6, _WORDS_LATIN):
+                for ln in _wrap(para, 80):
+                    draw.text((60, y), ln, fill=0)
+                    y += 22
+                y += 22
+            img.save(str(p), dpi=(150, 150))
+        else:
+            raise ValueError(f"Неизвестный тип документа: {kind}")
+        paths.append(p)
+    return paths
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    # Метод ближайшего ранга: наименьшее значение, до которого (включительно) лежит q% выборки
+    s = sorted(values)
+    idx = max(0, min(len(s) - 1, math.ceil(q / 100.0 * len(s)) - 1))
+    return s[idx]
+
+
+def _settings_names() -> Set[str]:
+    """Переменные окружения, которые читает load_config (по исходнику config.py)."""
+    source = (ROOT / "config.py").read_text(encoding="utf-8")
+    return set(re.findall(r'(?:getenv|_env_bool)\(\s*"([A-Z0-9_]+)"', source))
+
+
+def _scenario_env(env: Dict[str, str]) -> None:
+    """
+    Окружение прогона — только настройки сценария: значения из .env и из окружения
+    оболочки (пул моделей, чанкинг, фильтры папки...) в замер не попадают.
+    """
+    import config  # noqa: F401  # .env читается при импорте — раньше, чем мы его очистим
+
+    for key in _settings_names():
+        os.environ.pop(key, None)
+    os.environ.update(env)
+
+
+def run_scenario(name: str, behavior: MockBehavior, corpus: Path, work: Path, env: Dict[str, str]) -> Dict[str, Any]:
+    srv = MockOpenRouter(behavior=behavior).start()
+    out_dir = work / f"out_{name}"
+    _scenario_env(
+        {
+            **env,
+            "OPENROUTER_API_KEY": "bench",
+            "OPENROUTER_BASE_URL": srv.base_url,
+            "OPENROUTER_MODEL": "mock/model",
+            "DOCS_DIR": str(corpus),
+            "OUTPUT_DIR": str(out_dir),
+            "LLM_CACHE": "0",
+            "EXTRACT_CACHE": "0",
+            "LLM_TRACE": "1",
+            "LLM_STREAM": "1" if behavior.stream_tokens_per_sec > 0 else env.get("LLM_STREAM", "0"),
+        }
+    )
+
+    from config import load_config
+    from src.llm.openrouter_client import OpenRouterClient
+    from src.pipeline import run_pipeline
+    from src.summarize.batch import make_doc_batcher
+    from src.summarize.summarize_folder import summarize_folder
+    from src.utils.files import walk_files
+    from src.utils.manifest import Manifest, run_fingerprint
+
+    cfg = load_config()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    llm = OpenRouterClient(cfg)
+    batcher = make_doc_batcher(cfg, llm)
+    # Тот же обход, что в main.py (фильтры, глубина, порядок)
+    items = list(
+        walk_files(
+            cfg.docs_dir,
+            include=cfg.docs_include,
+            exclude=cfg.docs_exclude,
+            max_depth=cfg.docs_max_depth,
+            workers=cfg.docs_walk_workers,
+            sort=cfg.docs_sort,
+        )
+    )
+    manifest = Manifest(out_dir / "manifest.json")  # пустой: обрабатываем всё
+
+    statuses: Dict[str, int] = {}
+    error = None
+    started = time.perf_counter()
+    try:
+        summaries: Dict[str, str] = {}
+        for res in run_pipeline(cfg, llm, items, manifest, run_fingerprint(cfg), batcher=batcher):
+            summaries[res.key] = res.summary
+            statuses[res.meta.get("status", "?")] = statuses.get(res.meta.get("status", "?"), 0) + 1
+        summarize_folder(cfg, llm, summaries)
+    except Exception as e:  # прогон мог упасть на исчерпании повторов — это тоже результат
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    llm.telemetry.close()
+    srv.stop()
+
+    trace = out_dir / "llm_trace.jsonl"
+    records = [json.loads(line) for line in trace.read_text(encoding="utf-8").splitlines()] if trace.exists() else []
+    latencies = [r["latency_sec"] for r in records if not r.get("cached")]
+    total = llm.telemetry.summary()["total"]
+    n = len(items)
+
+    return {
+        "scenario": name,
+        "docs": n,
+        "elapsed_sec": round(elapsed, 3),
+        "docs_per_min": round(n / elapsed * 60.0, 2) if elapsed > 0 else 0.0,
+        "llm_calls": total["calls"],
+        "llm_calls_per_doc": round(total["calls"] / n, 2) if n else 0.0,
+        "latency_p50_sec": round(_percentile(latencies, 50), 3),
+        "latency_p99_sec": round(_percentile(latencies, 99), 3),
+        "retries": total["retries"],
+        "throttled": total["throttled"],
+        "length_retries": total["length_retries"],
+        "failed_calls": total["failed_calls"],
+        "statuses": statuses,
+        "server": srv.stats.snapshot(),
+        "error": error,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Регрессии относительно эталона: пропускная способность ниже, вызовов больше, p99 выше."""
+    problems = []
+    base = {r["scenario"]: r for r in baseline.get("results", [])}
+    for r in results:
+        b = base.get(r["scenario"])
+        if b is None:
+            continue
+        if r["docs_per_min"] < b["docs_per_min"] * (1 - tolerance):
+            problems.append(f"{r['scenario']}: docs/min {r['docs_per_min']} < {b['docs_per_min']} (-{tolerance:.0%})")
+        if r["llm_calls_per_doc"] > b["llm_calls_per_doc"] * (1 + tolerance):
+            problems.append(
+                f"{r['scenario']}: calls/doc {r['llm_calls_per_doc']} > {b['llm_calls_per_doc']} (+{tolerance:.0%})"
+            )
+        if r["latency_p99_sec"] > b["latency_p99_sec"] * (1 + tolerance) + 0.05:
+            problems.append(f"{r['scenario']}: p99 {r['latency_p99_sec']}s > {b['latency_p99_sec']}s")
+        if r["error"] and not b.get("error"):
+            problems.append(f"{r['scenario']}: прогон упал: {r['error']}")
+    return problems
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Бенчмарк конвейера против mock OpenRouter")
+    ap.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="по умолчанию все")
+    ap.add_argument("--docs", type=int, default=24)
+    default_kinds = "txt,docx,pdf" + (",png" if shutil.which("tesseract") else "")
+    ap.add_argument("--kinds", default=default_kinds, help=f"типы документов (по умолчанию {default_kinds})")
+    ap.add_argument("--pdf-pages", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--llm-concurrency", type=int, default=4)
+    ap.add_argument("--loader-workers", type=int, default=None)
+    ap.add_argument("--batch-budget", type=int, default=0, help="BATCH_TOKEN_BUDGET (0 — без пакетов)")
+    ap.add_argument("--save", type=Path, help="сохранить результаты в JSON (эталон)")
+    ap.add_argument("--baseline", type=Path, help="сравнить с эталоном; при регрессии код возврата 1")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    ap.add_argument("--keep", action="store_true", help="не удалять временную папку")
+    args = ap.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="bench_"))
+    corpus = work / "docs"
+    kinds = [k.strip().lower() for k in args.kinds.split(",") if k.strip()]
+    make_corpus(corpus, args.docs, kinds, pdf_pages=args.pdf_pages, seed=args.seed)
+
+    env = {"LLM_CONCURRENCY": str(args.llm_concurrency), "LLM_RPM": "0", "LLM_TPM": "0"}
+    if args.loader_workers is not None:
+        env["LOADER_WORKERS"] = str(args.loader_workers)
+    if args.batch_budget:
+        env["BATCH_TOKEN_BUDGET"] = str(args.batch_budget)
+
+    results = []
+    try:
+        for name in args.scenario or sorted(SCENARIOS):
+            r = run_scenario(name, SCENARIOS[name], corpus, work, env)
+            results.append(r)
+            print(
+                f"{name:>8}: {r['docs']} docs in {r['elapsed_sec']:.1f}s | {r['docs_per_min']:.1f} docs/min "
+                f"| {r['llm_calls_per_doc']:.2f} calls/doc | p50 {r['latency_p50_sec']:.3f}s "
+                f"p99 {r['latency_p99_sec']:.3f}s | retries {r['retries']} 429 {r['throttled']} "
+                f"length {r['length_retries']}" + (f" | ERROR {r['error']}" if r["error"] else "")
+            )
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+        else:
+            print("Work dir:", work)
+
+    report = {"kinds": kinds, "docs": args.docs, "seed": args.seed, "results": results}
+    if args.save:
+        args.save.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print("Saved:", args.save)
+
+    if args.baseline:
+        problems = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if problems:
+            print("\nREGRESSIONS:")
+            for p in problems:
+                print(" -", p)
+            sys.exit(1)
+        print("\nNo regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
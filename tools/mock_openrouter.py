@@ -0,0 +1,347 @@
+"""
+Локальная замена OpenRouter для замеров производительности без расхода лимитов.
+
+Понимает:
+  GET  /api/v1/models
+  POST /api/v1/chat/completions   (обычный ответ и stream=true — SSE)
+
+Умеет изображать поведение реальных моделей:
+  - задержка: fixed | uniform | lognormal (+ «скорость генерации» для потока)
+  - 429 с Retry-After и 5xx с заданной вероятностью
+  - обрыв по длине (finish_reason="length") — продолжение уже не обрывается
+  - пустой content при finish_reason="length", всё ушло в reasoning
+    (только при маленьком max_tokens — повтор клиента с большим лимитом проходит)
+  - недоступные модели (down_models) — 503 на каждый запрос
+  - модели в лимите (throttled_models) — 429 с Retry-After на каждый запрос
+  - пакетный запрос (разделы "=== ДОКУМЕНТ n ===") — сводка на каждый раздел
+
+Запуск:
+  python tools/mock_openrouter.py --port 8089 --latency-ms 800 --p429 0.05
+  OPENROUTER_BASE_URL=http://127.0.0.1:8089/api/v1 python main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+SUMMARY_MD = """\
+# Сводка документа
+
+## Темы
+- Договорные отношения сторон.
+
+## Ключевые пункты
+- Предмет договора, порядок оплаты и ответственность сторон.
+
+## Даты
+- не найдено
+
+## Суммы
+- не найдено
+
+## Риски / спорные места
+- Формулировки об ответственности требуют проверки.
+
+## Что нужно уточнить у клиента
+- Актуальную редакцию документа.
+"""
+
+
+@dataclass
+class MockBehavior:
+    latency_ms: float = 300.0
+    # fixed | uniform (±jitter) | lognormal (медиана latency_ms, разброс sigma)
+    latency_dist: str = "lognormal"
+    jitter_ms: float = 100.0
+    sigma: float = 0.5
+    # Скорость «генерации» в потоковом режиме, токенов в секунду (0 — мгновенно)
+    stream_tokens_per_sec: float = 0.0
+    p429: float = 0.0
+    retry_after_sec: float = 1.0
+    p5xx: float = 0.0
+    p_length: float = 0.0
+    p_reasoning_only: float = 0.0
+    # reasoning-only только для запросов с max_tokens не больше этого
+    reasoning_max_tokens: int = 2200
+    # Модели, которые «лежат»: на любой запрос к ним — 503
+    down_models: Tuple[str, ...] = ()
+    # Модели, упёршиеся в лимит: на любой запрос к ним — 429 с Retry-After
+    throttled_models: Tuple[str, ...] = ()
+    seed: Optional[int] = None
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.by_kind: Dict[str, int] = {}
+
+    def add(self, kind: str) -> None:
+        with self.lock:
+            self.requests += 1
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"requests": self.requests, "by_kind": dict(self.by_kind)}
+
+
+_BATCH_MARKER_RE = re.compile(r"^=== ДОКУМЕНТ (\d+) ===$", re.MULTILINE)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 3)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockOpenRouter"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # тишина в консоли
+        pass
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"data": [{"id": m, "context_length": 32768} for m in self.server.models]})
+            return
+        self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+            return
+        try:
+            payload = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            self._send_json(400, {"error": {"code": 400, "message": "bad json"}})
+            return
+
+        b = self.server.behavior
+        rnd = self.server.rng()
+        time.sleep(self.server.latency_sec(rnd))
+
+        if payload.get("model") in b.down_models:
+            self.server.stats.add("down")
+            self._send_json(503, {"error": {"code": 503, "message": "Model is unavailable (mock)"}})
+            return
+        if payload.get("model") in b.throttled_models or rnd.random() < b.p429:
+            self.server.stats.add("429")
+            self._send_json(
+                429,
+                {"error": {"code": 429, "message": "Rate limit exceeded (mock)"}},
+                {"Retry-After": f"{b.retry_after_sec:g}"},
+            )
+            return
+        if rnd.random() < b.p5xx:
+            self.server.stats.add("5xx")
+            self._send_json(502, {"error": {"code": 502, "message": "Upstream error (mock)"}})
+            return
+
+        messages: List[Dict[str, str]] = payload.get("messages") or []
+        max_tokens = payload.get("max_tokens")
+        prompt_tokens = sum(_tokens(m.get("content") or "") for m in messages)
+        is_continuation = any(m.get("role") == "assistant" for m in messages)
+
+        content, reasoning, finish = SUMMARY_MD, None, "stop"
+        kind = "ok"
+        last_user = messages[-1].get("content") or "" if messages else ""
+        batch_docs = sorted({int(n) for n in _BATCH_MARKER_RE.findall(last_user)})
+        if is_continuation:
+            content, kind = "- (продолжение) Остальные пункты не найдены.\n", "continuation"
+        elif batch_docs:
+            content = "\n".join(f"=== ДОКУМЕНТ {n} ===\n{SUMMARY_MD}" for n in batch_docs)
+            kind = "batch"
+        elif (
+            max_tokens is not None
+            and max_tokens <= b.reasoning_max_tokens
+            and rnd.random() < b.p_reasoning_only
+        ):
+            content, reasoning, finish, kind = "", "Размышляю над документом... " * 20, "length", "reasoning_only"
+        elif rnd.random() < b.p_length:
+            content, finish, kind = SUMMARY_MD[: len(SUMMARY_MD) // 2], "length", "length"
+        self.server.stats.add(kind)
+
+        completion_tokens = _tokens(content) + (_tokens(reasoning) if reasoning else 0)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        model = payload.get("model") or "mock/model"
+
+        if payload.get("stream"):
+            self._stream(model, content, reasoning, finish, usage)
+            return
+
+        self._send_json(
+            200,
+            {
+                "id": f"gen-mock-{self.server.stats.requests}",
+                "model": model,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content, "reasoning": reasoning},
+                        "finish_reason": finish,
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(
+        self,
+        model: str,
+        content: str,
+        reasoning: Optional[str],
+        finish: str,
+        usage: Dict[str, int],
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        tps = self.server.behavior.stream_tokens_per_sec
+
+        def _event(data: Any) -> None:
+            body = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+            self.wfile.write(f"data: {body}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        pieces: List[Dict[str, str]] = []
+        if reasoning:
+            pieces += [{"reasoning": p} for p in reasoning.split(" ") if p]
+        pieces += [{"content": line + "\n"} for line in content.splitlines()]
+
+        for delta in pieces:
+            if tps > 0:
+                time.sleep(_tokens(next(iter(delta.values()))) / tps)
+            _event({"model": model, "choices": [{"index": 0, "delta": delta}]})
+        _event({"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}], "usage": usage})
+        _event("[DONE]")
+
+
+class MockOpenRouter(ThreadingHTTPServer):
+    """Сервер-заглушка; можно поднять в фоне из бенчмарка: srv.start() ... srv.stop()."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        behavior: Optional[MockBehavior] = None,
+        models: Optional[List[str]] = None,
+    ) -> None:
+        super().__init__((host, port), _Handler)
+        self.behavior = behavior or MockBehavior()
+        self.models = models or ["mock/model", "mock/model:free"]
+        self.stats = _Stats()
+        self._seed_lock = threading.Lock()
+        self._seed_rng = random.Random(self.behavior.seed)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def rng(self) -> random.Random:
+        # У каждого запроса свой генератор: сценарий воспроизводим при заданном seed
+        with self._seed_lock:
+            return random.Random(self._seed_rng.random())
+
+    def latency_sec(self, rnd: random.Random) -> float:
+        b = self.behavior
+        if b.latency_dist == "fixed":
+            ms = b.latency_ms
+        elif b.latency_dist == "uniform":
+            ms = rnd.uniform(b.latency_ms - b.jitter_ms, b.latency_ms + b.jitter_ms)
+        else:
+            ms = b.latency_ms * math.exp(rnd.gauss(0.0, b.sigma))
+        return max(0.0, ms) / 1000.0
+
+    def start(self) -> "MockOpenRouter":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Локальный mock OpenRouter")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=300.0)
+    ap.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--sigma", type=float, default=0.5)
+    ap.add_argument("--stream-tps", type=float, default=0.0, help="токенов/с в потоковом режиме")
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    ap.add_argument("--p5xx", type=float, default=0.0)
+    ap.add_argument("--p-length", type=float, default=0.0)
+    ap.add_argument("--p-reasoning", type=float, default=0.0)
+    ap.add_argument("--down-model", action="append", default=[], help="модель, отвечающая 503")
+    ap.add_argument("--throttled-model", action="append", default=[], help="модель, отвечающая 429")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    behavior = MockBehavior(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        jitter_ms=args.jitter_ms,
+        sigma=args.sigma,
+        stream_tokens_per_sec=args.stream_tps,
+        p429=args.p429,
+        retry_after_sec=args.retry_after,
+        p5xx=args.p5xx,
+        p_length=args.p_length,
+        p_reasoning_only=args.p_reasoning,
+        down_models=tuple(args.down_model),
+        throttled_models=tuple(args.throttled_model),
+        seed=args.seed,
+    )
+    srv = MockOpenRouter(args.host, args.port, behavior)
+    print(f"Mock OpenRouter: {srv.base_url}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stats:", json.dumps(srv.stats.snapshot(), ensure_ascii=False))
+        srv.server_close()
+
+
+if __name__ == "__main__":
+    main()